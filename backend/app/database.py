@@ -1,21 +1,108 @@
-from sqlalchemy import create_engine
+import asyncio
+from fastapi import Depends
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./mediaplayer.db")
 
-# Configurar engine com check_same_thread=False para SQLite
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False}
-    )
-else:
-    engine = create_engine(DATABASE_URL)
+# "sync": sessões síncronas (padrão); "async": engine assíncrono (aiosqlite),
+# o acesso ao banco deixa de bloquear o event loop
+DATABASE_MODE = os.getenv("DATABASE_MODE", "sync").lower()
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# Perfil do SQLite aplicado em cada conexão (ver apply_sqlite_pragmas)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # negativo = KiB
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY").upper()
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms
+# Intervalo do checkpoint periódico do WAL (segundos; 0 desativa)
+SQLITE_CHECKPOINT_INTERVAL = float(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "300"))
+
+# Pool de conexões (bancos em arquivo)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_TEMP_STORE = {"DEFAULT", "FILE", "MEMORY"}
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":"))
+
+def sqlite_pragmas() -> list:
+    """
+    Comandos PRAGMA do perfil configurado (valores validados)
+    """
+    pragmas = []
+    if SQLITE_JOURNAL_MODE in _JOURNAL_MODES:
+        pragmas.append(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    if SQLITE_SYNCHRONOUS in _SYNCHRONOUS:
+        pragmas.append(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    if SQLITE_TEMP_STORE in _TEMP_STORE:
+        pragmas.append(f"PRAGMA temp_store={SQLITE_TEMP_STORE}")
+    pragmas.append(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    pragmas.append(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    pragmas.append(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    return pragmas
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL: leituras do player não esperam os commits do admin; synchronous=NORMAL
+    faz fsync só nos checkpoints em vez de em cada commit
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+def _engine_options(url: str) -> dict:
+    """
+    Opções do engine: check_same_thread=False para SQLite e, em bancos em
+    arquivo, o pool configurado
+    """
+    if not url.startswith("sqlite"):
+        return {}
+    options = {"connect_args": {"check_same_thread": False}}
+    if not _is_sqlite_memory(url):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+def _uses_sqlite_profile(url: str) -> bool:
+    return url.startswith("sqlite") and not _is_sqlite_memory(url)
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if _uses_sqlite_profile(DATABASE_URL):
+    event.listen(engine, "connect", apply_sqlite_pragmas)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine síncrono equivalente a cada engine assíncrono (mesmo banco)
+_SYNC_BINDS = {}
+
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_MODE == "async":
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+    if _uses_sqlite_profile(ASYNC_DATABASE_URL):
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    _SYNC_BINDS[async_engine.sync_engine] = engine
+
 Base = declarative_base()
 
 def get_db():
@@ -25,6 +112,76 @@ def get_db():
     finally:
         db.close()
 
+def sync_bind(db: Session):
+    """
+    Engine síncrono do banco da sessão; dentro de DbSession.run no modo async
+    a sessão usa o engine assíncrono, e as tarefas de segundo plano (e o cache
+    da linha do tempo) precisam do engine síncrono do mesmo banco
+    """
+    bind = db.get_bind()
+    return _SYNC_BINDS.get(bind, bind)
+
+class DbSession:
+    """
+    Sessão entregue aos routers: `run` executa uma função síncrona
+    `fn(session, ...)` diretamente (modo sync) ou pelo AsyncSession.run_sync,
+    com o I/O do banco fora do event loop (modo async)
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args, **kwargs):
+        run_sync = getattr(self.session, "run_sync", None)
+        if run_sync is not None:
+            return await run_sync(fn, *args, **kwargs)
+        return fn(self.session, *args, **kwargs)
+
+    def sync_bind(self):
+        """
+        Engine síncrono do banco (para trabalho em threads, fora da sessão)
+        """
+        return sync_bind(getattr(self.session, "sync_session", self.session))
+
+def _get_sync_session(db: Session = Depends(get_db)):
+    yield DbSession(db)
+
+async def _get_async_session():
+    async with AsyncSessionLocal() as session:
+        yield DbSession(session)
+
+# Dependência dos routers, conforme DATABASE_MODE
+get_session = _get_async_session if DATABASE_MODE == "async" else _get_sync_session
+
+def checkpoint_wal(bind=None, mode: str = "PASSIVE"):
+    """
+    Copia o WAL para o banco; PASSIVE nunca espera leitores/escritores,
+    TRUNCATE (no encerramento) também zera o arquivo -wal.
+    Retorna (busy, páginas no log, páginas copiadas) ou None fora do WAL
+    """
+    bind = bind or engine
+    if bind.dialect.name != "sqlite" or mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        return None
+    with bind.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() != "wal":
+            return None
+        return tuple(conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one())
+
+async def run_wal_checkpoints(interval: float = SQLITE_CHECKPOINT_INTERVAL):
+    """
+    Laço de checkpoints periódicos (em uma thread, sem bloquear o event loop),
+    para o WAL não crescer enquanto há leitores constantes
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(checkpoint_wal)
+        except Exception as e:
+            print(f"Erro no checkpoint do WAL: {e}")
+
 def init_db():
     """Inicializa o banco de dados criando todas as tabelas"""
+    from .migrations import run_migrations
+
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
@@ -1,24 +1,70 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
 
-from .database import init_db
-from .routers import media, schedule, player
-
-# Carregar variáveis de ambiente
+# Carregar variáveis de ambiente (antes dos módulos que leem a configuração)
 load_dotenv()
 
+from .database import SQLITE_CHECKPOINT_INTERVAL, SessionLocal, checkpoint_wal, engine, init_db, run_wal_checkpoints
+from .routers import media, schedule, player
+from .services.derivatives import derivative_pipeline
+from .services.media_files import MediaFiles
+from .services.metrics import CONTENT_TYPE, METRICS_ENABLED, REGISTRY, MetricsMiddleware, instrument_sqlalchemy
+from .services.storage import disk_usage
+from .services.refresher import background_refresher, create_http_client
+from .services.weather import weather_service
+
 # Inicializar banco de dados
 init_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Tarefas de segundo plano na inicialização e no encerramento"""
+    # Retomar imagens cujas versões reduzidas não terminaram
+    db = SessionLocal()
+    try:
+        derivative_pipeline.resume(db)
+        # Cria o contador de espaço em disco (só percorre o UPLOAD_DIR se ainda não existe)
+        disk_usage.get(db)
+    finally:
+        db.close()
+    
+    # Checkpoints periódicos do WAL do SQLite
+    checkpoints = None
+    if SQLITE_CHECKPOINT_INTERVAL > 0:
+        checkpoints = asyncio.create_task(run_wal_checkpoints(SQLITE_CHECKPOINT_INTERVAL))
+    
+    # Cliente HTTP único (pool de conexões) e clima atualizado antes de vencer
+    http_client = create_http_client()
+    weather_service.client = http_client
+    if weather_service.enabled:
+        background_refresher.add("clima", lambda: weather_service.refresh(engine), weather_service.update_interval)
+    background_refresher.start()
+    
+    yield
+    
+    await background_refresher.stop()
+    weather_service.client = None
+    await http_client.aclose()
+    if checkpoints is not None:
+        checkpoints.cancel()
+    derivative_pipeline.shutdown()
+    try:
+        checkpoint_wal(mode="TRUNCATE")
+    except Exception as e:
+        print(f"Erro no checkpoint do WAL: {e}")
+
 # Criar app FastAPI
 app = FastAPI(
     title="Media Player API",
     description="API para gerenciamento de media player digital signage",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -28,8 +74,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Métricas (latência por rota, consultas SQL por requisição) expostas em /metrics
+if METRICS_ENABLED:
+    instrument_sqlalchemy()
+    app.add_middleware(MetricsMiddleware)
+
 # Incluir routers
 app.include_router(media.router)
 app.include_router(schedule.router)
@@ -39,6 +91,8 @@ app.include_router(player.router)
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Entrega para os players: Range, cache imutável e ETag pelo hash (URLs em "url" do conteúdo ativo)
+app.mount("/media", MediaFiles(directory=UPLOAD_DIR), name="media")
 
 # Servir frontend (após build)
 DIST_DIR = "../frontend/dist"
@@ -68,6 +122,12 @@ async def health_check():
         "service": "mediaplayer-backend"
     }
 
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Métricas no formato de texto do Prometheus"""
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     
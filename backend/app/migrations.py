@@ -0,0 +1,133 @@
+"""
+Migrações idempotentes aplicadas na inicialização
+
+O projeto cria as tabelas com Base.metadata.create_all, que não altera
+tabelas já existentes. As funções abaixo ajustam bancos antigos no lugar e
+podem ser executadas a cada inicialização sem efeito colateral.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .models import TODOS_OS_DIAS, Media, Schedule, WeatherCache, parse_dias_semana
+
+
+def _columns(conn, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _add_columns(conn, table: str, columns: dict):
+    """
+    Adiciona as colunas que ainda não existem ({nome: definição SQL});
+    tabelas inexistentes são criadas completas pelo create_all
+    """
+    if not inspect(conn).has_table(table):
+        return
+    existing = _columns(conn, table)
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+
+
+def migrate_schedule_dias_mask(conn):
+    """
+    Converte a coluna texto dias_semana ("0,1,2") na máscara de bits dias_mask
+    """
+    if not inspect(conn).has_table("schedule"):
+        return
+    columns = _columns(conn, "schedule")
+    if "dias_mask" in columns:
+        return
+
+    conn.execute(text(
+        f"ALTER TABLE schedule ADD COLUMN dias_mask INTEGER NOT NULL DEFAULT {TODOS_OS_DIAS}"
+    ))
+    if "dias_semana" not in columns:
+        return
+
+    rows = conn.execute(text("SELECT id, dias_semana FROM schedule")).all()
+    updates = []
+    for schedule_id, dias_semana in rows:
+        try:
+            mask = parse_dias_semana(dias_semana) if dias_semana else TODOS_OS_DIAS
+        except ValueError:
+            print(f"Agendamento {schedule_id}: dias_semana inválido ({dias_semana!r}), usando todos os dias")
+            mask = TODOS_OS_DIAS
+        updates.append({"id": schedule_id, "mask": mask})
+    if updates:
+        conn.execute(text("UPDATE schedule SET dias_mask = :mask WHERE id = :id"), updates)
+
+
+def migrate_media_file_info(conn):
+    """
+    Colunas de hash e tamanho dos arquivos enviados
+    """
+    _add_columns(conn, "media", {
+        "sha256": "VARCHAR(64)",
+        "tamanho": "INTEGER",
+    })
+
+
+def migrate_media_derivatives(conn):
+    """
+    Colunas das versões reduzidas das imagens
+    """
+    _add_columns(conn, "media", {
+        "derivados": "JSON",
+        "derivados_status": "VARCHAR(20)",
+    })
+
+
+def migrate_indexes(conn):
+    """
+    Índices declarados nos modelos que bancos antigos ainda não têm
+    (create_all não cria índices em tabelas existentes)
+    """
+    for model in (Media, Schedule):
+        table = model.__table__
+        if not inspect(conn).has_table(table.name):
+            continue
+        existing = _columns(conn, table.name)
+        for index in table.indexes:
+            if all(column.name in existing for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def migrate_weather_cache_latest(conn):
+    """
+    Mantém apenas a linha mais recente de cada cidade (antes cada atualização
+    inseria uma linha nova) e cria o índice único usado pelo upsert.
+    Retorna True quando removeu linhas, para o banco ser compactado (VACUUM)
+    """
+    if not inspect(conn).has_table("weather_cache"):
+        return False
+    removidas = conn.execute(text(
+        "DELETE FROM weather_cache WHERE id NOT IN ("
+        "SELECT (SELECT w.id FROM weather_cache w WHERE w.cidade = c.cidade "
+        "ORDER BY w.data_cache DESC, w.id DESC LIMIT 1) "
+        "FROM (SELECT DISTINCT cidade FROM weather_cache) c)"
+    )).rowcount
+    for index in WeatherCache.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    return removidas > 0
+
+
+MIGRATIONS = [
+    migrate_schedule_dias_mask,
+    migrate_media_file_info,
+    migrate_media_derivatives,
+    migrate_indexes,
+    migrate_weather_cache_latest,
+]
+
+
+def run_migrations(engine: Engine):
+    """
+    Aplica todas as migrações em uma única transação; se alguma removeu
+    dados em volume (retorna True), o arquivo do banco é compactado depois
+    """
+    with engine.begin() as conn:
+        compactar = [migration(conn) for migration in MIGRATIONS]
+    if any(compactar):
+        # VACUUM não pode rodar dentro de uma transação
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
@@ -1,8 +1,45 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, Date, Time, ForeignKey, JSON
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, Date, Time, ForeignKey, Index, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
+# Máscara com todos os dias da semana (bit 0=domingo ... bit 6=sábado)
+TODOS_OS_DIAS = 0x7F
+
+def parse_dias_semana(dias_semana: str) -> int:
+    """
+    Converte a string "0,1,2" na máscara de bits dos dias da semana
+    """
+    mask = 0
+    for dia in (dias_semana or "").split(","):
+        dia = int(dia)
+        if not 0 <= dia <= 6:
+            raise ValueError(f"Dia da semana inválido: {dia}")
+        mask |= 1 << dia
+    return mask
+
+def format_dias_semana(mask: int) -> str:
+    """
+    Converte a máscara de bits de volta na string "0,1,2"
+    """
+    return ",".join(str(dia) for dia in range(7) if mask & (1 << dia))
+
+def arquivo_para_regiao(tipo: str, caminho_arquivo, derivados, regiao: int):
+    """
+    Caminho (com barras /) a exibir na região: a versão reduzida, se pronta,
+    ou o original
+    """
+    if tipo == "texto" or not caminho_arquivo:
+        return None
+    caminho = (derivados or {}).get(str(regiao)) or caminho_arquivo
+    return caminho.replace("\\", "/")
+
+# Estado da geração das versões reduzidas de uma imagem (services/derivatives.py)
+DERIVADOS_PENDENTE = "pendente"
+DERIVADOS_PROCESSANDO = "processando"
+DERIVADOS_PRONTO = "pronto"
+DERIVADOS_ERRO = "erro"
+
 class Media(Base):
     __tablename__ = "media"
     
@@ -11,17 +48,25 @@ class Media(Base):
     caminho_arquivo = Column(String(500), nullable=True)
     texto = Column(Text, nullable=True)
     nome = Column(String(255), nullable=False)
-    ativo = Column(Boolean, default=True)
-    criado_em = Column(DateTime, default=datetime.utcnow)
+    sha256 = Column(String(64), nullable=True)  # hash do arquivo enviado
+    tamanho = Column(Integer, nullable=True)  # em bytes
+    derivados = Column(JSON, nullable=True)  # {"regiao": caminho da versão reduzida}
+    derivados_status = Column(String(20), nullable=True)  # pendente, processando, pronto, erro
+    ativo = Column(Boolean, default=True, index=True)  # o índice também cobre o id (rowid)
+    criado_em = Column(DateTime, default=datetime.utcnow, index=True)  # listagem paginada (criado_em, id)
     
     # Relacionamento
     schedules = relationship("Schedule", back_populates="media", cascade="all, delete-orphan")
+    
+    def arquivo_para_regiao(self, regiao: int):
+        """Caminho (com barras /) a exibir na região: a versão reduzida, se pronta, ou o original"""
+        return arquivo_para_regiao(self.tipo, self.caminho_arquivo, self.derivados, regiao)
 
 class Schedule(Base):
     __tablename__ = "schedule"
     
     id = Column(Integer, primary_key=True, index=True)
-    media_id = Column(Integer, ForeignKey("media.id"), nullable=False)
+    media_id = Column(Integer, ForeignKey("media.id"), nullable=False, index=True)
     
     # Datas e horários
     data_inicio = Column(Date, nullable=False)
@@ -31,7 +76,7 @@ class Schedule(Base):
     
     # Configurações
     duracao = Column(Integer, default=10)  # em segundos (para imagens/textos)
-    dias_semana = Column(String(50), default="0,1,2,3,4,5,6")  # 0=domingo, 6=sábado
+    dias_mask = Column(Integer, nullable=False, default=TODOS_OS_DIAS)  # bit 0=domingo, bit 6=sábado
     prioridade = Column(Integer, default=1)
     regiao = Column(Integer, nullable=False)  # 1=video, 2=imagem, 3=clima, 4=texto
     
@@ -40,6 +85,49 @@ class Schedule(Base):
     
     # Relacionamento
     media = relationship("Media", back_populates="schedules")
+    
+    # Índice da consulta do conteúdo ativo (SchedulerService._get_content_for_regions):
+    # igualdade em regiao/ativo, faixa em data_fim (descarta o histórico de
+    # agendamentos encerrados) e as demais colunas do filtro, avaliadas no
+    # próprio índice antes de ler a linha da tabela
+    __table_args__ = (
+        Index(
+            "ix_schedule_regiao_ativo_periodo",
+            "regiao", "ativo", "data_fim", "data_inicio", "hora_inicio", "hora_fim",
+            "dias_mask", "prioridade", "media_id"
+        ),
+        # Listagem paginada do admin (data_inicio, hora_inicio, id)
+        Index("ix_schedule_data_hora_inicio", "data_inicio", "hora_inicio"),
+    )
+    
+    @property
+    def dias_semana(self) -> str:
+        """Dias da semana no formato da API ("0,1,2,3,4,5,6")"""
+        mask = self.dias_mask if self.dias_mask is not None else TODOS_OS_DIAS
+        return format_dias_semana(mask)
+    
+    @dias_semana.setter
+    def dias_semana(self, value: str):
+        self.dias_mask = parse_dias_semana(value)
+
+class MediaBlob(Base):
+    """Arquivo armazenado por conteúdo (UPLOAD_DIR/objects/<hash>), compartilhado entre mídias"""
+    __tablename__ = "media_blob"
+    
+    sha256 = Column(String(64), primary_key=True)
+    caminho = Column(String(500), nullable=False)
+    tamanho = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # mídias que usam o arquivo
+    criado_em = Column(DateTime, default=datetime.utcnow)
+
+class StorageUsage(Base):
+    """Espaço ocupado no UPLOAD_DIR, atualizado a cada arquivo gravado ou removido"""
+    __tablename__ = "storage_usage"
+    
+    id = Column(Integer, primary_key=True)  # linha única (id=1)
+    bytes_usados = Column(Integer, nullable=False, default=0)
+    arquivos = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
 
 class WeatherCache(Base):
     __tablename__ = "weather_cache"
@@ -51,3 +139,8 @@ class WeatherCache(Base):
     icone = Column(String(10))
     data_cache = Column(DateTime, default=datetime.utcnow)
     dados_completos = Column(JSON)
+    
+    # Uma linha por cidade, sobrescrita a cada atualização (WeatherService._save_to_cache)
+    __table_args__ = (
+        Index("ux_weather_cache_cidade", "cidade", unique=True),
+    )
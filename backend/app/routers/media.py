@@ -1,36 +1,51 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import String, cast, func, literal, select, union_all
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
-import shutil
-from datetime import datetime
-from ..database import get_db
-from ..models import Media, Schedule
+from ..database import DbSession, get_session
+from ..models import DERIVADOS_PENDENTE, Media, Schedule, StorageUsage
+from ..services.derivatives import derivative_pipeline
+from ..services.pagination import paginate
+from ..services.scheduler import SchedulerService
+from ..services.storage import (
+    UPLOAD_DIR, InvalidUpload, StoredFile, UploadTooLarge, blob_store, disk_usage
+)
 
 router = APIRouter(prefix="/api/media", tags=["media"])
 
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Tipos de arquivo permitidos
 ALLOWED_VIDEO = {".mp4", ".webm", ".avi", ".mov"}
 ALLOWED_IMAGE = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 
-@router.get("/")
-async def list_media(
-    tipo: Optional[str] = None,
-    ativo: Optional[bool] = None,
-    db: Session = Depends(get_db)
+def _list_media(
+    db: Session,
+    tipo: Optional[str],
+    ativo: Optional[bool],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
 ):
-    """Lista todas as mídias com filtros opcionais"""
-    query = db.query(Media)
+    # Contagem de agendamentos na mesma consulta (subconsulta pelo índice de media_id)
+    schedules_count = select(func.count(Schedule.id)).where(
+        Schedule.media_id == Media.id
+    ).correlate(Media).scalar_subquery()
+    query = db.query(Media, schedules_count)
     
     if tipo:
         query = query.filter(Media.tipo == tipo)
     if ativo is not None:
         query = query.filter(Media.ativo == ativo)
     
-    medias = query.order_by(Media.criado_em.desc()).all()
+    try:
+        rows, next_cursor = paginate(
+            query, (Media.criado_em, Media.id), limit, cursor,
+            key=lambda row: (row[0].criado_em, row[0].id)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return [
         {
@@ -41,14 +56,30 @@ async def list_media(
             "texto": m.texto,
             "ativo": m.ativo,
             "criado_em": m.criado_em.isoformat(),
-            "schedules_count": len(m.schedules)
+            "schedules_count": count
         }
-        for m in medias
-    ]
+        for m, count in rows
+    ], next_cursor
 
-@router.get("/{media_id}")
-async def get_media(media_id: int, db: Session = Depends(get_db)):
-    """Obtém detalhes de uma mídia específica"""
+@router.get("/")
+async def list_media(
+    response: Response,
+    tipo: Optional[str] = None,
+    ativo: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: DbSession = Depends(get_session)
+):
+    """
+    Lista as mídias (mais recentes primeiro) com filtros opcionais; com
+    `limit`, a resposta traz o cursor da próxima página em X-Next-Cursor
+    """
+    medias, next_cursor = await db.run(_list_media, tipo, ativo, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return medias
+
+def _get_media(db: Session, media_id: int):
     media = db.query(Media).filter(Media.id == media_id).first()
     if not media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
@@ -59,6 +90,7 @@ async def get_media(media_id: int, db: Session = Depends(get_db)):
         "nome": media.nome,
         "caminho_arquivo": media.caminho_arquivo,
         "texto": media.texto,
+        "derivados_status": media.derivados_status,
         "ativo": media.ativo,
         "criado_em": media.criado_em.isoformat(),
         "schedules": [
@@ -77,70 +109,139 @@ async def get_media(media_id: int, db: Session = Depends(get_db)):
         ]
     }
 
-@router.post("/upload")
-async def upload_media(
-    file: UploadFile = File(...),
-    tipo: str = Form(...),
-    nome: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
-):
-    """Upload de arquivo de vídeo ou imagem"""
-    
-    if tipo not in ["video", "imagem"]:
-        raise HTTPException(status_code=400, detail="Tipo deve ser 'video' ou 'imagem'")
-    
-    # Validar extensão
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if tipo == "video" and file_ext not in ALLOWED_VIDEO:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Formato não permitido. Use: {', '.join(ALLOWED_VIDEO)}"
-        )
-    if tipo == "imagem" and file_ext not in ALLOWED_IMAGE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Formato não permitido. Use: {', '.join(ALLOWED_IMAGE)}"
-        )
-    
-    # Gerar nome único
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_filename = f"{timestamp}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, safe_filename)
+@router.get("/{media_id}")
+async def get_media(media_id: int, db: DbSession = Depends(get_session)):
+    """Obtém detalhes de uma mídia específica"""
+    return await db.run(_get_media, media_id)
+
+def _get_media_derivatives(db: Session, media_id: int):
+    media = db.query(Media).filter(Media.id == media_id).first()
+    if not media:
+        raise HTTPException(status_code=404, detail="Mídia não encontrada")
     
-    # Salvar arquivo
+    return {
+        "media_id": media.id,
+        "status": media.derivados_status,
+        "derivados": media.derivados or {}
+    }
+
+@router.get("/{media_id}/derivatives")
+async def get_media_derivatives(media_id: int, db: DbSession = Depends(get_session)):
+    """Estado das versões reduzidas de uma imagem, por região"""
+    return await db.run(_get_media_derivatives, media_id)
+
+def _create_uploaded_media(
+    db: Session,
+    stored: StoredFile,
+    file_ext: str,
+    tipo: str,
+    nome: str
+):
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        blob = blob_store.register(db, stored, file_ext)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
     
     # Criar registro no banco
     media = Media(
         tipo=tipo,
-        nome=nome or file.filename,
-        caminho_arquivo=file_path,
+        nome=nome,
+        caminho_arquivo=blob.caminho,
+        sha256=blob.sha256,
+        tamanho=blob.tamanho,
+        derivados_status=DERIVADOS_PENDENTE if tipo == "imagem" else None,
         ativo=True
     )
     db.add(media)
     db.commit()
     db.refresh(media)
     
+    # Versões reduzidas por região, geradas em segundo plano
+    if tipo == "imagem":
+        derivative_pipeline.submit(db, media)
+    
     return {
         "id": media.id,
         "tipo": media.tipo,
         "nome": media.nome,
         "caminho_arquivo": media.caminho_arquivo,
+        "sha256": media.sha256,
+        "tamanho": media.tamanho,
+        "derivados_status": media.derivados_status,
         "message": "Upload realizado com sucesso"
     }
 
-@router.post("/text")
-async def create_text_media(
-    nome: str = Form(...),
-    texto: str = Form(...),
-    db: Session = Depends(get_db)
-):
-    """Cria uma mídia de texto"""
+def _upload_ext(tipo: Optional[str], filename: str) -> str:
+    """Valida o tipo e a extensão do arquivo enviado; retorna a extensão"""
+    if tipo not in ["video", "imagem"]:
+        raise HTTPException(status_code=400, detail="Tipo deve ser 'video' ou 'imagem'")
+    
+    file_ext = os.path.splitext(filename)[1].lower()
+    if tipo == "video" and file_ext not in ALLOWED_VIDEO:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Formato não permitido. Use: {', '.join(ALLOWED_VIDEO)}"
+        )
+    if tipo == "imagem" and file_ext not in ALLOWED_IMAGE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato não permitido. Use: {', '.join(ALLOWED_IMAGE)}"
+        )
+    return file_ext
+
+# O corpo é lido pelo próprio endpoint (sem File/Form), então o formulário é descrito aqui
+UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file", "tipo"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "tipo": {"type": "string", "enum": ["video", "imagem"]},
+                        "nome": {"type": "string"}
+                    }
+                }
+            }
+        }
+    }
+}
+
+@router.post("/upload", openapi_extra=UPLOAD_FORM)
+async def upload_media(request: Request, db: DbSession = Depends(get_session)):
+    """
+    Upload de arquivo de vídeo ou imagem (multipart: file, tipo e nome)
     
+    O arquivo é lido do stream da requisição e gravado em blocos direto em
+    objects/incoming; depois é guardado pelo conteúdo (repetidos não são
+    gravados de novo)
+    """
+    try:
+        recebido = await blob_store.receive(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
+    
+    stored = recebido.arquivo
+    try:
+        file_ext = _upload_ext(recebido.campos.get("tipo"), recebido.nome_arquivo)
+        tipo = recebido.campos["tipo"]
+        nome = recebido.campos.get("nome") or recebido.nome_arquivo
+        return await db.run(_create_uploaded_media, stored, file_ext, tipo, nome)
+    finally:
+        # Temporário que não chegou a ser registrado (upload recusado ou erro)
+        blob_store.discard(stored)
+
+def _create_text_media(
+    db: Session,
+    nome: str,
+    texto: str
+):
     if not texto or len(texto) < 3:
         raise HTTPException(status_code=400, detail="Texto muito curto")
     
@@ -162,14 +263,20 @@ async def create_text_media(
         "message": "Texto criado com sucesso"
     }
 
-@router.post("/youtube")
-async def create_youtube_media(
+@router.post("/text")
+async def create_text_media(
     nome: str = Form(...),
-    url: str = Form(...),
-    db: Session = Depends(get_db)
+    texto: str = Form(...),
+    db: DbSession = Depends(get_session)
+):
+    """Cria uma mídia de texto"""
+    return await db.run(_create_text_media, nome, texto)
+
+def _create_youtube_media(
+    db: Session,
+    nome: str,
+    url: str
 ):
-    """Cria uma mídia de vídeo do YouTube"""
-    
     if not url or ("youtube.com" not in url and "youtu.be" not in url):
         raise HTTPException(status_code=400, detail="Link do YouTube inválido")
     
@@ -191,14 +298,20 @@ async def create_youtube_media(
         "message": "Link do YouTube cadastrado com sucesso"
     }
 
-@router.post("/link")
-async def create_link_media(
+@router.post("/youtube")
+async def create_youtube_media(
     nome: str = Form(...),
     url: str = Form(...),
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_session)
+):
+    """Cria uma mídia de vídeo do YouTube"""
+    return await db.run(_create_youtube_media, nome, url)
+
+def _create_link_media(
+    db: Session,
+    nome: str,
+    url: str
 ):
-    """Cria uma mídia de link genérico (Instagram, TikTok, etc.)"""
-    
     if not url:
         raise HTTPException(status_code=400, detail="URL é obrigatória")
     
@@ -220,15 +333,22 @@ async def create_link_media(
         "message": "Link cadastrado com sucesso"
     }
 
-@router.put("/{media_id}")
-async def update_media(
+@router.post("/link")
+async def create_link_media(
+    nome: str = Form(...),
+    url: str = Form(...),
+    db: DbSession = Depends(get_session)
+):
+    """Cria uma mídia de link genérico (Instagram, TikTok, etc.)"""
+    return await db.run(_create_link_media, nome, url)
+
+def _update_media(
+    db: Session,
     media_id: int,
-    nome: Optional[str] = Form(None),
-    texto: Optional[str] = Form(None),
-    ativo: Optional[bool] = Form(None),
-    db: Session = Depends(get_db)
+    nome: Optional[str],
+    texto: Optional[str],
+    ativo: Optional[bool]
 ):
-    """Atualiza uma mídia existente"""
     media = db.query(Media).filter(Media.id == media_id).first()
     if not media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
@@ -248,41 +368,106 @@ async def update_media(
         "message": "Mídia atualizada com sucesso"
     }
 
-@router.delete("/{media_id}")
-async def delete_media(media_id: int, db: Session = Depends(get_db)):
-    """Remove uma mídia e seus agendamentos"""
+@router.put("/{media_id}")
+async def update_media(
+    media_id: int,
+    nome: Optional[str] = Form(None),
+    texto: Optional[str] = Form(None),
+    ativo: Optional[bool] = Form(None),
+    db: DbSession = Depends(get_session)
+):
+    """Atualiza uma mídia existente"""
+    result = await db.run(_update_media, media_id, nome, texto, ativo)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _delete_media(db: Session, media_id: int):
     media = db.query(Media).filter(Media.id == media_id).first()
     if not media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
     
-    # Remover arquivo físico se existir
-    if media.caminho_arquivo and os.path.exists(media.caminho_arquivo):
-        try:
-            os.remove(media.caminho_arquivo)
-        except Exception as e:
-            print(f"Erro ao remover arquivo: {e}")
+    # Soltar a referência ao arquivo; ele só é apagado se nenhuma outra mídia o usa
+    arquivo = blob_store.release(db, media.sha256, media.caminho_arquivo)
+    derivados = list((media.derivados or {}).values()) if arquivo else []
     
     db.delete(media)
     db.commit()
     
+    return arquivo, derivados
+
+def _remove_files(bind, arquivo: Optional[str], derivados: List[str]):
+    """Remove os arquivos físicos (original e versões reduzidas) em uma sessão própria"""
+    with Session(bind) as db:
+        blob_store.remove_released(db, arquivo, derivados)
+
+@router.delete("/{media_id}")
+async def delete_media(media_id: int, db: DbSession = Depends(get_session)):
+    """Remove uma mídia e seus agendamentos"""
+    arquivo, derivados = await db.run(_delete_media, media_id)
+    # Os players deixam de receber o arquivo antes de ele ser apagado
+    await SchedulerService.refresh_timeline(db)
+    bind = db.sync_bind()
+    if bind.dialect.is_async:
+        await db.run(blob_store.remove_released, arquivo, derivados)
+    else:
+        await run_in_threadpool(_remove_files, bind, arquivo, derivados)
     return {"message": "Mídia removida com sucesso"}
 
-@router.get("/stats/summary")
-async def get_stats(db: Session = Depends(get_db)):
-    """Retorna estatísticas gerais das mídias"""
-    total = db.query(Media).count()
-    videos = db.query(Media).filter(Media.tipo == "video").count()
-    imagens = db.query(Media).filter(Media.tipo == "imagem").count()
-    textos = db.query(Media).filter(Media.tipo == "texto").count()
-    youtube = db.query(Media).filter(Media.tipo == "youtube").count()
-    ativos = db.query(Media).filter(Media.ativo == True).count()
+def _get_stats(db: Session):
+    # Todas as contagens em uma consulta: mídias por (tipo, ativo), agendamentos
+    # por (região, ativo) e o contador de espaço ocupado
+    consulta = union_all(
+        select(
+            literal("media").label("grupo"), Media.tipo.label("chave"), Media.ativo.label("ativo"),
+            func.count().label("quantidade"), literal(None).label("bytes")
+        ).group_by(Media.tipo, Media.ativo),
+        select(
+            literal("schedule"), cast(Schedule.regiao, String), Schedule.ativo,
+            func.count(), literal(None)
+        ).group_by(Schedule.regiao, Schedule.ativo),
+        select(
+            literal("disco"), literal(None), literal(None),
+            StorageUsage.arquivos, StorageUsage.bytes_usados
+        )
+    )
+    
+    por_tipo = {}
+    por_regiao = {}
+    disco = None
+    for grupo, chave, ativo, quantidade, bytes_usados in db.execute(consulta):
+        if grupo == "disco":
+            disco = {"bytes": bytes_usados, "arquivos": quantidade}
+            continue
+        contagem = (por_tipo if grupo == "media" else por_regiao).setdefault(chave, {"total": 0, "ativos": 0})
+        contagem["total"] += quantidade
+        if ativo:
+            contagem["ativos"] += quantidade
+    if disco is None:
+        # Primeira vez: cria o contador percorrendo o UPLOAD_DIR
+        disco = disk_usage.get(db)
+    
+    total = sum(c["total"] for c in por_tipo.values())
+    ativos = sum(c["ativos"] for c in por_tipo.values())
+    por_tipo_total = lambda tipo: por_tipo.get(tipo, {}).get("total", 0)
     
     return {
         "total": total,
-        "videos": videos,
-        "imagens": imagens,
-        "youtube": youtube,
-        "textos": textos,
+        "videos": por_tipo_total("video"),
+        "imagens": por_tipo_total("imagem"),
+        "youtube": por_tipo_total("youtube"),
+        "textos": por_tipo_total("texto"),
         "ativos": ativos,
-        "inativos": total - ativos
+        "inativos": total - ativos,
+        "por_tipo": por_tipo,
+        "agendamentos": {
+            "total": sum(c["total"] for c in por_regiao.values()),
+            "ativos": sum(c["ativos"] for c in por_regiao.values()),
+            "por_regiao": por_regiao
+        },
+        "disco": disco
     }
+
+@router.get("/stats/summary")
+async def get_stats(db: DbSession = Depends(get_session)):
+    """Retorna estatísticas das mídias, dos agendamentos por região e do espaço em disco"""
+    return await db.run(_get_stats)
@@ -1,44 +1,135 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..services.weather import WeatherService
-from ..services.scheduler import SchedulerService
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from ..database import DbSession, get_session
+from ..services.weather import weather_service
+from ..services.scheduler import SchedulerService, REGIOES
+from ..services.broadcaster import content_broadcaster
 
 router = APIRouter(prefix="/api/player", tags=["player"])
 
-weather_service = WeatherService()
+
+# Intervalo do comentário keepalive no stream SSE (segundos)
+STREAM_KEEPALIVE = 15
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """
+    Verifica se algum ETag de If-None-Match corresponde ao atual
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match usa comparação fraca: ignorar o prefixo W/ dos dois lados
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+def _conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Define os cabeçalhos de cache e retorna 304 quando o cliente já tem a versão atual
+    """
+    # no-cache: o navegador guarda a resposta mas sempre revalida com o ETag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
 
 @router.get("/active-content")
-async def get_active_content(db: Session = Depends(get_db)):
+async def get_active_content(request: Request, response: Response, db: DbSession = Depends(get_session)):
     """
     Retorna o conteúdo ativo para exibição no player
     """
-    content = SchedulerService.get_active_content(db)
+    now = datetime.now()
+    etag = await db.run(SchedulerService.get_content_etag, [regiao for regiao, _ in REGIOES], now)
+    not_modified = _conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+    
+    content = await db.run(SchedulerService.get_active_content, now)
     return content
 
 @router.get("/active-content/region/{regiao}")
-async def get_active_content_by_region(regiao: int, db: Session = Depends(get_db)):
+async def get_active_content_by_region(
+    regiao: int,
+    request: Request,
+    response: Response,
+    db: DbSession = Depends(get_session)
+):
     """
     Retorna o conteúdo ativo para uma região específica
     """
-    from datetime import datetime
     now = datetime.now()
-    current_date = now.date()
-    current_time = now.time()
-    current_weekday = (now.weekday() + 1) % 7
+    etag = await db.run(SchedulerService.get_content_etag, [regiao], now)
+    not_modified = _conditional(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    content = SchedulerService._get_content_for_region(
-        db, regiao, current_date, current_time, current_weekday
-    )
+    content = await db.run(SchedulerService.get_region_content, regiao, now)
     return content
 
+@router.get("/manifest")
+async def get_manifest(
+    hours: int = Query(24, ge=1, le=168),
+    db: DbSession = Depends(get_session)
+):
+    """
+    Retorna a sequência de exibição de todas as regiões para as próximas horas,
+    para que o player possa seguir a rotação sem consultar o servidor
+    """
+    return await db.run(SchedulerService.get_manifest, hours)
+
+def _sse_events(changes) -> str:
+    """
+    Formata as mudanças de conteúdo como eventos SSE (um por região)
+    """
+    events = []
+    for regiao, (etag, content) in sorted(changes.items()):
+        data = json.dumps({"regiao": regiao, "content": content}, ensure_ascii=False)
+        events.append(f"event: content\nid: {etag}\ndata: {data}\n\n")
+    return "".join(events)
+
+@router.get("/stream")
+async def stream_content(request: Request, db: DbSession = Depends(get_session)):
+    """
+    Stream SSE com o conteúdo de cada região, enviado quando a rotação muda
+    ou quando um agendamento/mídia é alterado
+    """
+    # A caixa do player já começa com o estado atual de todas as regiões
+    subscriber = await db.run(content_broadcaster.subscribe)
+    
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                changes = await subscriber.get(timeout=STREAM_KEEPALIVE)
+                if changes:
+                    yield _sse_events(changes)
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            content_broadcaster.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/weather")
-async def get_weather(db: Session = Depends(get_db)):
+async def get_weather(request: Request, response: Response, db: DbSession = Depends(get_session)):
     """
     Retorna dados do clima atual
     """
     weather_data = await weather_service.get_weather(db)
     
+    etag = weather_service.get_etag(weather_data)
+    not_modified = _conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+    
     # Adicionar emoji do ícone
     if weather_data.get("icone"):
         weather_data["emoji"] = weather_service.get_icon_emoji(weather_data["icone"])
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import case, delete, update
+from sqlalchemy.orm import Session, contains_eager
 from pydantic import BaseModel
-from datetime import date, time
+from datetime import date, datetime, time, timedelta
 from typing import Optional, List
-from ..database import get_db
-from ..models import Schedule, Media
+from ..database import DbSession, get_session
+from ..models import Schedule, Media, parse_dias_semana
+from ..services.pagination import paginate
 from ..services.scheduler import SchedulerService
 
 router = APIRouter(prefix="/api/schedule", tags=["schedule"])
@@ -31,24 +33,66 @@ class ScheduleUpdate(BaseModel):
     prioridade: Optional[int] = None
     ativo: Optional[bool] = None
 
-@router.get("/")
-async def list_schedules(
-    regiao: Optional[int] = None,
-    ativo: Optional[bool] = None,
-    db: Session = Depends(get_db)
+class ScheduleOrder(BaseModel):
+    id: int
+    prioridade: int
+
+class ScheduleBulkUpdate(ScheduleUpdate):
+    id: int
+
+class ScheduleIds(BaseModel):
+    ids: List[int]
+
+DIAS_SEMANA_INVALIDO = "dias_semana deve ser uma string separada por vírgulas (ex: '0,1,2,3,4,5,6')"
+
+# Campos da janela que não aceitam null na atualização
+CAMPOS_OBRIGATORIOS = ("data_inicio", "data_fim", "hora_inicio", "hora_fim")
+
+def _campo_nulo(update_data: dict) -> Optional[str]:
+    """Mensagem de erro para o primeiro campo obrigatório enviado como null, ou None"""
+    for campo in CAMPOS_OBRIGATORIOS:
+        if campo in update_data and update_data[campo] is None:
+            return f"{campo} não pode ser nulo"
+    return None
+
+def _dias_semana_mask(dias_semana: Optional[str]) -> Optional[int]:
+    """Máscara da string de dias da semana, ou None se inválida (ou nula)"""
+    if dias_semana is None:
+        return None
+    try:
+        return parse_dias_semana(dias_semana) or None
+    except ValueError:
+        return None
+
+def validate_dias_semana(dias_semana: str) -> int:
+    """Valida a string de dias da semana e retorna a máscara correspondente"""
+    mask = _dias_semana_mask(dias_semana)
+    if mask is None:
+        raise HTTPException(status_code=400, detail=DIAS_SEMANA_INVALIDO)
+    return mask
+
+def _list_schedules(
+    db: Session,
+    regiao: Optional[int],
+    ativo: Optional[bool],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
 ):
-    """Lista todos os agendamentos com filtros opcionais"""
-    query = db.query(Schedule)
+    # Mídia carregada no mesmo SELECT (nome e tipo de cada agendamento)
+    query = db.query(Schedule).join(Schedule.media).options(contains_eager(Schedule.media))
     
     if regiao:
         query = query.filter(Schedule.regiao == regiao)
     if ativo is not None:
         query = query.filter(Schedule.ativo == ativo)
     
-    schedules = query.order_by(
-        Schedule.data_inicio.desc(),
-        Schedule.hora_inicio.desc()
-    ).all()
+    try:
+        schedules, next_cursor = paginate(
+            query, (Schedule.data_inicio, Schedule.hora_inicio, Schedule.id), limit, cursor,
+            key=lambda s: (s.data_inicio, s.hora_inicio, s.id)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return [
         {
@@ -68,11 +112,235 @@ async def list_schedules(
             "criado_em": s.criado_em.isoformat()
         }
         for s in schedules
-    ]
+    ], next_cursor
 
-@router.get("/{schedule_id}")
-async def get_schedule(schedule_id: int, db: Session = Depends(get_db)):
-    """Obtém detalhes de um agendamento específico"""
+@router.get("/")
+async def list_schedules(
+    response: Response,
+    regiao: Optional[int] = None,
+    ativo: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: DbSession = Depends(get_session)
+):
+    """
+    Lista os agendamentos (início mais recente primeiro) com filtros
+    opcionais; com `limit`, a resposta traz o cursor da próxima página em
+    X-Next-Cursor
+    """
+    schedules, next_cursor = await db.run(_list_schedules, regiao, ativo, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return schedules
+
+def _reorder_schedules(db: Session, updates: List[ScheduleOrder]):
+    if not updates:
+        return {"message": "0 agendamentos reordenados com sucesso", "atualizados": 0}
+    
+    # Um único UPDATE ... SET prioridade = CASE id WHEN ... END WHERE id IN (...)
+    prioridades = {u.id: u.prioridade for u in updates}
+    result = db.execute(
+        update(Schedule)
+        .where(Schedule.id.in_(prioridades))
+        .values(prioridade=case(prioridades, value=Schedule.id))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return {
+        "message": f"{result.rowcount} agendamentos reordenados com sucesso",
+        "atualizados": result.rowcount
+    }
+
+@router.put("/reorder")
+async def reorder_schedules(
+    updates: List[ScheduleOrder],
+    db: DbSession = Depends(get_session)
+):
+    """Atualiza a ordem (prioridade) de múltiplos agendamentos"""
+    result = await db.run(_reorder_schedules, updates)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _batch_error(erros: List[dict]):
+    raise HTTPException(status_code=400, detail={
+        "message": f"{len(erros)} agendamento(s) inválido(s); nada foi gravado",
+        "erros": erros
+    })
+
+def _create_schedules_bulk(db: Session, items: List[ScheduleCreate]):
+    # Todas as mídias do lote em uma consulta; a validação é feita em memória
+    medias = {
+        m.id: m for m in db.query(Media).filter(Media.id.in_({item.media_id for item in items}))
+    }
+    erros = []
+    for indice, item in enumerate(items):
+        is_valid, error_msg = SchedulerService.check_schedule(
+            medias.get(item.media_id), item.regiao, item.data_inicio,
+            item.data_fim, item.hora_inicio, item.hora_fim
+        )
+        if is_valid and _dias_semana_mask(item.dias_semana) is None:
+            is_valid, error_msg = False, DIAS_SEMANA_INVALIDO
+        if not is_valid:
+            erros.append({"indice": indice, "erro": error_msg})
+    if erros:
+        _batch_error(erros)
+    
+    # Agendamentos existentes (uma consulta para o lote inteiro), obtidos
+    # antes de o lote entrar na sessão
+    timelines = SchedulerService.get_conflict_timelines(
+        db,
+        {item.regiao for item in items},
+        min((item.data_inicio for item in items), default=date.max),
+        max((item.data_fim for item in items), default=date.min)
+    )
+    
+    schedules = [Schedule(**item.dict()) for item in items]
+    db.add_all(schedules)
+    db.flush()
+    ids = [schedule.id for schedule in schedules]  # antes do commit, que expira os objetos
+    # Sobreposições entram na rotação; apenas informamos quais são, como na criação simples
+    conflitos = SchedulerService.find_batch_conflicts(timelines, schedules)
+    db.commit()
+    
+    return {
+        "ids": ids,
+        "conflitos": conflitos,
+        "message": f"{len(schedules)} agendamentos criados com sucesso"
+    }
+
+@router.post("/bulk")
+async def create_schedules_bulk(
+    items: List[ScheduleCreate],
+    db: DbSession = Depends(get_session)
+):
+    """Cria vários agendamentos de uma vez (todos ou nenhum)"""
+    result = await db.run(_create_schedules_bulk, items)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _update_schedules_bulk(db: Session, items: List[ScheduleBulkUpdate]):
+    # Agendamentos do lote (com as mídias) em uma consulta
+    schedules = {
+        s.id: s for s in db.query(Schedule).join(Schedule.media).options(
+            contains_eager(Schedule.media)
+        ).filter(Schedule.id.in_({item.id for item in items}))
+    }
+    erros = []
+    alteracoes = []
+    for indice, item in enumerate(items):
+        schedule = schedules.get(item.id)
+        if schedule is None:
+            erros.append({"indice": indice, "erro": "Agendamento não encontrado"})
+            continue
+        update_data = item.dict(exclude_unset=True, exclude={"id"})
+        error_msg = _campo_nulo(update_data)
+        if error_msg:
+            erros.append({"indice": indice, "erro": error_msg})
+            continue
+        novo = lambda campo: update_data.get(campo, getattr(schedule, campo))
+        is_valid, error_msg = SchedulerService.check_schedule(
+            schedule.media, schedule.regiao, novo("data_inicio"),
+            novo("data_fim"), novo("hora_inicio"), novo("hora_fim")
+        )
+        if is_valid and "dias_semana" in update_data and _dias_semana_mask(update_data["dias_semana"]) is None:
+            is_valid, error_msg = False, DIAS_SEMANA_INVALIDO
+        if not is_valid:
+            erros.append({"indice": indice, "erro": error_msg})
+            continue
+        alteracoes.append((schedule, update_data))
+    if erros:
+        _batch_error(erros)
+    
+    for schedule, update_data in alteracoes:
+        for key, value in update_data.items():
+            setattr(schedule, key, value)
+    db.commit()
+    
+    return {
+        "atualizados": len(alteracoes),
+        "message": f"{len(alteracoes)} agendamentos atualizados com sucesso"
+    }
+
+@router.put("/bulk")
+async def update_schedules_bulk(
+    items: List[ScheduleBulkUpdate],
+    db: DbSession = Depends(get_session)
+):
+    """Atualiza vários agendamentos de uma vez (todos ou nenhum)"""
+    result = await db.run(_update_schedules_bulk, items)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _delete_schedules_bulk(db: Session, ids: List[int]):
+    result = db.execute(
+        delete(Schedule)
+        .where(Schedule.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return {
+        "removidos": result.rowcount,
+        "message": f"{result.rowcount} agendamentos removidos com sucesso"
+    }
+
+@router.delete("/bulk")
+async def delete_schedules_bulk(
+    data: ScheduleIds,
+    db: DbSession = Depends(get_session)
+):
+    """Remove vários agendamentos em um único DELETE"""
+    result = await db.run(_delete_schedules_bulk, data.ids)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+# Maior período aceito pela simulação
+SIMULACAO_MAX_DIAS = 31
+
+def _local(instante: datetime) -> datetime:
+    """Converte um instante com fuso para o horário local (como a linha do tempo)"""
+    if instante.tzinfo is not None:
+        return instante.astimezone().replace(tzinfo=None)
+    return instante
+
+def _simulate(
+    db: Session,
+    inicio: datetime,
+    fim: datetime,
+    resolucao: int,
+    regioes: Optional[str]
+):
+    inicio, fim = _local(inicio), _local(fim)
+    if fim <= inicio:
+        raise HTTPException(status_code=400, detail="Fim deve ser maior que início")
+    if fim - inicio > timedelta(days=SIMULACAO_MAX_DIAS):
+        raise HTTPException(status_code=400, detail=f"Período máximo da simulação: {SIMULACAO_MAX_DIAS} dias")
+    
+    lista = None
+    if regioes:
+        try:
+            lista = [int(regiao) for regiao in regioes.split(",")]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Região deve ser 1, 2 ou 4")
+        if any(regiao not in [1, 2, 4] for regiao in lista):
+            raise HTTPException(status_code=400, detail="Região deve ser 1, 2 ou 4")
+    
+    return SchedulerService.simulate(db, inicio, fim, resolucao, lista)
+
+@router.get("/simulate")
+async def simulate_schedule(
+    inicio: datetime,
+    fim: datetime,
+    resolucao: int = Query(1, ge=1, le=86400),
+    regioes: Optional[str] = None,
+    db: DbSession = Depends(get_session)
+):
+    """
+    Prévia da exibição: item ativo de cada região a cada `resolucao` segundos
+    entre `inicio` e `fim`, em sequências [primeiro_passo, quantidade, item]
+    """
+    return await db.run(_simulate, inicio, fim, resolucao, regioes)
+
+def _get_schedule(db: Session, schedule_id: int):
     schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
     if not schedule:
         raise HTTPException(status_code=404, detail="Agendamento não encontrado")
@@ -94,13 +362,12 @@ async def get_schedule(schedule_id: int, db: Session = Depends(get_db)):
         "criado_em": schedule.criado_em.isoformat()
     }
 
-@router.post("/")
-async def create_schedule(
-    schedule_data: ScheduleCreate,
-    db: Session = Depends(get_db)
-):
-    """Cria um novo agendamento"""
-    
+@router.get("/{schedule_id}")
+async def get_schedule(schedule_id: int, db: DbSession = Depends(get_session)):
+    """Obtém detalhes de um agendamento específico"""
+    return await db.run(_get_schedule, schedule_id)
+
+def _create_schedule(db: Session, schedule_data: ScheduleCreate):
     # Validar agendamento
     is_valid, error_msg = SchedulerService.validate_schedule(
         db=db,
@@ -116,15 +383,18 @@ async def create_schedule(
         raise HTTPException(status_code=400, detail=error_msg)
     
     # Validar dias da semana
-    try:
-        dias = [int(d) for d in schedule_data.dias_semana.split(",")]
-        if not all(0 <= d <= 6 for d in dias):
-            raise ValueError()
-    except:
-        raise HTTPException(
-            status_code=400,
-            detail="dias_semana deve ser uma string separada por vírgulas (ex: '0,1,2,3,4,5,6')"
-        )
+    validate_dias_semana(schedule_data.dias_semana)
+    
+    # Agendamentos sobrepostos entram na rotação; apenas informamos quais são
+    conflitos = SchedulerService.find_conflicts(
+        db,
+        regiao=schedule_data.regiao,
+        data_inicio=schedule_data.data_inicio,
+        data_fim=schedule_data.data_fim,
+        hora_inicio=schedule_data.hora_inicio,
+        hora_fim=schedule_data.hora_fim,
+        dias_semana=schedule_data.dias_semana
+    )
     
     # Criar agendamento
     schedule = Schedule(
@@ -146,16 +416,25 @@ async def create_schedule(
     
     return {
         "id": schedule.id,
+        "conflitos": conflitos,
         "message": "Agendamento criado com sucesso"
     }
 
-@router.put("/{schedule_id}")
-async def update_schedule(
+@router.post("/")
+async def create_schedule(
+    schedule_data: ScheduleCreate,
+    db: DbSession = Depends(get_session)
+):
+    """Cria um novo agendamento"""
+    result = await db.run(_create_schedule, schedule_data)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _update_schedule(
+    db: Session,
     schedule_id: int,
-    schedule_data: ScheduleUpdate,
-    db: Session = Depends(get_db)
+    schedule_data: ScheduleUpdate
 ):
-    """Atualiza um agendamento existente"""
     schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
     if not schedule:
         raise HTTPException(status_code=404, detail="Agendamento não encontrado")
@@ -163,6 +442,14 @@ async def update_schedule(
     # Atualizar campos fornecidos
     update_data = schedule_data.dict(exclude_unset=True)
     
+    error_msg = _campo_nulo(update_data)
+    if error_msg:
+        raise HTTPException(status_code=400, detail=error_msg)
+    
+    # Um null explícito também é inválido (não há "sem dias da semana")
+    if 'dias_semana' in update_data:
+        validate_dias_semana(update_data['dias_semana'])
+    
     # Se estiver atualizando datas/horas, validar
     if any(k in update_data for k in ['data_inicio', 'data_fim', 'hora_inicio', 'hora_fim']):
         is_valid, error_msg = SchedulerService.validate_schedule(
@@ -172,8 +459,7 @@ async def update_schedule(
             data_inicio=update_data.get('data_inicio', schedule.data_inicio),
             data_fim=update_data.get('data_fim', schedule.data_fim),
             hora_inicio=update_data.get('hora_inicio', schedule.hora_inicio),
-            hora_fim=update_data.get('hora_fim', schedule.hora_fim),
-            exclude_schedule_id=schedule_id
+            hora_fim=update_data.get('hora_fim', schedule.hora_fim)
         )
         
         if not is_valid:
@@ -182,17 +468,39 @@ async def update_schedule(
     for key, value in update_data.items():
         setattr(schedule, key, value)
     
+    # Sobreposições com a nova janela, sem contar o próprio agendamento
+    conflitos = SchedulerService.find_conflicts(
+        db,
+        regiao=schedule.regiao,
+        data_inicio=schedule.data_inicio,
+        data_fim=schedule.data_fim,
+        hora_inicio=schedule.hora_inicio,
+        hora_fim=schedule.hora_fim,
+        dias_semana=schedule.dias_semana,
+        exclude_schedule_id=schedule_id
+    )
+    
     db.commit()
     db.refresh(schedule)
     
     return {
         "id": schedule.id,
+        "conflitos": conflitos,
         "message": "Agendamento atualizado com sucesso"
     }
 
-@router.delete("/{schedule_id}")
-async def delete_schedule(schedule_id: int, db: Session = Depends(get_db)):
-    """Remove um agendamento"""
+@router.put("/{schedule_id}")
+async def update_schedule(
+    schedule_id: int,
+    schedule_data: ScheduleUpdate,
+    db: DbSession = Depends(get_session)
+):
+    """Atualiza um agendamento existente"""
+    result = await db.run(_update_schedule, schedule_id, schedule_data)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _delete_schedule(db: Session, schedule_id: int):
     schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
     if not schedule:
         raise HTTPException(status_code=404, detail="Agendamento não encontrado")
@@ -202,35 +510,68 @@ async def delete_schedule(schedule_id: int, db: Session = Depends(get_db)):
     
     return {"message": "Agendamento removido com sucesso"}
 
-@router.get("/next/{regiao}")
-async def get_next_schedules(
+@router.delete("/{schedule_id}")
+async def delete_schedule(schedule_id: int, db: DbSession = Depends(get_session)):
+    """Remove um agendamento"""
+    result = await db.run(_delete_schedule, schedule_id)
+    await SchedulerService.refresh_timeline(db)
+    return result
+
+def _get_next_schedules(
+    db: Session,
     regiao: int,
-    hours: int = 24,
-    db: Session = Depends(get_db)
+    hours: int,
+    limit: Optional[int],
+    cursor: Optional[str]
 ):
-    """Retorna próximos agendamentos para uma região"""
     if regiao not in [1, 2, 4]:
         raise HTTPException(status_code=400, detail="Região deve ser 1, 2 ou 4")
     
-    schedules = SchedulerService.get_next_content(db, regiao, hours)
+    try:
+        schedules, next_cursor = SchedulerService.get_next_content(
+            db, regiao, hours, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "regiao": regiao,
         "hours_ahead": hours,
         "schedules": schedules
-    }
+    }, next_cursor
 
-@router.get("/conflicts/{media_id}")
-async def check_conflicts(
+@router.get("/next/{regiao}")
+async def get_next_schedules(
+    response: Response,
+    regiao: int,
+    hours: int = Query(24, ge=1, le=24 * 366),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: DbSession = Depends(get_session)
+):
+    """
+    Retorna as próximas ocorrências dos agendamentos de uma região, em ordem
+    de início; com `limit`, a resposta traz o cursor da próxima página em
+    X-Next-Cursor
+    """
+    result, next_cursor = await db.run(_get_next_schedules, regiao, hours, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return result
+
+def _check_conflicts(
+    db: Session,
     media_id: int,
     regiao: int,
     data_inicio: date,
     data_fim: date,
     hora_inicio: time,
     hora_fim: time,
-    db: Session = Depends(get_db)
+    dias_semana: str,
+    exclude_schedule_id: Optional[int]
 ):
-    """Verifica se há conflitos de agendamento"""
+    validate_dias_semana(dias_semana)
+    
     is_valid, error_msg = SchedulerService.validate_schedule(
         db=db,
         media_id=media_id,
@@ -241,29 +582,46 @@ async def check_conflicts(
         hora_fim=hora_fim
     )
     
+    conflitos = []
+    if is_valid:
+        conflitos = SchedulerService.find_conflicts(
+            db,
+            regiao=regiao,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            hora_inicio=hora_inicio,
+            hora_fim=hora_fim,
+            dias_semana=dias_semana,
+            exclude_schedule_id=exclude_schedule_id
+        )
+    
+    if not is_valid:
+        message = error_msg
+    elif conflitos:
+        message = f"{len(conflitos)} agendamento(s) sobreposto(s) entrarão em rotação"
+    else:
+        message = "Sem conflitos"
+    
     return {
         "valid": is_valid,
-        "message": error_msg if not is_valid else "Sem conflitos"
+        "conflitos": conflitos,
+        "message": message
     }
 
-@router.put("/reorder")
-async def reorder_schedules(
-    updates: List[dict],
-    db: Session = Depends(get_db)
+@router.get("/conflicts/{media_id}")
+async def check_conflicts(
+    media_id: int,
+    regiao: int,
+    data_inicio: date,
+    data_fim: date,
+    hora_inicio: time,
+    hora_fim: time,
+    dias_semana: str = "0,1,2,3,4,5,6",
+    exclude_schedule_id: Optional[int] = None,
+    db: DbSession = Depends(get_session)
 ):
-    """Atualiza a ordem (prioridade) de múltiplos agendamentos"""
-    try:
-        for update in updates:
-            schedule_id = update.get('id')
-            new_prioridade = update.get('prioridade')
-            
-            if schedule_id and new_prioridade is not None:
-                schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
-                if schedule:
-                    schedule.prioridade = new_prioridade
-        
-        db.commit()
-        return {"message": f"{len(updates)} agendamentos reordenados com sucesso"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+    """Verifica se há conflitos de agendamento"""
+    return await db.run(
+        _check_conflicts, media_id, regiao, data_inicio, data_fim,
+        hora_inicio, hora_fim, dias_semana, exclude_schedule_id
+    )
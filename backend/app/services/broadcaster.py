@@ -0,0 +1,162 @@
+"""
+Envio do conteúdo ativo aos players conectados (Server-Sent Events)
+
+Um único laço calcula, a partir da linha do tempo, quando o conteúdo de cada
+região muda e distribui a mudança para todos os players conectados. Cada
+player tem uma "caixa" com apenas o estado mais recente por região: um
+cliente lento nunca acumula mensagens, ele só recebe o estado atual quando
+voltar a ler.
+"""
+import asyncio
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database import sync_bind
+from .timeline import ScheduleTimeline, timeline_store
+
+# Intervalo máximo entre verificações, mesmo sem mudança prevista (segundos)
+MAX_SLEEP = 60.0
+# Intervalo mínimo entre verificações, para não girar em falso
+MIN_SLEEP = 0.05
+# Espera antes de tentar de novo após um tick com erro (segundos)
+ERROR_SLEEP = 5.0
+
+
+class Subscriber:
+    """
+    Caixa de mensagens de um player conectado
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[str, Optional[Dict]]] = {}
+        self._event = asyncio.Event()
+
+    def push(self, regiao: int, etag: str, content: Optional[Dict]):
+        # Substitui o que ainda não foi lido: só o estado mais recente importa
+        self._pending[regiao] = (etag, content)
+        self._event.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Dict[int, Tuple[str, Optional[Dict]]]:
+        """
+        Aguarda e retorna as mudanças pendentes ({} se o tempo esgotar)
+        """
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return {}
+        pending, self._pending = self._pending, {}
+        self._event.clear()
+        return pending
+
+
+class ContentBroadcaster:
+    """
+    Laço único que publica o conteúdo de cada região quando ele muda
+    """
+
+    def __init__(self, regioes=(1, 2, 4)):
+        self.regioes = tuple(regioes)
+        self._subscribers = set()
+        self._last: Dict[int, str] = {}
+        self._bind = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        timeline_store.add_listener(self.notify)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def snapshot(self, db: Session, now: Optional[datetime] = None) -> Dict[int, Tuple[str, Optional[Dict]]]:
+        """
+        Estado atual de todas as regiões (enviado na conexão)
+        """
+        now = now or datetime.now()
+        return self._resolve(timeline_store.get(db, now.date()), now)
+
+    def subscribe(self, db: Session) -> Subscriber:
+        """
+        Registra um player (já com o estado atual na caixa) e garante que o
+        laço de publicação está rodando
+        """
+        snapshot = self.snapshot(db)
+        subscriber = Subscriber()
+        for regiao, (etag, content) in snapshot.items():
+            subscriber.push(regiao, etag, content)
+        self._subscribers.add(subscriber)
+        self._bind = sync_bind(db)
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._last = {regiao: etag for regiao, (etag, _) in snapshot.items()}
+            self._task = self._loop.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        if not self._subscribers and self._wakeup is not None:
+            # Acorda o laço para que ele perceba que não há mais ninguém
+            self._wakeup.set()
+
+    def notify(self):
+        """
+        Avisa que a linha do tempo mudou (pode ser chamado de qualquer thread)
+        """
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            wakeup.set()
+        else:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _resolve(self, timeline: ScheduleTimeline, now: datetime):
+        return {
+            regiao: (timeline.etag([regiao], now), timeline.content_at(regiao, now))
+            for regiao in self.regioes
+        }
+
+    def _timeline(self, dia: date) -> ScheduleTimeline:
+        with Session(bind=self._bind) as db:
+            return timeline_store.get(db, dia)
+
+    def tick(self, now: datetime) -> datetime:
+        """
+        Publica as regiões que mudaram e retorna o próximo instante a verificar
+        """
+        timeline = self._timeline(now.date())
+        for regiao, (etag, content) in self._resolve(timeline, now).items():
+            if self._last.get(regiao) == etag:
+                continue
+            self._last[regiao] = etag
+            for subscriber in list(self._subscribers):
+                subscriber.push(regiao, etag, content)
+        return min(timeline.next_change(regiao, now) for regiao in self.regioes)
+
+    async def _run(self):
+        while self._subscribers:
+            self._wakeup.clear()
+            try:
+                proxima = self.tick(datetime.now())
+                espera = (proxima - datetime.now()).total_seconds()
+                espera = min(max(espera, MIN_SLEEP), MAX_SLEEP)
+            except Exception as e:
+                # O laço segue: os players conectados voltam a receber
+                # eventos assim que a linha do tempo puder ser resolvida
+                print(f"Erro ao publicar o conteúdo ativo: {e}")
+                espera = ERROR_SLEEP
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+
+content_broadcaster = ContentBroadcaster()
@@ -0,0 +1,178 @@
+"""
+Versões reduzidas das imagens para cada região do player
+
+Uma foto de celular (24 MP) exibida em uma região de 1040x840 obriga o
+navegador do Raspberry Pi a decodificar a imagem inteira a cada troca. Após
+o upload, as imagens são reduzidas em um pool de processos (sem bloquear a
+requisição) para o tamanho de cada região; o conteúdo ativo passa a apontar
+para a versão da região assim que ela fica pronta.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database import sync_bind
+from ..models import (
+    DERIVADOS_ERRO,
+    DERIVADOS_PENDENTE,
+    DERIVADOS_PROCESSANDO,
+    DERIVADOS_PRONTO,
+    Media,
+)
+from .storage import disk_usage, file_size
+from .timeline import timeline_store
+
+# Tamanho (largura, altura) de cada região que exibe imagens (Player.css)
+REGION_SIZES: Dict[int, Tuple[int, int]] = {
+    1: (440, 840),
+    2: (1040, 840),
+}
+
+DERIVATIVE_FORMAT = os.getenv("DERIVATIVE_FORMAT", "webp").lower()  # webp ou jpeg
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "85"))
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", "1"))
+
+_EXTENSOES = {"webp": ".webp", "jpeg": ".jpg"}
+_FORMATOS_PIL = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def derivative_path(origem: str, largura: int, altura: int, formato: str = DERIVATIVE_FORMAT) -> str:
+    """
+    Caminho da versão reduzida: <arquivo>.<largura>x<altura>.<formato>
+    """
+    base = os.path.splitext(origem)[0]
+    return f"{base}.{largura}x{altura}{_EXTENSOES[formato]}"
+
+
+def render_derivatives(
+    origem: str,
+    tamanhos: Dict[int, Tuple[int, int]],
+    formato: str = DERIVATIVE_FORMAT,
+    qualidade: int = DERIVATIVE_QUALITY
+) -> Dict[int, str]:
+    """
+    Gera as versões reduzidas de `origem` ({regiao: caminho}); executado no
+    pool de processos. Regiões em que a imagem já cabe ficam de fora (usam o
+    original), assim como GIFs animados.
+    """
+    from PIL import Image, ImageOps
+
+    derivados = {}
+    with Image.open(origem) as img:
+        if getattr(img, "is_animated", False):
+            return derivados
+
+        # JPEG: decodifica já reduzido (escala DCT), bem mais rápido que a imagem inteira
+        maior = (max(w for w, _ in tamanhos.values()), max(h for _, h in tamanhos.values()))
+        img.draft("RGB", maior)
+        img = ImageOps.exif_transpose(img)
+
+        for regiao, (largura, altura) in tamanhos.items():
+            if img.width <= largura and img.height <= altura:
+                continue
+            destino = derivative_path(origem, largura, altura, formato)
+            if not os.path.exists(destino):
+                reduzida = img.copy()
+                reduzida.thumbnail((largura, altura), Image.LANCZOS)
+                if formato == "jpeg" or reduzida.mode not in ("RGB", "RGBA"):
+                    reduzida = reduzida.convert("RGB")
+                tmp = f"{destino}.part"
+                reduzida.save(tmp, format=_FORMATOS_PIL[formato], quality=qualidade)
+                os.replace(tmp, destino)
+            derivados[regiao] = destino
+    return derivados
+
+
+class DerivativePipeline:
+    """
+    Fila de geração das versões reduzidas, com o estado gravado em cada mídia
+    """
+
+    def __init__(self, workers: int = DERIVATIVE_WORKERS, tamanhos: Optional[Dict[int, Tuple[int, int]]] = None):
+        self.workers = workers
+        self.tamanhos = tamanhos or REGION_SIZES
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, db: Session, media: Media) -> asyncio.Task:
+        """
+        Agenda a geração para a mídia (já gravada como pendente) e retorna
+        imediatamente
+        """
+        task = self._tasks.get(media.id)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.get_running_loop().create_task(
+            self._process(sync_bind(db), media.id, media.caminho_arquivo)
+        )
+        self._tasks[media.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(media.id, None))
+        return task
+
+    def resume(self, db: Session):
+        """
+        Reagenda as mídias que ficaram pendentes (ex.: servidor reiniciado)
+        """
+        pendentes = db.query(Media).filter(
+            Media.tipo == "imagem",
+            Media.derivados_status.in_([DERIVADOS_PENDENTE, DERIVADOS_PROCESSANDO])
+        ).all()
+        for media in pendentes:
+            self.submit(db, media)
+
+    async def _process(self, bind, media_id: int, origem: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._save, bind, media_id, DERIVADOS_PROCESSANDO, None)
+        # Arquivos que já existiam (blob usado por outra mídia) não entram no espaço ocupado
+        existentes = {
+            caminho for caminho in (derivative_path(origem, w, h) for w, h in self.tamanhos.values())
+            if os.path.exists(caminho)
+        }
+        try:
+            derivados = await loop.run_in_executor(
+                self._pool(), render_derivatives, origem, self.tamanhos
+            )
+            status = DERIVADOS_PRONTO
+        except Exception as e:
+            print(f"Erro ao gerar versões reduzidas da mídia {media_id}: {e}")
+            derivados, status = None, DERIVADOS_ERRO
+        novos = [caminho for caminho in (derivados or {}).values() if caminho not in existentes]
+        await loop.run_in_executor(None, self._save, bind, media_id, status, derivados, novos)
+
+    @staticmethod
+    def _save(
+        bind,
+        media_id: int,
+        status: str,
+        derivados: Optional[Dict[int, str]],
+        novos: List[str] = ()
+    ):
+        with Session(bind=bind) as db:
+            disk_usage.add(db, sum(file_size(caminho) for caminho in novos), len(novos))
+            media = db.get(Media, media_id)
+            if media is None:
+                # Removida enquanto era processada (os arquivos novos continuam no disco)
+                db.commit()
+                return
+            media.derivados_status = status
+            if derivados is not None:
+                media.derivados = {str(regiao): caminho for regiao, caminho in derivados.items()}
+            db.commit()
+            if status == DERIVADOS_PRONTO:
+                timeline_store.rebuild(db)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+derivative_pipeline = DerivativePipeline()
@@ -0,0 +1,93 @@
+"""
+Árvore de intervalos (centrada) para consultas de sobreposição
+
+Usada pela linha do tempo para localizar, por região, os agendamentos cujo
+período de datas cruza um dia ou um intervalo de dias, sem percorrer o
+histórico inteiro.
+"""
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, by_start, by_end, left, right):
+        self.center = center
+        self.by_start = by_start  # intervalos que contêm o centro, por início ASC
+        self.by_end = by_end  # os mesmos intervalos, por fim DESC
+        self.left = left
+        self.right = right
+
+
+def _build(items: List[Tuple[int, int, Any]]) -> Optional[_Node]:
+    if not items:
+        return None
+    endpoints = sorted(p for lo, hi, _ in items for p in (lo, hi))
+    center = endpoints[len(endpoints) // 2]
+
+    left, right, here = [], [], []
+    for item in items:
+        if item[1] < center:
+            left.append(item)
+        elif item[0] > center:
+            right.append(item)
+        else:
+            here.append(item)
+
+    return _Node(
+        center=center,
+        by_start=tuple(sorted(here, key=lambda i: i[0])),
+        by_end=tuple(sorted(here, key=lambda i: i[1], reverse=True)),
+        left=_build(left),
+        right=_build(right),
+    )
+
+
+class IntervalIndex:
+    """
+    Índice imutável de intervalos fechados [inicio, fim] com valor associado
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, int, Any]] = ()):
+        items = [item for item in items if item[0] <= item[1]]
+        self._size = len(items)
+        self._root = _build(items)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def overlapping(self, inicio: int, fim: int) -> List[Any]:
+        """
+        Retorna os valores de todos os intervalos que cruzam [inicio, fim]
+        """
+        result = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if fim < node.center:
+                # Só os intervalos que começam até `fim` alcançam a consulta
+                for lo, _, value in node.by_start:
+                    if lo > fim:
+                        break
+                    result.append(value)
+                stack.append(node.left)
+            elif inicio > node.center:
+                # Só os intervalos que terminam a partir de `inicio` alcançam a consulta
+                for _, hi, value in node.by_end:
+                    if hi < inicio:
+                        break
+                    result.append(value)
+                stack.append(node.right)
+            else:
+                result.extend(value for _, _, value in node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return result
+
+    def stab(self, ponto: int) -> List[Any]:
+        """
+        Retorna os valores de todos os intervalos que contêm o ponto
+        """
+        return self.overlapping(ponto, ponto)
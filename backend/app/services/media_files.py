@@ -0,0 +1,102 @@
+"""
+Entrega dos arquivos de mídia aos players (/media)
+
+Os arquivos enviados nunca mudam de conteúdo: os novos são endereçados pelo
+SHA-256 e os antigos recebem a versão na URL (?v=). Por isso as respostas
+podem ser guardadas pelo navegador indefinidamente (Cache-Control immutable),
+e o player só baixa de novo quando a URL muda.
+
+A leitura em blocos grandes reduz as trocas de thread por GB servido; em
+servidores ASGI com a extensão pathsend o arquivo é enviado pelo próprio
+servidor (sendfile), e com MEDIA_ACCEL_REDIRECT um proxy na frente
+(nginx) serve o arquivo direto do disco.
+"""
+import os
+import re
+from typing import Optional
+from urllib.parse import quote
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .storage import UPLOAD_DIR
+
+# Tipos de mídia com arquivo no UPLOAD_DIR
+TIPOS_COM_ARQUIVO = ("video", "imagem")
+
+MEDIA_URL_PREFIX = "/media/"
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Bloco de leitura na entrega (o padrão do Starlette é 64 KiB)
+MEDIA_CHUNK_SIZE = 1024 * 1024
+# Prefixo de uma location "internal" do nginx que aponta para o UPLOAD_DIR (opcional)
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT", "")
+
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(\.|$)")
+
+
+def _relative_to_uploads(caminho: str) -> Optional[str]:
+    rel = os.path.relpath(os.path.abspath(caminho), os.path.abspath(UPLOAD_DIR))
+    if rel == "." or rel.startswith(".."):
+        return None
+    return rel.replace("\\", "/")
+
+
+def _file_version(caminho: str) -> Optional[str]:
+    try:
+        stat_result = os.stat(caminho)
+    except OSError:
+        return None
+    return f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+
+
+def media_url(caminho: Optional[str], sha256: Optional[str] = None) -> Optional[str]:
+    """
+    URL imutável de um arquivo do UPLOAD_DIR: o próprio nome já é o hash nos
+    arquivos endereçados por conteúdo; nos demais a versão vai em ?v=
+    """
+    if not caminho:
+        return None
+    rel = _relative_to_uploads(caminho.replace("\\", "/"))
+    if rel is None:
+        return None
+    url = MEDIA_URL_PREFIX + quote(rel)
+    if not _CONTENT_ADDRESSED.match(os.path.basename(rel)):
+        versao = sha256[:16] if sha256 else _file_version(caminho)
+        if versao:
+            url += f"?v={versao}"
+    return url
+
+
+class MediaFileResponse(FileResponse):
+    chunk_size = MEDIA_CHUNK_SIZE
+
+
+class MediaFiles(StaticFiles):
+    """
+    StaticFiles com cache imutável, ETag pelo hash do conteúdo e Range
+    (via FileResponse) para o seek dos vídeos
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        # Uploads ainda em andamento não são servidos
+        if path.replace("\\", "/").startswith("objects/incoming"):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        headers = {"Cache-Control": MEDIA_CACHE_CONTROL}
+        nome = os.path.basename(full_path)
+        if _CONTENT_ADDRESSED.match(nome):
+            headers["ETag"] = f'"{nome}"'
+
+        if MEDIA_ACCEL_REDIRECT:
+            rel = os.path.relpath(full_path, self.directory).replace("\\", "/")
+            headers["X-Accel-Redirect"] = MEDIA_ACCEL_REDIRECT.rstrip("/") + "/" + quote(rel)
+            return Response(status_code=status_code, headers=headers)
+
+        response = MediaFileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
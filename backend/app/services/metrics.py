@@ -0,0 +1,324 @@
+"""
+Métricas da aplicação no formato de exposição de texto do Prometheus
+
+Implementação mínima (contadores, gauges e histogramas com rótulos), sem
+dependências: cada medição é uma soma ou uma busca binária nos limites dos
+buckets, sob um lock curto, e o texto só é montado quando /metrics é lido.
+O custo por requisição fica em microssegundos, então as métricas podem
+ficar sempre ligadas no Raspberry Pi.
+
+- MetricsMiddleware: requisições e latência por rota (o modelo da rota,
+  como /api/player/active-content/region/{regiao}, e não a URL, para limitar as séries)
+- instrument_sqlalchemy: número e tempo das consultas SQL, no total e por
+  requisição
+- Contadores do agendador, do clima e dos uploads, usados nos serviços
+"""
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites dos buckets (segundos)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Registry:
+    """
+    Conjunto de métricas exportadas em /metrics
+    """
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric"):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Métrica já registrada: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """
+        Todas as métricas no formato de exposição de texto
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            # Sem rótulos: a série única aparece (zerada) desde o início
+            self.labels()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """
+        Série com os valores de rótulo informados (criada no primeiro uso)
+        """
+        key = tuple(map(str, values))
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados os rótulos {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """
+    Valor que só aumenta (total de eventos, bytes, segundos)
+    """
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels_text(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in self._series()
+        ]
+
+
+class Gauge(Counter):
+    """
+    Valor que sobe e desce (requisições em andamento, tamanhos)
+    """
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Uma posição por limite, mais a do +Inf (contagens não acumuladas)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """
+    Distribuição em buckets acumulados (le = "menor ou igual a"), com soma e contagem
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, child in self._series():
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            acumulado = 0
+            for limite, count in zip(self.buckets + (float("inf"),), counts):
+                acumulado += count
+                lines.append(f"{self.name}_bucket{_labels_text(names, key + (_format_value(float(limite)),))} {acumulado}")
+            labels = _labels_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {acumulado}")
+        return lines
+
+
+# HTTP
+HTTP_REQUESTS = Counter("http_requests_total", "Requisições HTTP concluídas", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Latência das requisições HTTP", ("method", "route"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "Requisições HTTP em andamento")
+HTTP_DB_QUERIES = Histogram("http_request_db_queries", "Consultas SQL por requisição", ("route",), COUNT_BUCKETS)
+HTTP_DB_SECONDS = Histogram("http_request_db_seconds", "Tempo no banco por requisição", ("route",), LATENCY_BUCKETS)
+
+# Banco
+DB_QUERIES = Histogram("db_query_duration_seconds", "Duração das consultas SQL", buckets=QUERY_BUCKETS)
+
+# Agendador
+SCHEDULER_LOOKUPS = Counter("scheduler_lookups_total", "Consultas ao agendador por tipo", ("consulta",))
+TIMELINE_CACHE = Counter("scheduler_timeline_cache_total", "Acessos à linha do tempo compilada (hit/miss)", ("resultado",))
+TIMELINE_BUILDS = Histogram("scheduler_timeline_build_seconds", "Tempo para montar a linha do tempo")
+
+# Clima
+WEATHER_REQUESTS = Counter("weather_requests_total", "Pedidos de clima por origem dos dados", ("origem",))
+WEATHER_FETCHES = Counter("weather_api_requests_total", "Buscas na API de clima por resultado", ("resultado",))
+WEATHER_FETCH_SECONDS = Histogram("weather_api_duration_seconds", "Duração das buscas na API de clima")
+
+# Uploads
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes recebidos em uploads")
+UPLOAD_SECONDS = Histogram("upload_duration_seconds", "Duração da recepção dos uploads", buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
+# Consultas e tempo no banco da requisição atual: [consultas, segundos]
+_request_db: ContextVar[Optional[list]] = ContextVar("metrics_request_db", default=None)
+
+_QUERY_START = "metrics_query_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info[_QUERY_START] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop(_QUERY_START, None)
+    if inicio is None:
+        return
+    elapsed = time.perf_counter() - inicio
+    DB_QUERIES.observe(elapsed)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_sqlalchemy():
+    """
+    Mede todas as consultas de todos os engines (inclusive o síncrono do
+    engine assíncrono); chamadas repetidas não duplicam os eventos
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    # Sem rota correspondente (404): um único rótulo, para não criar uma série por URL
+    return getattr(route, "path", None) or "desconhecida"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: contagem, latência e consultas SQL de cada requisição
+    HTTP, agrupadas pelo modelo da rota
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        HTTP_IN_PROGRESS.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - inicio
+            HTTP_IN_PROGRESS.dec()
+            _request_db.reset(token)
+            route = _route_label(scope)
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            HTTP_DB_QUERIES.labels(route).observe(stats[0])
+            HTTP_DB_SECONDS.labels(route).observe(stats[1])
@@ -0,0 +1,78 @@
+"""
+Paginação por chave (keyset) das listagens do painel admin
+
+Em vez de OFFSET (que percorre e descarta todas as linhas anteriores), cada
+página continua a partir dos valores de ordenação da última linha entregue,
+codificados em um cursor opaco. O custo de cada página não depende da
+posição na lista nem do tamanho da tabela.
+"""
+import base64
+import json
+from datetime import date, datetime, time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+_PARSERS = {
+    datetime: datetime.fromisoformat,
+    date: date.fromisoformat,
+    time: time.fromisoformat,
+    int: int,
+}
+
+
+def encode_cursor(values: Sequence) -> str:
+    """
+    Cursor opaco (base64 de uma lista JSON) com os valores de ordenação
+    """
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    """
+    Valores do cursor convertidos para o tipo de cada coluna; ValueError se inválido
+    """
+    return decode_values(cursor, [column.type.python_type for column in columns])
+
+
+def decode_values(cursor: str, types: Sequence[type]) -> list:
+    """
+    Valores do cursor convertidos para os tipos informados (datetime, date,
+    time ou int); ValueError se inválido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("número de valores")
+        return [_PARSERS[tipo](value) for tipo, value in zip(types, values)]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Cursor inválido: {e}")
+
+
+def paginate(
+    query: Query,
+    columns: Sequence,
+    limit: Optional[int],
+    cursor: Optional[str],
+    key: Callable[[object], Sequence]
+) -> Tuple[List, Optional[str]]:
+    """
+    Ordena `query` por `columns` (decrescente) e retorna a página após o
+    cursor e o cursor da próxima página (None na última). Sem `limit`,
+    retorna tudo. `key(linha)` extrai os valores de ordenação de uma linha
+    """
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+    query = query.order_by(*[column.desc() for column in columns])
+    if limit is None:
+        return query.all(), None
+
+    # Uma linha a mais indica se existe próxima página
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
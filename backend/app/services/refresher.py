@@ -0,0 +1,113 @@
+"""
+Cliente HTTP compartilhado e atualização em segundo plano dos dados externos
+
+O cliente (com pool de conexões e keep-alive) é criado uma vez no lifespan
+da aplicação, evitando uma conexão TCP/TLS nova a cada busca. Cada fonte
+externa (hoje, o clima) é atualizada por um laço próprio antes de o cache
+vencer, para que nenhuma requisição dos players espere pela rede.
+"""
+import asyncio
+import os
+import random
+from typing import Awaitable, Callable, Dict
+
+import httpx
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))  # segundos, por operação
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Fração do intervalo de cada fonte em que a atualização acontece (antes de vencer)
+REFRESH_AHEAD = float(os.getenv("REFRESH_AHEAD", "0.8"))
+# Variação aleatória (±) aplicada às esperas, para não sincronizar com outros players
+REFRESH_JITTER = float(os.getenv("REFRESH_JITTER", "0.1"))
+# Espera após uma falha: começa em REFRESH_BACKOFF e dobra até REFRESH_BACKOFF_MAX
+REFRESH_BACKOFF = float(os.getenv("REFRESH_BACKOFF", "5"))
+REFRESH_BACKOFF_MAX = float(os.getenv("REFRESH_BACKOFF_MAX", "300"))
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Cliente assíncrono com pool de conexões, para todo o processo
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+def jittered(delay: float, jitter: float = REFRESH_JITTER) -> float:
+    """
+    `delay` com variação aleatória de ±jitter (fração)
+    """
+    return max(0.0, delay * (1 + random.uniform(-jitter, jitter)))
+
+
+class BackgroundRefresher:
+    """
+    Laços de atualização das fontes externas; cada fonte é uma função
+    assíncrona que retorna True quando atualizou os dados
+    """
+
+    def __init__(
+        self,
+        ahead: float = REFRESH_AHEAD,
+        jitter: float = REFRESH_JITTER,
+        backoff: float = REFRESH_BACKOFF,
+        backoff_max: float = REFRESH_BACKOFF_MAX
+    ):
+        self.ahead = ahead
+        self.jitter = jitter
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._sources: Dict[str, tuple] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add(self, name: str, refresh: Callable[[], Awaitable[bool]], interval: float):
+        """
+        Registra uma fonte atualizada a cada `interval` segundos (antes de vencer)
+        """
+        self._sources[name] = (refresh, interval)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        for name, (refresh, interval) in self._sources.items():
+            if name not in self._tasks:
+                self._tasks[name] = loop.create_task(self._run(name, refresh, interval))
+
+    async def stop(self):
+        tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def next_delay(self, interval: float, failures: int) -> float:
+        """
+        Espera até a próxima tentativa: parte do intervalo após sucesso, ou
+        backoff exponencial (limitado ao intervalo) após falhas seguidas
+        """
+        if failures == 0:
+            return jittered(interval * self.ahead, self.jitter)
+        backoff = min(self.backoff * 2 ** (failures - 1), self.backoff_max, interval)
+        return jittered(backoff, self.jitter)
+
+    async def _run(self, name: str, refresh: Callable[[], Awaitable[bool]], interval: float):
+        failures = 0
+        while True:
+            try:
+                ok = await refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Erro ao atualizar {name}: {e}")
+                ok = False
+            failures = 0 if ok else failures + 1
+            await asyncio.sleep(self.next_delay(interval, failures))
+
+
+background_refresher = BackgroundRefresher()
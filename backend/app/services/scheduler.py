@@ -1,22 +1,85 @@
-from datetime import datetime, date, time
-from typing import List, Optional, Dict
-from sqlalchemy.orm import Session
+import heapq
+import itertools
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, contains_eager
 from sqlalchemy import and_
-from ..models import Media, Schedule
+from ..database import DbSession
+from ..models import Media, Schedule, TODOS_OS_DIAS, parse_dias_semana
+from .media_files import TIPOS_COM_ARQUIVO, media_url
+from .metrics import SCHEDULER_LOOKUPS
+from .pagination import decode_values, encode_cursor
+from .timeline import ScheduleTimeline, timeline_store, weekday_of
+
+# Regiões servidas pelo player e a chave correspondente na resposta
+REGIOES = [(1, "video"), (2, "imagem"), (4, "texto")]
+
+def _occurrences(schedule: Schedule, inicio: datetime, fim: datetime, primeiro_dia: date):
+    """
+    Ocorrências do agendamento, dia a dia a partir de `primeiro_dia`, que
+    terminam a partir de `inicio` e começam antes de `fim`
+    """
+    dia = max(schedule.data_inicio, primeiro_dia)
+    ultimo_dia = min(schedule.data_fim, fim.date())
+    mask = schedule.dias_mask if schedule.dias_mask is not None else TODOS_OS_DIAS
+    while dia <= ultimo_dia:
+        if mask & (1 << weekday_of(dia)):
+            comeco = datetime.combine(dia, schedule.hora_inicio)
+            if comeco >= fim:
+                return
+            termino = datetime.combine(dia, schedule.hora_fim)
+            if termino >= inicio:
+                yield comeco, termino, schedule
+        dia += timedelta(days=1)
+
+def _occurrence_key(ocorrencia: Tuple[datetime, datetime, Schedule]) -> Tuple:
+    inicio, _, schedule = ocorrencia
+    return (inicio, schedule.prioridade or 0, -schedule.id)
+
+def _conflicts(timelines, *janela) -> List:
+    """Sobreposições com a janela em várias linhas do tempo, na ordem da rotação"""
+    entries = [entry for timeline in timelines for entry in timeline.conflicts(*janela)]
+    entries.sort(key=lambda e: e.sort_key)
+    return entries
 
 class SchedulerService:
     @staticmethod
-    def get_active_content(db: Session) -> Dict:
+    def get_timeline(db: Session, dia: Optional[date] = None) -> ScheduleTimeline:
+        """
+        Retorna a linha do tempo compilada (monta na primeira chamada); `dia`
+        é o primeiro dia consultado, para incluir o histórico se for passado
+        """
+        return timeline_store.get(db, dia)
+    
+    @staticmethod
+    def rebuild_timeline(db: Session) -> ScheduleTimeline:
+        """
+        Recompila a linha do tempo na thread atual, com a sessão informada
+        """
+        return timeline_store.rebuild(db)
+    
+    @staticmethod
+    async def refresh_timeline(db: DbSession) -> ScheduleTimeline:
+        """
+        Recompila a linha do tempo após escritas do admin em uma thread: o
+        event loop segue atendendo os players com a linha do tempo anterior
+        até a troca, e escritas seguidas compartilham uma montagem
+        """
+        bind = db.sync_bind()
+        if bind.dialect.is_async:
+            # Engine assíncrono sem o engine síncrono do mesmo banco
+            return await db.run(timeline_store.rebuild)
+        return await run_in_threadpool(timeline_store.refresh, bind)
+    
+    @staticmethod
+    def get_active_content(db: Session, now: Optional[datetime] = None) -> Dict:
         """
         Retorna o conteúdo ativo para cada região no momento atual
         """
-        now = datetime.now()
-        current_date = now.date()
-        current_time = now.time()
-        current_weekday = now.weekday()  # 0=segunda, 6=domingo
-        
-        # Ajustar para formato 0=domingo
-        current_weekday = (current_weekday + 1) % 7
+        SCHEDULER_LOOKUPS.labels("ativo").inc()
+        now = now or datetime.now()
+        timeline = SchedulerService.get_timeline(db, now.date())
         
         result = {
             "video": None,      # Região 1
@@ -26,20 +89,120 @@ class SchedulerService:
         }
         
         # Buscar conteúdo para cada região
-        for regiao, tipo_media in [(1, "video"), (2, "imagem"), (4, "texto")]:
-            content = SchedulerService._get_content_for_region(
-                db, regiao, current_date, current_time, current_weekday
-            )
-            
-            if regiao == 1:
-                result["video"] = content
-            elif regiao == 2:
-                result["imagem"] = content
-            elif regiao == 4:
-                result["texto"] = content
+        for regiao, tipo_media in REGIOES:
+            result[tipo_media] = timeline.content_at(regiao, now)
         
         return result
     
+    @staticmethod
+    def get_region_content(db: Session, regiao: int, now: Optional[datetime] = None) -> Optional[Dict]:
+        """
+        Retorna o conteúdo ativo de uma única região a partir da linha do tempo
+        """
+        SCHEDULER_LOOKUPS.labels("regiao").inc()
+        now = now or datetime.now()
+        return SchedulerService.get_timeline(db, now.date()).content_at(regiao, now)
+    
+    @staticmethod
+    def get_manifest(db: Session, hours: int = 24, now: Optional[datetime] = None) -> Dict:
+        """
+        Sequência de exibição expandida de todas as regiões para as próximas horas
+        
+        Formato compacto: cada região é uma lista de [início_ms, duração_ms, item],
+        com o início relativo a "inicio" e "item" apontando para a lista "itens"
+        """
+        SCHEDULER_LOOKUPS.labels("manifesto").inc()
+        now = now or datetime.now()
+        fim = now + timedelta(hours=hours)
+        timeline = SchedulerService.get_timeline(db, now.date())
+        
+        itens = []
+        item_index: Dict[int, int] = {}
+        regioes = {}
+        for regiao, _ in REGIOES:
+            sequencia = []
+            for inicio_us, fim_us, entry in timeline.iter_playout(regiao, now, fim):
+                ref = item_index.get(entry.schedule_id)
+                if ref is None:
+                    ref = item_index[entry.schedule_id] = len(itens)
+                    itens.append(entry.to_content())
+                sequencia.append([inicio_us // 1000, (fim_us - inicio_us) // 1000, ref])
+            regioes[str(regiao)] = sequencia
+        
+        return {
+            "inicio": now.isoformat(),
+            "fim": fim.isoformat(),
+            "generation": timeline.generation,
+            "itens": itens,
+            "regioes": regioes
+        }
+    
+    @staticmethod
+    def simulate(
+        db: Session,
+        inicio: datetime,
+        fim: datetime,
+        resolucao: int = 1,
+        regioes: Optional[List[int]] = None
+    ) -> Dict:
+        """
+        Conteúdo ativo de cada região em cada passo de `resolucao` segundos
+        entre `inicio` e `fim` (passo k = inicio + k * resolucao)
+        
+        Calculado por segmento da linha do tempo (ScheduleTimeline.iter_steps):
+        o custo depende do número de passos ou de trocas de conteúdo, o que
+        for menor em cada segmento. A resposta vem em sequências
+        [primeiro_passo, quantidade, item] que cobrem todos os passos; item
+        aponta para a lista "itens" (None = região vazia)
+        """
+        SCHEDULER_LOOKUPS.labels("simulacao").inc()
+        timeline = SchedulerService.get_timeline(db, inicio.date())
+        passo_us = resolucao * 1_000_000
+        janela_us = int((fim - inicio) / timedelta(microseconds=1))
+        passos = -(-janela_us // passo_us)
+        
+        itens = []
+        item_index: Dict[int, int] = {}
+        resultado = {}
+        for regiao in regioes or [regiao for regiao, _ in REGIOES]:
+            sequencias = []
+            atual = None  # última sequência, estendida enquanto o item se repete
+            proximo = 0  # primeiro passo ainda não coberto
+            for primeiro, ultimo, entry in timeline.iter_steps(regiao, inicio, fim, passo_us):
+                ref = item_index.get(entry.schedule_id)
+                if ref is None:
+                    ref = item_index[entry.schedule_id] = len(itens)
+                    itens.append(entry.to_content())
+                if primeiro > proximo:
+                    atual = [proximo, primeiro - proximo, None]
+                    sequencias.append(atual)
+                if atual is not None and atual[2] == ref:
+                    atual[1] += ultimo - primeiro
+                else:
+                    atual = [primeiro, ultimo - primeiro, ref]
+                    sequencias.append(atual)
+                proximo = ultimo
+            if proximo < passos:
+                sequencias.append([proximo, passos - proximo, None])
+            resultado[str(regiao)] = sequencias
+        
+        return {
+            "inicio": inicio.isoformat(),
+            "fim": fim.isoformat(),
+            "resolucao": resolucao,
+            "passos": passos,
+            "generation": timeline.generation,
+            "itens": itens,
+            "regioes": resultado
+        }
+    
+    @staticmethod
+    def get_content_etag(db: Session, regioes: List[int], now: datetime) -> str:
+        """
+        Calcula o ETag do conteúdo ativo das regiões sem serializar a resposta
+        """
+        return SchedulerService.get_timeline(db, now.date()).etag(regioes, now)
+    
     @staticmethod
     def _get_content_for_region(
         db: Session, 
@@ -49,41 +212,69 @@ class SchedulerService:
         current_weekday: int
     ) -> Optional[Dict]:
         """
-        Busca conteúdo ativo para uma região específica
+        Busca conteúdo ativo para uma região específica direto no banco
+        (implementação de referência da linha do tempo compilada)
+        """
+        return SchedulerService._get_content_for_regions(
+            db, [regiao], current_date, current_time, current_weekday
+        )[regiao]
+    
+    @staticmethod
+    def _get_content_for_regions(
+        db: Session,
+        regioes: List[int],
+        current_date: date,
+        current_time: time,
+        current_weekday: int
+    ) -> Dict[int, Optional[Dict]]:
+        """
+        Busca o conteúdo ativo de várias regiões com uma única consulta ao banco
         Implementa rotação automática baseada na ORDEM (prioridade) e duração de cada conteúdo
         Ordem 1 = primeiro a ser exibido, Ordem 2 = segundo, etc.
         """
-        # Query para buscar schedules ativos - ORDENAR POR PRIORIDADE CRESCENTE (ordem)
-        schedules = db.query(Schedule).join(Media).filter(
+        # Query para buscar schedules ativos (com a mídia já carregada)
+        # ORDENAR POR PRIORIDADE CRESCENTE (ordem)
+        schedules = db.query(Schedule).join(Media).options(
+            contains_eager(Schedule.media)
+        ).filter(
             and_(
-                Schedule.regiao == regiao,
+                Schedule.regiao.in_(regioes),
                 Schedule.ativo == True,
                 Media.ativo == True,
                 Schedule.data_inicio <= current_date,
                 Schedule.data_fim >= current_date,
                 Schedule.hora_inicio <= current_time,
-                Schedule.hora_fim >= current_time
+                Schedule.hora_fim >= current_time,
+                # Filtrar por dia da semana direto no SQL (máscara de bits)
+                Schedule.dias_mask.op("&")(1 << current_weekday) != 0
             )
         ).order_by(Schedule.prioridade.asc(), Schedule.id.desc()).all()  # ASC = ordem crescente, ID DESC = mais recente primeiro
         
-        # Filtrar por dia da semana
-        valid_schedules = []
+        # Separar por região mantendo a ordem da consulta
+        por_regiao: Dict[int, List[Schedule]] = {regiao: [] for regiao in regioes}
         for schedule in schedules:
-            dias = [int(d) for d in schedule.dias_semana.split(",")]
-            if current_weekday in dias:
-                valid_schedules.append(schedule)
+            por_regiao[schedule.regiao].append(schedule)
         
+        # Usar timestamp em segundos desde o início do dia
+        seconds_since_midnight = (
+            current_time.hour * 3600 + current_time.minute * 60 + current_time.second
+        )
+        
+        return {
+            regiao: SchedulerService._pick_rotation(valid_schedules, seconds_since_midnight)
+            for regiao, valid_schedules in por_regiao.items()
+        }
+    
+    @staticmethod
+    def _pick_rotation(valid_schedules: List[Schedule], seconds_since_midnight: int) -> Optional[Dict]:
+        """
+        Escolhe o agendamento da vez dentro da rotação de uma região
+        """
         if not valid_schedules:
             return None
         
         # Se houver múltiplos conteúdos, rotacionar baseado na duração (ordem sequencial)
         if len(valid_schedules) > 1:
-            # Calcular qual conteúdo deve ser exibido baseado na duração acumulada
-            now = datetime.now()
-            
-            # Usar timestamp em segundos desde o início do dia
-            seconds_since_midnight = (now.hour * 3600) + (now.minute * 60) + now.second
-            
             # Calcular ciclo total (soma de todas as durações em ordem)
             total_duration = sum(s.duracao for s in valid_schedules)
             
@@ -103,17 +294,14 @@ class SchedulerService:
             schedule = valid_schedules[0]
         
         media = schedule.media
-        
-        # Normalizar caminho do arquivo para usar barras / (URLs)
-        caminho_arquivo = None
-        if media.tipo != "texto" and media.caminho_arquivo:
-            caminho_arquivo = media.caminho_arquivo.replace("\\", "/")
+        caminho_arquivo = media.arquivo_para_regiao(schedule.regiao)
         
         return {
             "id": media.id,
             "tipo": media.tipo,
             "nome": media.nome,
             "caminho_arquivo": caminho_arquivo,
+            "url": media_url(caminho_arquivo, media.sha256) if media.tipo in TIPOS_COM_ARQUIVO else None,
             "texto": media.texto if media.tipo == "texto" else None,
             "duracao": schedule.duracao,
             "schedule_id": schedule.id
@@ -127,15 +315,30 @@ class SchedulerService:
         data_inicio: date,
         data_fim: date,
         hora_inicio: time,
-        hora_fim: time,
-        exclude_schedule_id: Optional[int] = None
+        hora_fim: time
     ) -> tuple[bool, Optional[str]]:
         """
-        Valida se um agendamento pode ser criado (verifica conflitos)
+        Valida se um agendamento pode ser gravado (mídia compatível com a
+        região, datas e horários); sobreposições são listadas por find_conflicts
         Retorna (is_valid, error_message)
         """
         # Buscar media para validar tipo vs região
         media = db.query(Media).filter(Media.id == media_id).first()
+        return SchedulerService.check_schedule(media, regiao, data_inicio, data_fim, hora_inicio, hora_fim)
+    
+    @staticmethod
+    def check_schedule(
+        media: Optional[Media],
+        regiao: int,
+        data_inicio: date,
+        data_fim: date,
+        hora_inicio: time,
+        hora_fim: time
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Validação em memória, com a mídia já carregada (usada também pelos
+        endpoints em lote, que carregam todas as mídias de uma vez)
+        """
         if not media:
             return False, "Mídia não encontrada"
         
@@ -159,28 +362,156 @@ class SchedulerService:
         return True, None
     
     @staticmethod
-    def get_next_content(db: Session, regiao: int, hours_ahead: int = 24) -> List[Dict]:
+    def find_conflicts(
+        db: Session,
+        regiao: int,
+        data_inicio: date,
+        data_fim: date,
+        hora_inicio: time,
+        hora_fim: time,
+        dias_semana: str = "0,1,2,3,4,5,6",
+        exclude_schedule_id: Optional[int] = None
+    ) -> List[Dict]:
         """
-        Retorna lista de conteúdos agendados para as próximas X horas
+        Lista os agendamentos ativos da região que se sobrepõem à janela
+        (datas, horários e dias da semana) usando o índice da linha do tempo
         """
-        from datetime import timedelta
-        
-        now = datetime.now()
-        future = now + timedelta(hours=hours_ahead)
+        timelines = SchedulerService.get_conflict_timelines(
+            db, [regiao], data_inicio, data_fim, hora_inicio, hora_fim
+        )
+        entries = _conflicts(
+            timelines,
+            regiao,
+            data_inicio,
+            data_fim,
+            hora_inicio,
+            hora_fim,
+            parse_dias_semana(dias_semana),
+            exclude_schedule_id
+        )
+        return [entry.to_conflict() for entry in entries]
+    
+    @staticmethod
+    def get_conflict_timelines(
+        db: Session,
+        regioes,
+        data_inicio: date,
+        data_fim: date,
+        hora_inicio: Optional[time] = None,
+        hora_fim: Optional[time] = None
+    ) -> Tuple[ScheduleTimeline, ScheduleTimeline]:
+        """
+        Linha do tempo compilada e, para janelas que começam antes dela, os
+        agendamentos já encerrados que cruzam a janela (só esses, do banco)
+        """
+        timeline = SchedulerService.get_timeline(db)
+        return timeline, timeline.history(db, regioes, data_inicio, data_fim, hora_inicio, hora_fim)
+    
+    @staticmethod
+    def find_batch_conflicts(timelines, schedules: List[Schedule]) -> List[List[Dict]]:
+        """
+        Conflitos de cada agendamento de um lote novo (já com id, antes do
+        commit): os agendamentos existentes, pelas linhas do tempo obtidas
+        antes de o lote entrar na sessão (get_conflict_timelines), e os outros
+        itens ativos do lote, com a posição (`indice`) no lote
+        """
+        lote = ScheduleTimeline.from_schedules(schedules)
+        posicao = {schedule.id: indice for indice, schedule in enumerate(schedules)}
+        result = []
+        for schedule in schedules:
+            janela = (
+                schedule.regiao,
+                schedule.data_inicio,
+                schedule.data_fim,
+                schedule.hora_inicio,
+                schedule.hora_fim,
+                schedule.dias_mask
+            )
+            conflitos = [entry.to_conflict() for entry in _conflicts(timelines, *janela)]
+            conflitos.extend(
+                {**entry.to_conflict(), "indice": posicao[entry.schedule_id]}
+                for entry in lote.conflicts(*janela, exclude_schedule_id=schedule.id)
+            )
+            result.append(conflitos)
+        return result
+    
+    @staticmethod
+    def iter_occurrences(
+        db: Session,
+        regiao: int,
+        inicio: datetime,
+        fim: datetime,
+        depois_de: Optional[Tuple] = None
+    ) -> Iterator[Tuple[datetime, datetime, Schedule]]:
+        """
+        Ocorrências (início, fim, agendamento) da região que terminam a partir
+        de `inicio` e começam antes de `fim`, em ordem de início (empates na
+        ordem da rotação: prioridade, depois o mais recente)
         
-        schedules = db.query(Schedule).join(Media).filter(
+        Cada agendamento gera as suas ocorrências dia a dia, sob demanda, e
+        um heap intercala todas elas: parar de consumir (paginação) para a
+        expansão, então o custo não depende do tamanho do horizonte.
+        `depois_de` é a chave (início, prioridade, schedule_id) da última
+        ocorrência já entregue
+        """
+        schedules = db.query(Schedule).join(Media).options(
+            contains_eager(Schedule.media)
+        ).filter(
             and_(
                 Schedule.regiao == regiao,
                 Schedule.ativo == True,
                 Media.ativo == True,
-                Schedule.data_inicio <= future.date(),
-                Schedule.data_fim >= now.date()
+                Schedule.data_inicio <= fim.date(),
+                Schedule.data_fim >= inicio.date()
             )
-        ).order_by(Schedule.data_inicio, Schedule.hora_inicio).all()
+        ).all()
         
-        result = []
-        for schedule in schedules:
-            result.append({
+        primeiro_dia = (depois_de[0] if depois_de else inicio).date()
+        merged = heapq.merge(
+            *(_occurrences(schedule, inicio, fim, primeiro_dia) for schedule in schedules),
+            key=_occurrence_key
+        )
+        if depois_de is None:
+            return merged
+        
+        inicio_cursor, prioridade, schedule_id = depois_de
+        ultima = (inicio_cursor, prioridade, -schedule_id)
+        return itertools.dropwhile(lambda ocorrencia: _occurrence_key(ocorrencia) <= ultima, merged)
+    
+    @staticmethod
+    def get_next_content(
+        db: Session,
+        regiao: int,
+        hours_ahead: int = 24,
+        now: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Ocorrências da região nas próximas X horas (a que está em exibição
+        incluída) e o cursor da próxima página (None na última). Sem `limit`,
+        retorna todas; cursor inválido gera ValueError
+        """
+        SCHEDULER_LOOKUPS.labels("proximos").inc()
+        now = now or datetime.now()
+        depois_de = decode_values(cursor, (datetime, int, int)) if cursor else None
+        ocorrencias = SchedulerService.iter_occurrences(
+            db, regiao, now, now + timedelta(hours=hours_ahead), depois_de
+        )
+        
+        # Uma ocorrência a mais indica se existe próxima página
+        pagina = list(itertools.islice(ocorrencias, limit + 1 if limit else None))
+        next_cursor = None
+        if limit and len(pagina) > limit:
+            pagina = pagina[:limit]
+            inicio, _, schedule = pagina[-1]
+            next_cursor = encode_cursor([inicio, schedule.prioridade or 0, schedule.id])
+        
+        return [
+            {
+                "inicio": inicio.isoformat(),
+                "fim": fim.isoformat(),
+                "em_exibicao": inicio <= now,
                 "schedule_id": schedule.id,
                 "media_id": schedule.media.id,
                 "nome": schedule.media.nome,
@@ -190,7 +521,8 @@ class SchedulerService:
                 "hora_inicio": schedule.hora_inicio.isoformat(),
                 "hora_fim": schedule.hora_fim.isoformat(),
                 "dias_semana": schedule.dias_semana,
-                "prioridade": schedule.prioridade
-            })
-        
-        return result
+                "prioridade": schedule.prioridade,
+                "duracao": schedule.duracao
+            }
+            for inicio, fim, schedule in pagina
+        ], next_cursor
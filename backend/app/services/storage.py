@@ -0,0 +1,395 @@
+"""
+Gravação dos arquivos enviados no UPLOAD_DIR
+
+O corpo multipart do upload é lido direto do stream da requisição (sem o
+parser de formulários do Starlette, que guarda o arquivo inteiro em um
+temporário antes do endpoint rodar): cada bloco do arquivo é escrito (e
+somado ao SHA-256) em uma thread, em um temporário de objects/incoming que
+só é renomeado quando o envio termina. O tamanho máximo é conferido pelo
+Content-Length antes de ler o corpo e a cada bloco recebido.
+
+Os arquivos ficam endereçados pelo conteúdo (UPLOAD_DIR/objects/ab/<sha256>.ext):
+enviar o mesmo arquivo de novo cria apenas outra mídia apontando para o
+mesmo blob, e o arquivo só é apagado quando nenhuma mídia o usa mais.
+
+O espaço ocupado é mantido em um contador (tabela storage_usage), ajustado na
+mesma transação em que um arquivo é registrado ou removido; o diretório só é
+percorrido uma vez, para criar o contador em bancos que ainda não o têm.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..models import MediaBlob, StorageUsage
+from .metrics import UPLOAD_BYTES, UPLOAD_SECONDS
+
+try:
+    import python_multipart as multipart
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    # python-multipart < 0.0.13
+    import multipart
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import parse_options_header
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+# Tamanho de cada bloco lido do upload
+CHUNK_SIZE = 1024 * 1024
+# Tamanho máximo aceito por arquivo (bytes), padrão 2 GiB
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(2 * 1024 ** 3)))
+# Tamanho máximo de cada campo de texto do formulário de upload
+MAX_FIELD_SIZE = 64 * 1024
+# Folga do Content-Length sobre MAX_UPLOAD_SIZE (campos de texto e cabeçalhos das partes)
+FORM_OVERHEAD = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """O arquivo passou do tamanho máximo durante o envio"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Arquivo maior que o limite de {max_size} bytes")
+        self.max_size = max_size
+
+
+class InvalidUpload(ValueError):
+    """Corpo do upload inválido (não é multipart, sem arquivo, campo grande demais)"""
+
+
+def file_size(caminho: str) -> int:
+    """
+    Tamanho do arquivo, ou 0 se ele não existe
+    """
+    try:
+        return os.path.getsize(caminho)
+    except OSError:
+        return 0
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    caminho: str
+    sha256: str
+    tamanho: int
+
+
+@dataclass(frozen=True)
+class ReceivedForm:
+    """Formulário de upload recebido: campos de texto e o arquivo (em objects/incoming)"""
+    campos: Dict[str, str]
+    arquivo: StoredFile
+    nome_arquivo: str
+
+
+def _write_chunk(out, hasher, chunk: bytes):
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+def _finish(out):
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+
+async def receive_form(
+    request: Request,
+    diretorio: str,
+    max_size: int = MAX_UPLOAD_SIZE,
+    campo_arquivo: str = "file",
+    chunk_size: int = CHUNK_SIZE
+) -> ReceivedForm:
+    """
+    Lê o corpo multipart/form-data do stream da requisição: os campos de
+    texto ficam em memória e o arquivo de `campo_arquivo` vai direto, em
+    blocos, para um temporário em `diretorio`, com o SHA-256 calculado no
+    mesmo passo. Em caso de erro ou de tamanho excedido o temporário é
+    removido; corpo inválido gera InvalidUpload
+    """
+    tipo, opcoes = parse_options_header(request.headers.get("content-type", ""))
+    boundary = opcoes.get(b"boundary")
+    if tipo != b"multipart/form-data" or not boundary:
+        raise InvalidUpload("Envie o arquivo como multipart/form-data")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_size + FORM_OVERHEAD:
+        # Recusado antes de ler o corpo
+        raise UploadTooLarge(max_size)
+
+    campos: Dict[str, str] = {}
+    headers: Dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+    parte: Dict[str, object] = {}
+    pendente = []  # blocos do arquivo recebidos e ainda não gravados
+    estado = {"out": None, "caminho": None, "nome_arquivo": None, "tamanho": 0, "pendente": 0}
+    hasher = hashlib.sha256()
+
+    def on_part_begin():
+        headers.clear()
+        parte.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, disposicao = parse_options_header(headers.get(b"content-disposition", b""))
+        nome = disposicao.get(b"name", b"").decode("utf-8", "replace")
+        parte["nome"] = nome
+        if nome == campo_arquivo and b"filename" in disposicao:
+            if estado["out"] is not None:
+                raise InvalidUpload("Envie um único arquivo")
+            os.makedirs(diretorio, exist_ok=True)
+            fd, estado["caminho"] = tempfile.mkstemp(dir=diretorio, suffix=".part")
+            estado["out"] = os.fdopen(fd, "wb")
+            estado["nome_arquivo"] = disposicao[b"filename"].decode("utf-8", "replace")
+            parte["arquivo"] = True
+        else:
+            parte["valor"] = bytearray()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if parte.get("arquivo"):
+            estado["tamanho"] += end - start
+            if estado["tamanho"] > max_size:
+                raise UploadTooLarge(max_size)
+            pendente.append(data[start:end])
+            estado["pendente"] += end - start
+        else:
+            valor = parte["valor"]
+            valor.extend(data[start:end])
+            if len(valor) > MAX_FIELD_SIZE:
+                raise InvalidUpload(f"Campo '{parte['nome']}' maior que {MAX_FIELD_SIZE} bytes")
+
+    def on_part_end():
+        if "valor" in parte:
+            campos[parte["nome"]] = parte["valor"].decode("utf-8", "replace")
+
+    parser = multipart.MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    async def flush():
+        bloco = b"".join(pendente)
+        pendente.clear()
+        estado["pendente"] = 0
+        await run_in_threadpool(_write_chunk, estado["out"], hasher, bloco)
+
+    inicio = time.perf_counter()
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except FormParserError as e:
+                raise InvalidUpload(f"Corpo multipart inválido: {e}")
+            if estado["pendente"] >= chunk_size:
+                await flush()
+        parser.finalize()
+        if estado["out"] is None:
+            raise InvalidUpload("Arquivo é obrigatório")
+        if pendente:
+            await flush()
+        await run_in_threadpool(_finish, estado["out"])
+    except BaseException:
+        if estado["out"] is not None:
+            estado["out"].close()
+            if os.path.exists(estado["caminho"]):
+                os.remove(estado["caminho"])
+        raise
+
+    UPLOAD_BYTES.inc(estado["tamanho"])
+    UPLOAD_SECONDS.observe(time.perf_counter() - inicio)
+    return ReceivedForm(
+        campos=campos,
+        arquivo=StoredFile(caminho=estado["caminho"], sha256=hasher.hexdigest(), tamanho=estado["tamanho"]),
+        nome_arquivo=estado["nome_arquivo"]
+    )
+
+
+class BlobStore:
+    """
+    Armazenamento por conteúdo com contagem de referências (tabela media_blob)
+    """
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = root
+
+    @property
+    def incoming_dir(self) -> str:
+        return os.path.join(self.root, "objects", "incoming")
+
+    def blob_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], f"{sha256}{ext}")
+
+    async def receive(self, request: Request, max_size: int = MAX_UPLOAD_SIZE) -> ReceivedForm:
+        """
+        Recebe o formulário de upload, com o arquivo em um temporário de
+        objects/incoming (sem acessar o banco)
+        """
+        return await receive_form(request, self.incoming_dir, max_size)
+
+    @staticmethod
+    def discard(stored: StoredFile):
+        """
+        Remove o temporário de um upload recebido e não registrado
+        """
+        if os.path.exists(stored.caminho):
+            os.remove(stored.caminho)
+
+    def register(self, db: Session, stored: StoredFile, ext: str) -> MediaBlob:
+        """
+        Move o temporário recebido para o blob do seu hash e retorna o blob com
+        uma referência a mais; se o conteúdo já existe, o temporário é
+        descartado sem nova gravação (o chamador faz o commit)
+        """
+        # Upsert da referência: uploads iguais simultâneos somam no mesmo
+        # registro, e a escrita trava o banco até o commit do chamador (as
+        # decisões sobre o arquivo abaixo não correm com outro register nem
+        # com remove_released)
+        statement = sqlite_insert(MediaBlob).values(
+            sha256=stored.sha256,
+            caminho=self.blob_path(stored.sha256, ext),
+            tamanho=stored.tamanho,
+            ref_count=1
+        )
+        blob = db.scalars(
+            statement.on_conflict_do_update(
+                index_elements=[MediaBlob.sha256],
+                set_={"ref_count": MediaBlob.ref_count + 1}
+            ).returning(MediaBlob),
+            execution_options={"populate_existing": True}
+        ).one()
+
+        if os.path.exists(blob.caminho):
+            os.remove(stored.caminho)
+            return blob
+
+        # Conteúdo novo (ou arquivo removido à mão): grava no caminho do blob
+        os.makedirs(os.path.dirname(blob.caminho), exist_ok=True)
+        os.replace(stored.caminho, blob.caminho)
+        disk_usage.add(db, stored.tamanho, 1)
+        return blob
+
+    def release(self, db: Session, sha256: Optional[str], caminho: Optional[str]) -> Optional[str]:
+        """
+        Remove uma referência ao blob; retorna o caminho a apagar (após o commit)
+        quando nenhuma mídia usa mais o arquivo, ou None
+        """
+        blob = db.get(MediaBlob, sha256) if sha256 else None
+        if blob is None or blob.caminho != caminho:
+            # Mídia antiga, gravada fora do armazenamento por conteúdo
+            return caminho
+        blob.ref_count -= 1
+        if blob.ref_count > 0:
+            return None
+        db.delete(blob)
+        return blob.caminho
+
+    def remove_released(self, db: Session, caminho: Optional[str], derivados: List[str]):
+        """
+        Apaga o arquivo solto por release (após o commit) e suas versões
+        reduzidas, descontando-os do contador. O desconto trava o banco para
+        escrita até o commit, então um register do mesmo conteúdo espera; se
+        o conteúdo foi registrado de novo antes disso, nada é apagado
+        """
+        arquivos = [c for c in [caminho, *derivados] if c and os.path.exists(c)]
+        if not arquivos:
+            return
+        disk_usage.add(db, -sum(file_size(c) for c in arquivos), -len(arquivos))
+        em_uso = db.scalar(select(MediaBlob.sha256).where(MediaBlob.caminho == caminho).limit(1))
+        if em_uso is not None:
+            db.rollback()
+            return
+        for arquivo in arquivos:
+            try:
+                os.remove(arquivo)
+            except OSError as e:
+                print(f"Erro ao remover arquivo: {e}")
+        db.commit()
+
+
+class DiskUsage:
+    """
+    Contador do espaço ocupado no UPLOAD_DIR (bytes e número de arquivos)
+    """
+
+    _USAGE_ID = 1
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = root
+
+    def add(self, db: Session, bytes_usados: int, arquivos: int):
+        """
+        Soma (ou subtrai) ao contador; o chamador faz o commit. Sem a linha do
+        contador não faz nada: ela será criada já com a contagem completa
+        """
+        if not bytes_usados and not arquivos:
+            return
+        db.execute(
+            update(StorageUsage)
+            .where(StorageUsage.id == self._USAGE_ID)
+            .values(
+                bytes_usados=StorageUsage.bytes_usados + bytes_usados,
+                arquivos=StorageUsage.arquivos + arquivos,
+                atualizado_em=datetime.utcnow()
+            )
+        )
+
+    def get(self, db: Session) -> Dict:
+        """
+        Valor atual do contador, criado na primeira chamada
+        """
+        usage = db.get(StorageUsage, self._USAGE_ID)
+        if usage is None:
+            usage = self.rebuild(db)
+        return {"bytes": usage.bytes_usados, "arquivos": usage.arquivos}
+
+    def rebuild(self, db: Session) -> StorageUsage:
+        """
+        Percorre o UPLOAD_DIR e grava a contagem completa (sem os uploads em
+        andamento, em objects/incoming)
+        """
+        incoming = os.path.join(os.path.abspath(self.root), "objects", "incoming")
+        bytes_usados = arquivos = 0
+        for diretorio, subdiretorios, nomes in os.walk(self.root):
+            if os.path.abspath(diretorio) == incoming:
+                subdiretorios[:] = []
+                continue
+            for nome in nomes:
+                bytes_usados += file_size(os.path.join(diretorio, nome))
+                arquivos += 1
+
+        usage = db.get(StorageUsage, self._USAGE_ID) or StorageUsage(id=self._USAGE_ID)
+        usage.bytes_usados = bytes_usados
+        usage.arquivos = arquivos
+        usage.atualizado_em = datetime.utcnow()
+        db.add(usage)
+        db.commit()
+        return usage
+
+
+disk_usage = DiskUsage()
+blob_store = BlobStore()
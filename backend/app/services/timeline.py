@@ -0,0 +1,674 @@
+"""
+Linha do tempo compilada dos agendamentos
+
+Os agendamentos mudam poucas vezes por dia, mas o player consulta o conteúdo
+ativo a cada poucos segundos. A ScheduleTimeline é montada uma única vez a
+partir das tabelas Schedule/Media e responde "o que está na região N no
+instante T" sem acessar o banco.
+"""
+import secrets
+import threading
+import weakref
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, date, time, timedelta
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..database import sync_bind
+from ..models import Media, Schedule, TODOS_OS_DIAS, arquivo_para_regiao, format_dias_semana
+from .interval_index import IntervalIndex
+from .metrics import TIMELINE_BUILDS, TIMELINE_CACHE
+from .media_files import TIPOS_COM_ARQUIVO, media_url
+
+# Quantos planos diários manter em memória por linha do tempo
+MAX_DAY_PLANS = 16
+
+# Identifica o processo nos ETags: a geração recomeça em 1 a cada início, e
+# um ETag guardado pelo player antes de um reinício não pode voltar a valer
+INSTANCIA = secrets.token_hex(4)
+
+
+def time_to_us(t: time) -> int:
+    """
+    Converte um horário em microssegundos desde a meia-noite
+    """
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond
+
+
+def us_to_time(us: int) -> time:
+    """
+    Converte microssegundos desde a meia-noite de volta em horário
+    """
+    seconds, micro = divmod(us, 1_000_000)
+    return time(seconds // 3600, (seconds // 60) % 60, seconds % 60, micro)
+
+
+def weekday_of(d: date) -> int:
+    """
+    Dia da semana no formato do agendamento (0=domingo, 6=sábado)
+    """
+    return (d.weekday() + 1) % 7
+
+
+def weekdays_between(inicio: date, fim: date) -> int:
+    """
+    Máscara dos dias da semana que ocorrem entre duas datas (inclusivas)
+    """
+    if (fim - inicio).days >= 6:
+        return TODOS_OS_DIAS
+    mask = 0
+    d = inicio
+    while d <= fim:
+        mask |= 1 << weekday_of(d)
+        d += timedelta(days=1)
+    return mask
+
+
+@dataclass(frozen=True)
+class TimelineEntry:
+    """
+    Agendamento já resolvido, com os dados da mídia embutidos
+    """
+    schedule_id: int
+    media_id: int
+    regiao: int
+    data_inicio: date
+    data_fim: date
+    inicio_us: int  # inclusivo
+    fim_us: int  # exclusivo
+    dias_mask: int
+    prioridade: int
+    duracao: int
+    tipo: str
+    nome: str
+    caminho_arquivo: Optional[str]
+    texto: Optional[str]
+    url: Optional[str] = None  # URL imutável do arquivo (/media/...)
+
+    @property
+    def sort_key(self) -> Tuple[int, int]:
+        # Mesma ordenação da consulta original: prioridade ASC, id DESC
+        return (self.prioridade, -self.schedule_id)
+
+    def applies_on(self, d: date) -> bool:
+        return (
+            self.data_inicio <= d <= self.data_fim
+            and bool(self.dias_mask & (1 << weekday_of(d)))
+        )
+
+    def overlaps(
+        self,
+        data_inicio: date,
+        data_fim: date,
+        inicio_us: int,
+        fim_us: int,
+        dias_mask: int
+    ) -> bool:
+        """
+        Verifica se este agendamento é exibido em algum momento da janela
+        """
+        if inicio_us >= self.fim_us or self.inicio_us >= fim_us:
+            return False
+        comum_inicio = max(self.data_inicio, data_inicio)
+        comum_fim = min(self.data_fim, data_fim)
+        if comum_inicio > comum_fim:
+            return False
+        return bool(self.dias_mask & dias_mask & weekdays_between(comum_inicio, comum_fim))
+
+    def to_conflict(self) -> Dict:
+        return {
+            "schedule_id": self.schedule_id,
+            "media_id": self.media_id,
+            "nome": self.nome,
+            "data_inicio": self.data_inicio.isoformat(),
+            "data_fim": self.data_fim.isoformat(),
+            "hora_inicio": us_to_time(self.inicio_us).isoformat(),
+            "hora_fim": us_to_time(self.fim_us - 1).isoformat(),
+            "dias_semana": format_dias_semana(self.dias_mask),
+            "prioridade": self.prioridade
+        }
+
+    def to_content(self) -> Dict:
+        return {
+            "id": self.media_id,
+            "tipo": self.tipo,
+            "nome": self.nome,
+            "caminho_arquivo": self.caminho_arquivo,
+            "url": self.url,
+            "texto": self.texto,
+            "duracao": self.duracao,
+            "schedule_id": self.schedule_id
+        }
+
+
+@dataclass(frozen=True)
+class RotationCycle:
+    """
+    Conjunto de agendamentos simultâneos e seus limites acumulados de rotação
+    """
+    entries: Tuple[TimelineEntry, ...]
+    limites: Tuple[int, ...]  # soma acumulada das durações
+    total: int
+    # Posições de um ciclo completo em microssegundos: (início, fim, agendamento)
+    slots: Tuple[Tuple[int, int, TimelineEntry], ...] = ()
+
+    def pick(self, seconds_since_midnight: int) -> Tuple[int, TimelineEntry]:
+        """
+        Retorna (posição na rotação, agendamento) para o segundo do dia informado
+        """
+        if len(self.entries) == 1 or self.total <= 0:
+            return 0, self.entries[0]
+        index = bisect_right(self.limites, seconds_since_midnight % self.total)
+        return index, self.entries[index]
+
+    def next_slot(self, seconds_since_midnight: int) -> Optional[int]:
+        """
+        Segundo do dia em que a posição atual da rotação termina
+        """
+        if len(self.entries) == 1 or self.total <= 0:
+            return None
+        posicao = seconds_since_midnight % self.total
+        index = bisect_right(self.limites, posicao)
+        return seconds_since_midnight - posicao + self.limites[index]
+
+
+@dataclass(frozen=True)
+class DayPlan:
+    """
+    Segmentos do dia de uma região: pontos[i] marca o início do segmento i
+    """
+    pontos: Tuple[int, ...]
+    ciclos: Tuple[Optional[RotationCycle], ...]
+
+    def cycle_at(self, instant_us: int) -> Optional[RotationCycle]:
+        index = bisect_right(self.pontos, instant_us) - 1
+        if index < 0:
+            return None
+        return self.ciclos[index]
+
+    def segment_end(self, instant_us: int) -> Optional[int]:
+        """
+        Início do próximo segmento (em microssegundos), ou None se não houver
+        """
+        index = bisect_right(self.pontos, instant_us)
+        if index >= len(self.pontos):
+            return None
+        return self.pontos[index]
+
+
+def _build_cycle(entries) -> Optional[RotationCycle]:
+    if not entries:
+        return None
+    ordered = tuple(sorted(entries, key=lambda e: e.sort_key))
+    limites = []
+    slots = []
+    acumulado = 0
+    for entry in ordered:
+        if entry.duracao > 0:
+            slots.append((acumulado * 1_000_000, (acumulado + entry.duracao) * 1_000_000, entry))
+        acumulado += entry.duracao
+        limites.append(acumulado)
+    return RotationCycle(
+        entries=ordered, limites=tuple(limites), total=acumulado, slots=tuple(slots)
+    )
+
+
+def _build_day_plan(entries) -> DayPlan:
+    """
+    Varre os horários do dia e resolve o ciclo de rotação de cada segmento
+    """
+    eventos: Dict[int, List[Tuple[bool, TimelineEntry]]] = {}
+    for entry in entries:
+        if entry.inicio_us < entry.fim_us:
+            eventos.setdefault(entry.inicio_us, []).append((True, entry))
+            eventos.setdefault(entry.fim_us, []).append((False, entry))
+
+    pontos = sorted(eventos)
+    ciclos = []
+    ativos = set()
+    for ponto in pontos:
+        for entra, entry in eventos[ponto]:
+            if entra:
+                ativos.add(entry)
+            else:
+                ativos.discard(entry)
+        ciclos.append(_build_cycle(ativos))
+    return DayPlan(pontos=tuple(pontos), ciclos=tuple(ciclos))
+
+
+class ScheduleTimeline:
+    """
+    Visão imutável dos agendamentos ativos, agrupados por região
+    """
+
+    def __init__(self, entries, generation: int = 0, desde: Optional[date] = None):
+        por_regiao: Dict[int, List[TimelineEntry]] = {}
+        for entry in entries:
+            por_regiao.setdefault(entry.regiao, []).append(entry)
+        # Índice de intervalos por região sobre as datas (em ordinais)
+        self._regions: Dict[int, IntervalIndex] = {
+            regiao: IntervalIndex(
+                (e.data_inicio.toordinal(), e.data_fim.toordinal(), e) for e in regiao_entries
+            )
+            for regiao, regiao_entries in por_regiao.items()
+        }
+        self.generation = generation
+        # Primeiro dia coberto (None = todo o histórico): agendamentos encerrados
+        # antes dele ficaram de fora
+        self.desde = desde
+        # Cache derivado (não altera o conteúdo da linha do tempo)
+        self._day_plans: Dict[Tuple[int, date], DayPlan] = {}
+
+    @classmethod
+    def build(cls, db: Session, generation: int = 0, desde: Optional[date] = None) -> "ScheduleTimeline":
+        """
+        Monta a linha do tempo com uma única consulta ao banco; com `desde`,
+        ignora os agendamentos encerrados antes desse dia (o histórico não
+        volta a ser exibido e é a maior parte da tabela)
+        
+        Lê só as colunas usadas, sem montar objetos do ORM
+        """
+        consulta = cls._select()
+        if desde is not None:
+            consulta = consulta.where(Schedule.data_fim >= desde)
+        return cls([cls._entry_from_row(row) for row in db.execute(consulta)], generation, desde)
+
+    def history(
+        self,
+        db: Session,
+        regioes,
+        data_inicio: date,
+        data_fim: date,
+        hora_inicio: Optional[time] = None,
+        hora_fim: Optional[time] = None
+    ) -> "ScheduleTimeline":
+        """
+        Linha do tempo à parte com os agendamentos encerrados antes de `desde`
+        (fora desta) que cruzam a janela nas regiões: uma consulta pela
+        janela no índice de (regiao, ativo, data_fim, data_inicio, horários),
+        não uma montagem do histórico inteiro. Vazia se esta já cobre `data_inicio`
+        """
+        if self.covers(data_inicio):
+            return ScheduleTimeline([], self.generation, data_inicio)
+        consulta = self._select().where(
+            Schedule.regiao.in_(list(regioes)),
+            Schedule.data_fim >= data_inicio,
+            Schedule.data_fim < self.desde,
+            Schedule.data_inicio <= data_fim
+        )
+        if hora_inicio is not None and hora_fim is not None:
+            consulta = consulta.where(Schedule.hora_inicio <= hora_fim, Schedule.hora_fim >= hora_inicio)
+        return ScheduleTimeline(
+            [self._entry_from_row(row) for row in db.execute(consulta)], self.generation, data_inicio
+        )
+
+    @staticmethod
+    def _select():
+        return select(
+            Schedule.id, Schedule.media_id, Schedule.regiao,
+            Schedule.data_inicio, Schedule.data_fim, Schedule.hora_inicio, Schedule.hora_fim,
+            Schedule.dias_mask, Schedule.prioridade, Schedule.duracao,
+            Media.tipo, Media.nome, Media.caminho_arquivo, Media.texto, Media.sha256, Media.derivados
+        ).join(Media, Schedule.media_id == Media.id).where(
+            Schedule.ativo == True,
+            Media.ativo == True
+        )
+
+    @classmethod
+    def from_schedules(cls, schedules) -> "ScheduleTimeline":
+        """
+        Linha do tempo só com os agendamentos informados (já com id e mídia),
+        como os de um lote ainda não gravado
+        """
+        return cls([
+            cls._entry_from_row((
+                s.id, s.media_id, s.regiao, s.data_inicio, s.data_fim, s.hora_inicio, s.hora_fim,
+                s.dias_mask, s.prioridade, s.duracao, s.media.tipo, s.media.nome,
+                s.media.caminho_arquivo, s.media.texto, s.media.sha256, s.media.derivados
+            ))
+            for s in schedules if s.ativo and s.media.ativo
+        ])
+
+    @staticmethod
+    def _entry_from_row(row) -> TimelineEntry:
+        (schedule_id, media_id, regiao, data_inicio, data_fim, hora_inicio, hora_fim,
+         dias_mask, prioridade, duracao, tipo, nome, caminho_arquivo, texto, sha256, derivados) = row
+        caminho = arquivo_para_regiao(tipo, caminho_arquivo, derivados, regiao)
+        return TimelineEntry(
+            schedule_id=schedule_id,
+            media_id=media_id,
+            regiao=regiao,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            inicio_us=time_to_us(hora_inicio),
+            fim_us=time_to_us(hora_fim) + 1,
+            dias_mask=dias_mask,
+            prioridade=prioridade or 0,  # nula (PUT com null) vem antes, como no ORDER BY
+            duracao=duracao or 0,
+            tipo=tipo,
+            nome=nome,
+            caminho_arquivo=caminho,
+            texto=texto if tipo == "texto" else None,
+            url=media_url(caminho, sha256) if tipo in TIPOS_COM_ARQUIVO else None
+        )
+
+    def covers(self, d: date) -> bool:
+        """
+        Indica se a linha do tempo tem todos os agendamentos que valem no dia
+        """
+        return self.desde is None or d >= self.desde
+
+    @property
+    def regions(self) -> Tuple[int, ...]:
+        return tuple(sorted(self._regions))
+
+    def day_plan(self, regiao: int, d: date) -> DayPlan:
+        key = (regiao, d)
+        plan = self._day_plans.get(key)
+        if plan is None:
+            index = self._regions.get(regiao)
+            candidates = index.stab(d.toordinal()) if index else []
+            entries = [e for e in candidates if e.applies_on(d)]
+            plan = _build_day_plan(entries)
+            if len(self._day_plans) >= MAX_DAY_PLANS:
+                self._day_plans.clear()
+            self._day_plans[key] = plan
+        return plan
+
+    def conflicts(
+        self,
+        regiao: int,
+        data_inicio: date,
+        data_fim: date,
+        hora_inicio: time,
+        hora_fim: time,
+        dias_mask: int = TODOS_OS_DIAS,
+        exclude_schedule_id: Optional[int] = None
+    ) -> List[TimelineEntry]:
+        """
+        Retorna os agendamentos da região que se sobrepõem à janela informada
+        (datas × horários × dias da semana)
+        """
+        index = self._regions.get(regiao)
+        if index is None:
+            return []
+        inicio_us = time_to_us(hora_inicio)
+        fim_us = time_to_us(hora_fim) + 1
+        result = [
+            e for e in index.overlapping(data_inicio.toordinal(), data_fim.toordinal())
+            if e.schedule_id != exclude_schedule_id
+            and e.overlaps(data_inicio, data_fim, inicio_us, fim_us, dias_mask)
+        ]
+        result.sort(key=lambda e: e.sort_key)
+        return result
+
+    def resolve(self, regiao: int, instant: datetime) -> Optional[Tuple[int, TimelineEntry]]:
+        """
+        Retorna (posição na rotação, agendamento) ativo na região no instante
+        """
+        cycle = self.day_plan(regiao, instant.date()).cycle_at(time_to_us(instant.time()))
+        if cycle is None:
+            return None
+        seconds_since_midnight = instant.hour * 3600 + instant.minute * 60 + instant.second
+        return cycle.pick(seconds_since_midnight)
+
+    def next_change(self, regiao: int, instant: datetime) -> datetime:
+        """
+        Próximo instante em que o conteúdo da região pode mudar: fim do
+        segmento de horário, fim da posição atual na rotação ou meia-noite
+        """
+        meia_noite = datetime.combine(instant.date(), time.min)
+        instant_us = time_to_us(instant.time())
+        plan = self.day_plan(regiao, instant.date())
+
+        limite_us = 86400 * 1_000_000
+        fim_segmento = plan.segment_end(instant_us)
+        if fim_segmento is not None:
+            limite_us = min(limite_us, fim_segmento)
+
+        cycle = plan.cycle_at(instant_us)
+        if cycle is not None:
+            seconds_since_midnight = instant_us // 1_000_000
+            proximo_slot = cycle.next_slot(seconds_since_midnight)
+            if proximo_slot is not None:
+                limite_us = min(limite_us, proximo_slot * 1_000_000)
+
+        return meia_noite + timedelta(microseconds=limite_us)
+
+    def iter_playout(self, regiao: int, inicio: datetime, fim: datetime):
+        """
+        Gera a sequência de exibição da região entre dois instantes, em ordem:
+        (início, fim, agendamento), com os tempos em microssegundos relativos a
+        `inicio`. Faixas sem conteúdo simplesmente não aparecem.
+        """
+        janela_fim = int((fim - inicio) / timedelta(microseconds=1))
+        deslocamento = -time_to_us(inicio.time())  # meia-noite do primeiro dia
+        dia = inicio.date()
+        anterior = None
+
+        while deslocamento < janela_fim:
+            plan = self.day_plan(regiao, dia)
+            pontos = plan.pontos
+            for index, cycle in enumerate(plan.ciclos):
+                if cycle is None:
+                    continue
+                # Segmento [a, b) em microssegundos do dia, recortado à janela
+                a = max(pontos[index], -deslocamento)
+                b = pontos[index + 1] if index + 1 < len(pontos) else 86400 * 1_000_000
+                b = min(b, janela_fim - deslocamento)
+                if a >= b:
+                    continue
+                itens = self._expand_segment(cycle, a + deslocamento, b + deslocamento, deslocamento)
+                if not itens:
+                    continue
+                # Só a emenda entre segmentos pode repetir o mesmo agendamento
+                primeiro = itens[0]
+                if anterior is not None:
+                    if anterior[2] is primeiro[2] and anterior[1] == primeiro[0]:
+                        itens[0] = (anterior[0], primeiro[1], primeiro[2])
+                    else:
+                        yield anterior
+                anterior = itens.pop()
+                yield from itens
+            dia += timedelta(days=1)
+            deslocamento += 86400 * 1_000_000
+
+        if anterior is not None:
+            yield anterior
+
+    def iter_steps(self, regiao: int, inicio: datetime, fim: datetime, passo_us: int):
+        """
+        Amostra a região a cada `passo_us` a partir de `inicio` (passo k =
+        inicio + k * passo_us): gera (primeiro_passo, fim_passo, agendamento)
+        em ordem, para os passos com conteúdo. Em cada segmento com rotação
+        usa o que for menor: um pick por passo (passo grande) ou a expansão
+        das posições da rotação (passo pequeno).
+        """
+        janela_fim = int((fim - inicio) / timedelta(microseconds=1))
+        deslocamento = -time_to_us(inicio.time())  # meia-noite do primeiro dia
+        dia = inicio.date()
+
+        while deslocamento < janela_fim:
+            plan = self.day_plan(regiao, dia)
+            pontos = plan.pontos
+            for index, cycle in enumerate(plan.ciclos):
+                if cycle is None:
+                    continue
+                # Segmento [a, b) relativo a `inicio`, recortado à janela (b <= janela_fim)
+                a = max(pontos[index] + deslocamento, 0)
+                b = pontos[index + 1] if index + 1 < len(pontos) else 86400 * 1_000_000
+                b = min(b + deslocamento, janela_fim)
+                primeiro = -(-a // passo_us)
+                ultimo = -(-b // passo_us)
+                if primeiro >= ultimo:
+                    continue
+                if len(cycle.entries) == 1 or cycle.total <= 0:
+                    yield primeiro, ultimo, cycle.entries[0]
+                elif (ultimo - primeiro) * cycle.total * 1_000_000 <= (b - a) * len(cycle.slots):
+                    for passo in range(primeiro, ultimo):
+                        _, entry = cycle.pick((passo * passo_us - deslocamento) // 1_000_000)
+                        yield passo, passo + 1, entry
+                else:
+                    for x, y, entry in self._expand_segment(cycle, a, b, deslocamento):
+                        p1 = -(-x // passo_us)
+                        p2 = -(-y // passo_us)
+                        if p1 < p2:
+                            yield p1, p2, entry
+            dia += timedelta(days=1)
+            deslocamento += 86400 * 1_000_000
+
+    @staticmethod
+    def _expand_segment(cycle: RotationCycle, a: int, b: int, meia_noite: int) -> List[Tuple]:
+        """
+        Expande a rotação do segmento [a, b); `meia_noite` é a origem do dia
+        (a rotação recomeça a cada dia, contada em segundos inteiros)
+        """
+        if len(cycle.entries) == 1 or cycle.total <= 0:
+            return [(a, b, cycle.entries[0])]
+
+        itens = []
+        ciclo_us = cycle.total * 1_000_000
+        segundo = (a - meia_noite) // 1_000_000
+        base = meia_noite + (segundo - segundo % cycle.total) * 1_000_000
+
+        while base < b:
+            if base >= a and base + ciclo_us <= b:
+                # Ciclos completos: copia as posições pré-calculadas
+                completos = (b - base) // ciclo_us
+                for _ in range(completos):
+                    itens.extend([(base + ini, base + fim, entry) for ini, fim, entry in cycle.slots])
+                    base += ciclo_us
+                continue
+            # Ciclo parcial (início ou fim do segmento)
+            for ini, fim, entry in cycle.slots:
+                ini = max(base + ini, a)
+                fim = min(base + fim, b)
+                if ini < fim:
+                    itens.append((ini, fim, entry))
+            base += ciclo_us
+        return itens
+
+    def etag(self, regioes, instant: datetime) -> str:
+        """
+        ETag fraco do conteúdo resolvido (agendamento, mídia e posição na rotação)
+        sem montar o payload; vale só para este processo e esta geração. Fraco
+        porque a resposta traz também o `timestamp` da consulta, que não entra
+        no ETag: respostas com o mesmo ETag são equivalentes, não idênticas
+        """
+        partes = []
+        for regiao in regioes:
+            resolved = self.resolve(regiao, instant)
+            if resolved is None:
+                partes.append(f"{regiao}:-")
+            else:
+                slot, entry = resolved
+                partes.append(f"{regiao}:{entry.schedule_id}.{entry.media_id}.{slot}")
+        return f'W/"{INSTANCIA}.{self.generation}/{"/".join(partes)}"'
+
+    def content_at(self, regiao: int, instant: datetime) -> Optional[Dict]:
+        """
+        Conteúdo ativo para a região no instante informado
+        """
+        resolved = self.resolve(regiao, instant)
+        if resolved is None:
+            return None
+        return resolved[1].to_content()
+
+
+class TimelineStore:
+    """
+    Guarda a linha do tempo atual de cada engine e a substitui atomicamente
+    
+    A linha do tempo guardada começa no dia em que foi montada; consultas a
+    dias anteriores (simulações, testes) montam uma linha do tempo à parte
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timelines = weakref.WeakKeyDictionary()
+        self._listeners = []
+        # Reconstruções pedidas / atendidas por engine e o lock de montagem (refresh)
+        self._pedidos = weakref.WeakKeyDictionary()
+        self._atendidos = weakref.WeakKeyDictionary()
+        self._build_locks = weakref.WeakKeyDictionary()
+
+    def add_listener(self, callback):
+        """
+        Registra uma função chamada (sem argumentos) a cada nova linha do tempo
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def get(self, db: Session, dia: Optional[date] = None) -> ScheduleTimeline:
+        """
+        Linha do tempo atual; com `dia` anterior ao início dela, uma linha do
+        tempo à parte (não guardada) com o histórico desde esse dia
+        """
+        timeline = self._timelines.get(sync_bind(db))
+        if timeline is None:
+            TIMELINE_CACHE.labels("miss").inc()
+            timeline = self.rebuild(db)
+        else:
+            TIMELINE_CACHE.labels("hit").inc()
+        if dia is not None and not timeline.covers(dia):
+            return ScheduleTimeline.build(db, timeline.generation, dia)
+        return timeline
+
+    def rebuild(self, db: Session) -> ScheduleTimeline:
+        """
+        Monta uma nova linha do tempo e só então troca a referência
+        """
+        bind = sync_bind(db)
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        inicio = perf_counter()
+        timeline = ScheduleTimeline.build(db, generation, date.today())
+        TIMELINE_BUILDS.observe(perf_counter() - inicio)
+        with self._lock:
+            current = self._timelines.get(bind)
+            # Uma reconstrução mais recente já pode ter terminado antes desta
+            swapped = current is None or current.generation < generation
+            if swapped:
+                self._timelines[bind] = timeline
+            timeline = self._timelines[bind]
+        if swapped:
+            for callback in list(self._listeners):
+                callback()
+        return timeline
+
+    def refresh(self, bind) -> ScheduleTimeline:
+        """
+        Reconstrução com sessão própria, para rodar em uma thread após as
+        escritas do admin; pedidos que chegam durante uma montagem esperam e
+        são atendidos juntos pela montagem seguinte
+        """
+        with self._lock:
+            pedido = self._pedidos[bind] = self._pedidos.get(bind, 0) + 1
+            build_lock = self._build_locks.setdefault(bind, threading.Lock())
+        with build_lock:
+            with self._lock:
+                timeline = self._timelines.get(bind)
+                if timeline is not None and self._atendidos.get(bind, 0) >= pedido:
+                    return timeline
+                atendidos = self._pedidos[bind]
+            with Session(bind=bind) as db:
+                timeline = self.rebuild(db)
+            with self._lock:
+                self._atendidos[bind] = atendidos
+        return timeline
+
+    def invalidate(self, db: Session):
+        with self._lock:
+            self._timelines.pop(sync_bind(db), None)
+
+
+timeline_store = TimelineStore()
@@ -1,9 +1,18 @@
+import asyncio
+import hashlib
 import httpx
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
+from ..database import DbSession, sync_bind
 from ..models import WeatherCache
+from .metrics import WEATHER_FETCHES, WEATHER_FETCH_SECONDS, WEATHER_REQUESTS
+
+# Campos do clima exibidos pelo player (o JSON completo da API fica só no banco)
+CAMPOS_EXIBIDOS = ("temperatura", "condicao", "icone", "cidade")
 
 class WeatherService:
     def __init__(self):
@@ -11,49 +20,126 @@ class WeatherService:
         self.city = os.getenv("WEATHER_CITY", "Aparecida de Goiania")
         self.country = os.getenv("WEATHER_COUNTRY", "BR")
         self.update_interval = int(os.getenv("WEATHER_UPDATE_INTERVAL", "600"))  # 10 minutos
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+        # Espera mínima entre tentativas depois de uma falha da API (segundos)
+        self.retry_interval = int(os.getenv("WEATHER_RETRY_INTERVAL", "60"))
+        self.base_url = os.getenv("WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+        # Cliente HTTP compartilhado, definido no lifespan da aplicação (services/refresher.py)
+        self.client: Optional[httpx.AsyncClient] = None
+        
+        # Cache em memória: os dados exibidos e o instante (monotônico) da busca
+        self._memory: Optional[Dict] = None
+        self._memory_at = 0.0
+        self._db_loaded = False
+        # Busca em andamento, compartilhada por todos que precisarem dela
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._next_attempt = 0.0
         
-    async def get_weather(self, db: Session) -> Dict:
+    async def get_weather(self, db: DbSession) -> Dict:
         """
-        Obtém dados do clima da API ou do cache
+        Obtém dados do clima do cache em memória; o banco só é lido na primeira
+        chamada após reiniciar. Com o cache vencido, os dados antigos continuam
+        sendo servidos enquanto uma única busca na API roda em segundo plano
         """
-        # Verifica cache primeiro
-        cached = self._get_from_cache(db)
-        if cached:
-            return cached
+        if self._memory is None and not self._db_loaded:
+            stored = await db.run(self._get_from_cache, True)
+            self._db_loaded = True
+            if stored and self._memory is None:
+                self._remember(stored, stored["cache_age"])
+        
+        if self._memory is None:
+            # Nada para servir: aguarda a busca (compartilhada entre as requisições)
+            weather_data = await asyncio.shield(self._refresh(await db.run(sync_bind)))
+            if weather_data:
+                WEATHER_REQUESTS.labels("api").inc()
+                return dict(weather_data, cached=False)
+            WEATHER_REQUESTS.labels("padrao").inc()
+            return self._get_fallback_data()
         
-        # Se não tem cache válido, busca da API
+        age = time.monotonic() - self._memory_at
+        if age >= self.update_interval:
+            WEATHER_REQUESTS.labels("vencido").inc()
+            self._refresh(await db.run(sync_bind))
+        else:
+            WEATHER_REQUESTS.labels("memoria").inc()
+        return dict(self._memory, cached=True, cache_age=int(age))
+    
+    @property
+    def enabled(self) -> bool:
+        """Há chave da API configurada"""
+        return bool(self.api_key) and self.api_key != "your_api_key_here"
+    
+    async def refresh(self, bind) -> bool:
+        """
+        Busca o clima na API agora (usado pela atualização em segundo plano,
+        que controla as novas tentativas); retorna True se atualizou
+        """
+        return await asyncio.shield(self._refresh(bind, force=True)) is not None
+    
+    def _remember(self, weather_data: Dict, age: float = 0.0):
+        self._memory = {campo: weather_data[campo] for campo in CAMPOS_EXIBIDOS}
+        self._memory_at = time.monotonic() - age
+    
+    def _refresh(self, bind, force: bool = False) -> asyncio.Task:
+        """
+        Inicia a busca na API, ou retorna a que já está em andamento (uma
+        única busca por vencimento, não importa quantas requisições cheguem)
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            if not force and time.monotonic() < self._next_attempt:
+                # A última tentativa falhou há pouco: não insiste a cada requisição
+                return self._done(None)
+            self._refresh_task = asyncio.get_running_loop().create_task(self._fetch_and_store(bind))
+        return self._refresh_task
+    
+    @staticmethod
+    def _done(result) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        return future
+    
+    async def _fetch_and_store(self, bind) -> Optional[Dict]:
+        inicio = time.perf_counter()
         try:
             weather_data = await self._fetch_from_api()
-            if weather_data:
-                self._save_to_cache(db, weather_data)
-                return weather_data
-            elif cached:  # Se API falhar, retorna cache antigo
-                return cached
         except Exception as e:
             print(f"Erro ao buscar clima: {e}")
-            if cached:
-                return cached
+            weather_data = None
+        if self.enabled:
+            WEATHER_FETCH_SECONDS.observe(time.perf_counter() - inicio)
+            WEATHER_FETCHES.labels("ok" if weather_data else "erro").inc()
+        if not weather_data:
+            self._next_attempt = time.monotonic() + self.retry_interval
+            return None
         
-        return self._get_fallback_data()
+        self._remember(weather_data)
+        try:
+            await asyncio.to_thread(self._save_with_bind, bind, weather_data)
+        except Exception as e:
+            print(f"Erro ao salvar clima no banco: {e}")
+        return self._memory
     
-    def _get_from_cache(self, db: Session) -> Optional[Dict]:
+    def _save_with_bind(self, bind, weather_data: Dict):
+        with Session(bind=bind) as db:
+            self._save_to_cache(db, weather_data)
+    
+    def _get_from_cache(self, db: Session, allow_stale: bool = False) -> Optional[Dict]:
         """
-        Busca dados do cache se ainda válidos
+        Busca dados do cache se ainda válidos (uma linha por cidade, pelo índice
+        único); com allow_stale, retorna a linha mesmo vencida
         """
         cache = db.query(WeatherCache).filter(
             WeatherCache.cidade == self.city
-        ).order_by(WeatherCache.data_cache.desc()).first()
+        ).first()
         
         if cache:
             # Verifica se cache ainda é válido
             age = datetime.utcnow() - cache.data_cache
-            if age.total_seconds() < self.update_interval:
+            if allow_stale or age.total_seconds() < self.update_interval:
                 return {
                     "temperatura": cache.temperatura,
                     "condicao": cache.condicao,
                     "icone": cache.icone,
-                    "cidade": cache.cidade,
+                    "cidade": (cache.dados_completos or {}).get("name", cache.cidade),
                     "cached": True,
                     "cache_age": int(age.total_seconds())
                 }
@@ -63,7 +149,7 @@ class WeatherService:
         """
         Busca dados da API OpenWeatherMap
         """
-        if not self.api_key or self.api_key == "your_api_key_here":
+        if not self.enabled:
             return None
         
         params = {
@@ -73,35 +159,44 @@ class WeatherService:
             "lang": "pt_br"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.base_url, params=params, timeout=10.0)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "temperatura": int(data["main"]["temp"]),
-                    "condicao": data["weather"][0]["description"].capitalize(),
-                    "icone": data["weather"][0]["icon"],
-                    "cidade": data["name"],
-                    "cached": False,
-                    "dados_completos": data
-                }
+        if self.client is not None:
+            response = await self.client.get(self.base_url, params=params)
+        else:
+            # Fora da aplicação (scripts, testes): cliente avulso
+            async with httpx.AsyncClient() as client:
+                response = await client.get(self.base_url, params=params, timeout=10.0)
+        
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                "temperatura": int(data["main"]["temp"]),
+                "condicao": data["weather"][0]["description"].capitalize(),
+                "icone": data["weather"][0]["icon"],
+                "cidade": data["name"],
+                "cached": False,
+                "dados_completos": data
+            }
         
         return None
     
     def _save_to_cache(self, db: Session, weather_data: Dict):
         """
-        Salva dados no cache do banco
+        Salva dados no cache do banco, sobrescrevendo a linha da cidade
+        configurada (a tabela não cresce com o tempo de uso)
         """
-        cache = WeatherCache(
-            cidade=weather_data.get("cidade", self.city),
-            temperatura=weather_data["temperatura"],
-            condicao=weather_data["condicao"],
-            icone=weather_data["icone"],
-            dados_completos=weather_data.get("dados_completos", {}),
-            data_cache=datetime.utcnow()
-        )
-        db.add(cache)
+        values = {
+            "cidade": self.city,
+            "temperatura": weather_data["temperatura"],
+            "condicao": weather_data["condicao"],
+            "icone": weather_data["icone"],
+            "dados_completos": weather_data.get("dados_completos", {}),
+            "data_cache": datetime.utcnow()
+        }
+        statement = sqlite_insert(WeatherCache).values(**values)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[WeatherCache.cidade],
+            set_={name: statement.excluded[name] for name in values if name != "cidade"}
+        ))
         db.commit()
     
     def _get_fallback_data(self) -> Dict:
@@ -117,6 +212,19 @@ class WeatherService:
             "fallback": True
         }
     
+    def get_etag(self, weather_data: Dict) -> str:
+        """
+        ETag forte dos dados exibidos (ignora a idade do cache, que muda a cada segundo)
+        """
+        partes = (
+            weather_data.get("cidade"),
+            weather_data.get("temperatura"),
+            weather_data.get("condicao"),
+            weather_data.get("icone"),
+            weather_data.get("fallback", False)
+        )
+        return '"%s"' % hashlib.sha1(repr(partes).encode("utf-8")).hexdigest()[:16]
+    
     def get_icon_emoji(self, icon_code: str) -> str:
         """
         Converte código de ícone em emoji
@@ -133,3 +241,6 @@ class WeatherService:
             "50d": "🌫️", "50n": "🌫️",
         }
         return icon_map.get(icon_code, "🌡️")
+
+
+weather_service = WeatherService()
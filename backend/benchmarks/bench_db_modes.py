@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concorrência: DATABASE_MODE=sync x DATABASE_MODE=async
+
+Para cada modo, sobe o servidor uvicorn em um subprocesso (banco temporário),
+cadastra mídias e agendamentos e mede a latência de muitos players
+consultando o conteúdo ativo e o clima enquanto o painel admin lista e
+altera agendamentos (commits no disco). O resultado sai em JSON, com p50/p99
+por tipo de requisição em cada modo.
+
+Uso:
+    cd backend
+    python benchmarks/bench_db_modes.py --pollers 64 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summary(latencies: list, erros: int = 0) -> dict:
+    return {
+        "count": len(latencies),
+        "errors": erros,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": round(max(latencies), 3) if latencies else None,
+    }
+
+
+async def seed(client, medias: int, schedules: int) -> list:
+    ids = []
+    for i in range(medias):
+        response = await client.post("/api/media/text", data={"nome": f"Aviso {i}", "texto": f"Texto do aviso {i}"})
+        ids.append(response.json()["id"])
+    schedule_ids = []
+    for i in range(schedules):
+        response = await client.post("/api/schedule/", json={
+            "media_id": ids[i % len(ids)],
+            "regiao": 4,
+            "data_inicio": "2020-01-01",
+            "data_fim": "2099-12-31",
+            "hora_inicio": f"{i % 24:02d}:00:00",
+            "hora_fim": f"{i % 24:02d}:59:59",
+            "duracao": 10,
+            "prioridade": 1 + i % 5,
+        })
+        schedule_ids.append(response.json()["id"])
+    return schedule_ids
+
+
+async def timed(client, method: str, url: str, latencies: list, **kwargs) -> bool:
+    inicio = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    latencies.append((time.perf_counter() - inicio) * 1000)
+    return ok
+
+
+async def poller(client, stop: asyncio.Event, results: dict, interval: float):
+    urls = ["/api/player/active-content/region/1", "/api/player/active-content/region/2",
+            "/api/player/active-content/region/4", "/api/player/weather"]
+    while not stop.is_set():
+        url = random.choice(urls)
+        chave = "weather" if url.endswith("weather") else "active_content"
+        if not await timed(client, "GET", url, results[chave]):
+            results["errors"] += 1
+        await asyncio.sleep(interval)
+
+
+async def admin(client, stop: asyncio.Event, results: dict, schedule_ids: list):
+    while not stop.is_set():
+        await timed(client, "GET", "/api/schedule/", results["admin_list"])
+        schedule_id = random.choice(schedule_ids)
+        await timed(client, "PUT", f"/api/schedule/{schedule_id}", results["admin_write"],
+                    json={"prioridade": random.randint(1, 5)})
+
+
+async def run_mode(base_url: str, pollers: int, admins: int, seconds: float, interval: float, seed_schedules: int) -> dict:
+    limits = httpx.Limits(max_connections=pollers + admins + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        schedule_ids = await seed(client, 20, seed_schedules)
+        results = {"active_content": [], "weather": [], "admin_list": [], "admin_write": [], "errors": 0}
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(poller(client, stop, results, interval)) for _ in range(pollers)]
+        tasks += [asyncio.create_task(admin(client, stop, results, schedule_ids)) for _ in range(admins)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    return {
+        "active_content": summary(results["active_content"], results["errors"]),
+        "weather": summary(results["weather"]),
+        "admin_list": summary(results["admin_list"]),
+        "admin_write": summary(results["admin_write"]),
+    }
+
+
+def start_server(workdir: str, mode: str):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, f'bench_{mode}.db')}",
+        UPLOAD_DIR=os.path.join(workdir, "uploads"),
+        DATABASE_MODE=mode,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/api/health").raise_for_status()
+            break
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pollers", type=int, default=64)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.05, help="pausa entre consultas de cada player (s)")
+    parser.add_argument("--schedules", type=int, default=200)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_modes_")
+    result = {"pollers": args.pollers, "admins": args.admins, "seconds": args.seconds}
+    try:
+        for mode in args.modes.split(","):
+            server, base_url = start_server(workdir, mode)
+            try:
+                result[mode] = asyncio.run(run_mode(
+                    base_url, args.pollers, args.admins, args.seconds, args.interval, args.schedules
+                ))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark de entrega de mídia: montagem /uploads (StaticFiles) x rota /media
+
+Sobe o servidor uvicorn em um subprocesso (banco e UPLOAD_DIR temporários),
+baixa um arquivo grande várias vezes por cada caminho e mede a vazão e o
+tempo de CPU do servidor por GB servido (lido de /proc, apenas Linux). Também
+mede a latência de pedidos Range aleatórios, como no seek de um vídeo. O
+resultado sai em JSON.
+
+Uso:
+    cd backend
+    python benchmarks/bench_media.py --size-mb 256 --downloads 8 --concurrency 2
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds(pid: int):
+    """
+    Tempo de CPU (usuário + sistema) do processo, ou None fora do Linux
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime e stime são os campos 14 e 15 (a lista começa no campo 3)
+    return (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def make_file(upload_dir: str, size_mb: int) -> str:
+    bloco = os.urandom(1024 * 1024)
+    hasher = hashlib.sha256()
+    tmp = os.path.join(upload_dir, "bench.part")
+    with open(tmp, "wb") as f:
+        for _ in range(size_mb):
+            f.write(bloco)
+            hasher.update(bloco)
+    sha = hasher.hexdigest()
+    rel = f"objects/{sha[:2]}/{sha}.mp4"
+    os.makedirs(os.path.join(upload_dir, "objects", sha[:2]), exist_ok=True)
+    os.replace(tmp, os.path.join(upload_dir, rel))
+    return rel
+
+
+async def download(client, url: str) -> int:
+    total = 0
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw(1024 * 1024):
+            total += len(chunk)
+    return total
+
+
+async def throughput(client, pid: int, url: str, downloads: int, concurrency: int) -> dict:
+    semaforo = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaforo:
+            return await download(client, url)
+
+    cpu_inicio = cpu_seconds(pid)
+    inicio = time.perf_counter()
+    total = sum(await asyncio.gather(*(one() for _ in range(downloads))))
+    duracao = time.perf_counter() - inicio
+    cpu_fim = cpu_seconds(pid)
+
+    gb = total / 1024 ** 3
+    result = {
+        "bytes": total,
+        "seconds": round(duracao, 3),
+        "mb_per_s": round(total / 1024 ** 2 / duracao, 1),
+        "server_cpu_s_per_gb": None,
+    }
+    if cpu_inicio is not None and cpu_fim is not None:
+        result["server_cpu_s_per_gb"] = round((cpu_fim - cpu_inicio) / gb, 3)
+    return result
+
+
+async def seeks(client, url: str, size: int, count: int) -> dict:
+    latencies = []
+    for _ in range(count):
+        inicio_byte = random.randrange(0, size - 1024 * 1024)
+        faixa = f"bytes={inicio_byte}-{inicio_byte + 1024 * 1024 - 1}"
+        inicio = time.perf_counter()
+        response = await client.get(url, headers={"Range": faixa})
+        latencies.append((time.perf_counter() - inicio) * 1000)
+        assert response.status_code == 206 and len(response.content) == 1024 * 1024
+    return {"count": count, "p50_ms": percentile(latencies, 50), "p99_ms": percentile(latencies, 99)}
+
+
+async def run(base_url: str, pid: int, rel: str, size: int, downloads: int, concurrency: int, seek_count: int) -> dict:
+    caminhos = {"uploads_mount": f"/uploads/{rel}", "media_route": f"/media/{rel}"}
+    result = {"file_mb": size // 1024 ** 2, "downloads": downloads, "concurrency": concurrency}
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for nome, url in caminhos.items():
+            # Aquecer o cache de páginas do arquivo antes de medir
+            await download(client, url)
+            result[nome] = {
+                "full": await throughput(client, pid, url, downloads, concurrency),
+                "range_1mb": await seeks(client, url, size, seek_count),
+            }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--downloads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--seeks", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_media_")
+    upload_dir = os.path.join(workdir, "uploads")
+    os.makedirs(upload_dir)
+    rel = make_file(upload_dir, args.size_mb)
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        UPLOAD_DIR=upload_dir,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/api/health").raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        result = asyncio.run(run(
+            base_url, server.pid, rel, args.size_mb * 1024 ** 2,
+            args.downloads, args.concurrency, args.seeks
+        ))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga da API do player e das listagens do admin
+
+Cria um banco sintético (N mídias, M agendamentos nas regiões 1, 2 e 4, com
+distribuição realista de dias da semana, horários e períodos), sobe a
+aplicação em processo (com o lifespan, como em produção) e um servidor
+local no lugar do OpenWeatherMap, e simula K players consultando o conteúdo
+ativo, as regiões e o clima, mais alguns usuários do painel admin listando
+mídias e agendamentos.
+
+O resultado sai em JSON: para cada endpoint, vazão (req/s), latência
+p50/p95/p99/max e consultas SQL e tempo no banco por requisição (lidos das
+métricas do MetricsMiddleware). Com a mesma --seed o banco e a sequência de
+requisições se repetem, e --compare mostra a diferença para um resultado
+anterior (por exemplo, de outra versão).
+
+Uso:
+    cd backend
+    python benchmarks/bench_player_api.py --medias 500 --schedules 5000 --players 32 --seconds 10
+    python benchmarks/bench_player_api.py --output atual.json --compare anterior.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cenários: (nome, rota nas métricas, peso para os players)
+PLAYER_SCENARIOS = [
+    ("active_content", "/api/player/active-content", 4),
+    ("region", "/api/player/active-content/region/{regiao}", 4),
+    ("weather", "/api/player/weather", 2),
+]
+ADMIN_SCENARIOS = [
+    ("admin_media", "/api/media/", 1),
+    ("admin_schedule", "/api/schedule/", 1),
+    ("admin_stats", "/api/media/stats/summary", 1),
+]
+ROUTES = {nome: rota for nome, rota, _ in PLAYER_SCENARIOS + ADMIN_SCENARIOS}
+
+# Dias da semana (máscara, bit 0 = domingo) e pesos: a maioria em dias úteis
+DIAS_UTEIS = 0b0111110
+FIM_DE_SEMANA = 0b1000001
+TODOS_OS_DIAS = 0b1111111
+# Hora de início e pesos: picos no início da manhã, no almoço e no fim da tarde
+HORAS_INICIO = list(range(24))
+PESOS_HORA = [1, 1, 1, 1, 1, 2, 4, 8, 10, 8, 6, 6, 10, 8, 6, 6, 8, 10, 8, 5, 3, 2, 1, 1]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+
+class FakeWeatherServer:
+    """
+    Servidor HTTP local no lugar do OpenWeatherMap, com atraso configurável
+    """
+
+    def __init__(self, delay: float):
+        self.calls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fake.calls += 1
+                time.sleep(delay)
+                body = json.dumps({
+                    "name": "Aparecida de Goiânia",
+                    "main": {"temp": 27},
+                    "weather": [{"description": "céu limpo", "icon": "01d"}]
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/weather"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def seed_database(session_factory, medias: int, schedules: int, rng: random.Random) -> dict:
+    """
+    Cadastra mídias e agendamentos sintéticos direto no banco (em lote)
+    """
+    from app.models import Media, Schedule
+    from app.services.timeline import us_to_time
+
+    hoje = date.today()
+    tipos = [("video", 1), ("imagem", 2), ("texto", 4)]
+    db = session_factory()
+    try:
+        items = []
+        for i in range(medias):
+            tipo, _ = tipos[i % 3]
+            items.append(Media(
+                tipo=tipo,
+                nome=f"{tipo.capitalize()} {i}",
+                caminho_arquivo=None if tipo == "texto" else f"uploads/bench_{i}.{'mp4' if tipo == 'video' else 'jpg'}",
+                texto=f"Aviso sintético {i}" if tipo == "texto" else None,
+                ativo=rng.random() > 0.05,
+                criado_em=datetime(2024, 1, 1) + timedelta(minutes=i),
+            ))
+        db.add_all(items)
+        db.flush()
+
+        rows = []
+        for _ in range(schedules):
+            media = rng.choice(items)
+            regiao = dict(tipos)[media.tipo]
+            # 20% já encerrados (histórico), 10% futuros e o restante em vigor
+            periodo = rng.random()
+            if periodo < 0.2:
+                inicio = hoje - timedelta(days=rng.randint(60, 720))
+                fim = inicio + timedelta(days=rng.randint(1, 50))
+            elif periodo < 0.3:
+                inicio = hoje + timedelta(days=rng.randint(1, 90))
+                fim = inicio + timedelta(days=rng.randint(1, 180))
+            else:
+                inicio = hoje - timedelta(days=rng.randint(0, 180))
+                fim = hoje + timedelta(days=rng.randint(0, 365))
+            hora = rng.choices(HORAS_INICIO, PESOS_HORA)[0]
+            inicio_s = hora * 3600 + rng.choice((0, 15, 30, 45)) * 60
+            fim_s = min(86399, inicio_s + rng.randint(1, 8) * 1800 - 1)
+            dias = rng.choices(
+                [DIAS_UTEIS, TODOS_OS_DIAS, FIM_DE_SEMANA, rng.randint(1, TODOS_OS_DIAS)],
+                [5, 3, 1, 1]
+            )[0]
+            rows.append(Schedule(
+                media_id=media.id,
+                regiao=regiao,
+                data_inicio=inicio,
+                data_fim=fim,
+                hora_inicio=us_to_time(inicio_s * 1_000_000),
+                hora_fim=us_to_time(fim_s * 1_000_000),
+                duracao=rng.choice((5, 10, 15, 30)),
+                dias_mask=dias,
+                prioridade=rng.randint(1, 5),
+                ativo=rng.random() > 0.05,
+            ))
+        db.add_all(rows)
+        db.commit()
+    finally:
+        db.close()
+    return {"medias": medias, "schedules": schedules}
+
+
+def db_stats(route: str) -> tuple:
+    """
+    (requisições, consultas, segundos no banco) acumulados da rota nas métricas
+    """
+    from app.services.metrics import HTTP_DB_QUERIES, HTTP_DB_SECONDS
+
+    queries = HTTP_DB_QUERIES.labels(route)
+    seconds = HTTP_DB_SECONDS.labels(route)
+    return sum(queries.counts), queries.sum, seconds.sum
+
+
+def scenario_url(nome: str, rng: random.Random) -> str:
+    if nome == "region":
+        return f"/api/player/active-content/region/{rng.choice((1, 2, 4))}"
+    if nome in ("admin_media", "admin_schedule"):
+        return ROUTES[nome] + "?limit=50"
+    return ROUTES[nome]
+
+
+async def client_loop(client, scenarios, rng, stop: asyncio.Event, results: dict, interval: float):
+    nomes = [nome for nome, _, _ in scenarios]
+    pesos = [peso for _, _, peso in scenarios]
+    while not stop.is_set():
+        nome = rng.choices(nomes, pesos)[0]
+        inicio = time.perf_counter()
+        try:
+            response = await client.get(scenario_url(nome, rng))
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        results[nome]["latencias"].append((time.perf_counter() - inicio) * 1000)
+        if not ok:
+            results[nome]["erros"] += 1
+        if interval:
+            await asyncio.sleep(interval)
+
+
+async def drive(client, players: int, admins: int, seconds: float, interval: float, rng: random.Random) -> tuple:
+    results = {nome: {"latencias": [], "erros": 0} for nome in ROUTES}
+    stop = asyncio.Event()
+    tasks = [
+        asyncio.create_task(client_loop(client, PLAYER_SCENARIOS, random.Random(rng.random()), stop, results, interval))
+        for _ in range(players)
+    ]
+    tasks += [
+        asyncio.create_task(client_loop(client, ADMIN_SCENARIOS, random.Random(rng.random()), stop, results, interval))
+        for _ in range(admins)
+    ]
+    inicio = time.perf_counter()
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - inicio
+
+
+def summary(latencias: list, erros: int, duracao: float, antes: tuple, depois: tuple) -> dict:
+    requisicoes = depois[0] - antes[0]
+    return {
+        "count": len(latencias),
+        "errors": erros,
+        "throughput_rps": round(len(latencias) / duracao, 1),
+        "p50_ms": percentile(latencias, 50),
+        "p95_ms": percentile(latencias, 95),
+        "p99_ms": percentile(latencias, 99),
+        "max_ms": round(max(latencias), 3) if latencias else None,
+        "queries_per_request": round((depois[1] - antes[1]) / requisicoes, 2) if requisicoes else None,
+        "db_ms_per_request": round((depois[2] - antes[2]) * 1000 / requisicoes, 3) if requisicoes else None,
+    }
+
+
+async def run(args, rng: random.Random) -> dict:
+    from app.database import SessionLocal
+    from app.main import app
+
+    dados = seed_database(SessionLocal, args.medias, args.schedules, rng)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Aquecimento (linha do tempo compilada, clima em memória), fora da medição
+            await drive(client, args.players, args.admins, args.warmup, args.interval, random.Random(rng.random()))
+
+            antes = {nome: db_stats(rota) for nome, rota in ROUTES.items()}
+            results, duracao = await drive(
+                client, args.players, args.admins, args.seconds, args.interval, random.Random(rng.random())
+            )
+            depois = {nome: db_stats(rota) for nome, rota in ROUTES.items()}
+
+    total = sum(len(r["latencias"]) for r in results.values())
+    return {
+        "dados": dados,
+        "duracao_s": round(duracao, 3),
+        "total": {"count": total, "throughput_rps": round(total / duracao, 1)},
+        "endpoints": {
+            nome: summary(r["latencias"], r["erros"], duracao, antes[nome], depois[nome])
+            for nome, r in results.items()
+        },
+    }
+
+
+def compare(atual: dict, anterior: dict) -> dict:
+    """
+    Razão atual/anterior da vazão e das latências de cada endpoint
+    """
+    resultado = {}
+    for nome, medidas in atual["endpoints"].items():
+        base = anterior.get("endpoints", {}).get(nome)
+        if not base:
+            continue
+        resultado[nome] = {
+            chave: round(medidas[chave] / base[chave], 3)
+            for chave in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+            if medidas.get(chave) and base.get(chave)
+        }
+    return {"versao_anterior": anterior.get("meta", {}).get("versao"), "razao": resultado}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--medias", type=int, default=300)
+    parser.add_argument("--schedules", type=int, default=3000)
+    parser.add_argument("--players", type=int, default=32)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--interval", type=float, default=0, help="pausa entre consultas de cada cliente (s)")
+    parser.add_argument("--weather-delay", type=float, default=0.05, help="latência do servidor de clima falso (s)")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="DATABASE_MODE")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="grava o JSON também neste arquivo")
+    parser.add_argument("--compare", help="JSON de uma execução anterior, para comparar")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_player_api_")
+    weather = FakeWeatherServer(args.weather_delay)
+    # Configuração lida na importação do app: banco e uploads temporários e o clima falso
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        UPLOAD_DIR=os.path.join(workdir, "uploads"),
+        DATABASE_MODE=args.mode,
+        OPENWEATHER_API_KEY="bench",
+        WEATHER_API_URL=weather.url,
+        METRICS_ENABLED="true",
+    )
+    sys.path.insert(0, BACKEND_DIR)
+
+    result = {
+        "meta": {
+            "versao": git_version(),
+            "inicio": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parametros": vars(args),
+        }
+    }
+    try:
+        result.update(asyncio.run(run(args, random.Random(args.seed))))
+        result["weather_upstream_calls"] = weather.calls
+    finally:
+        weather.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            result["comparacao"] = compare(result, json.load(f))
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
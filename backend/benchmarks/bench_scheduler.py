@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark da resolução do conteúdo ativo em função do número de agendamentos
+
+Para cada tamanho (10 a 100 mil agendamentos por padrão) cria um banco SQLite
+temporário com o perfil da aplicação, cadastra agendamentos sintéticos (a maior
+parte já encerrada, como o histórico de um player em uso) e mede:
+
+- reference: SchedulerService._get_content_for_regions (consulta ao banco +
+  rotação), a implementação de referência
+- timeline_build: montagem da linha do tempo compilada (uma consulta, sem os
+  agendamentos já encerrados, como no TimelineStore)
+- day_plan: primeira resolução de cada região no dia (monta o plano do dia)
+- timeline: ScheduleTimeline.content_at com o plano do dia pronto
+- conflicts: SchedulerService.find_conflicts de janelas de uma hora que
+  começam hoje (só a linha do tempo guardada)
+- conflicts_backdated: o mesmo para janelas que começam até 30 dias atrás
+  (antes da linha do tempo guardada, com os agendamentos encerrados da
+  janela lidos do banco), comparado com a linha do tempo do histórico
+  inteiro ("conflict_mismatches" deve ser 0)
+
+As respostas da linha do tempo são comparadas com as da referência em todos
+os instantes medidos ("mismatches" deve ser 0). O resultado sai em JSON.
+
+Uso:
+    cd backend
+    python benchmarks/bench_scheduler.py --sizes 10,100,1000,10000,100000 --calls 500
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base, apply_sqlite_pragmas  # noqa: E402
+from app.models import Media, Schedule  # noqa: E402
+from app.services.scheduler import REGIOES, SchedulerService  # noqa: E402
+from app.services.timeline import ScheduleTimeline, us_to_time  # noqa: E402
+
+REGIOES_PLAYER = [regiao for regiao, _ in REGIOES]
+TIPOS = {1: "video", 2: "imagem", 4: "texto"}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+def summary_us(seconds: list) -> dict:
+    micros = [s * 1e6 for s in seconds]
+    return {
+        "calls": len(micros),
+        "mean_us": round(sum(micros) / len(micros), 3) if micros else None,
+        "p50_us": percentile(micros, 50),
+        "p99_us": percentile(micros, 99),
+    }
+
+
+def seed(engine, size: int, rng: random.Random, hoje: date):
+    """
+    Agendamentos espalhados por dois anos (períodos de 1 a 60 dias), com
+    horários e dias da semana variados; mídias na proporção de 1 para 10
+    """
+    medias = max(3, size // 10)
+    with engine.begin() as conn:
+        conn.execute(insert(Media), [
+            {
+                "id": i + 1,
+                "tipo": TIPOS[REGIOES_PLAYER[i % 3]],
+                "nome": f"Mídia {i}",
+                "caminho_arquivo": None if i % 3 == 2 else f"uploads/bench_{i}.bin",
+                "texto": f"Aviso {i}" if i % 3 == 2 else None,
+                "ativo": rng.random() > 0.05,
+            }
+            for i in range(medias)
+        ])
+        rows = []
+        for _ in range(size):
+            media = rng.randrange(medias)
+            inicio = hoje - timedelta(days=rng.randrange(-30, 700))
+            hora = rng.randrange(24) * 3600 + rng.choice((0, 900, 1800, 2700))
+            fim = min(86399, hora + rng.randint(1, 16) * 1800 - 1)
+            rows.append({
+                "media_id": media + 1,
+                "regiao": REGIOES_PLAYER[media % 3],
+                "data_inicio": inicio,
+                "data_fim": inicio + timedelta(days=rng.randint(1, 60)),
+                "hora_inicio": us_to_time(hora * 1_000_000),
+                "hora_fim": us_to_time(fim * 1_000_000),
+                "duracao": rng.choice((5, 10, 15, 30)),
+                "dias_mask": rng.choice((0b1111111, 0b0111110, 0b1000001, rng.randint(1, 0b1111111))),
+                "prioridade": rng.randint(1, 5),
+                "ativo": rng.random() > 0.05,
+            })
+        conn.execute(insert(Schedule), rows)
+
+
+def bench_size(workdir: str, size: int, calls: int, rng: random.Random) -> dict:
+    url = f"sqlite:///{os.path.join(workdir, f'sched_{size}.db')}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    hoje = date.today()
+    seed(engine, size, rng, hoje)
+
+    # Instantes do dia de hoje, como nas consultas dos players
+    instants = [
+        datetime.combine(hoje, us_to_time(rng.randrange(86400 * 1_000_000)))
+        for _ in range(calls)
+    ]
+
+    with Session(bind=engine) as db:
+        reference_times, expected = [], []
+        for instant in instants:
+            inicio = time.perf_counter()
+            result = SchedulerService._get_content_for_regions(
+                db, REGIOES_PLAYER, instant.date(), instant.time(), (instant.weekday() + 1) % 7
+            )
+            reference_times.append(time.perf_counter() - inicio)
+            expected.append(result)
+            db.expunge_all()
+
+        inicio = time.perf_counter()
+        timeline = ScheduleTimeline.build(db, desde=hoje)
+        build_seconds = time.perf_counter() - inicio
+
+    day_plan_times = []
+    for regiao in REGIOES_PLAYER:
+        inicio = time.perf_counter()
+        timeline.content_at(regiao, instants[0])
+        day_plan_times.append(time.perf_counter() - inicio)
+
+    timeline_times, mismatches = [], 0
+    for instant, esperado in zip(instants, expected):
+        inicio = time.perf_counter()
+        result = {regiao: timeline.content_at(regiao, instant) for regiao in REGIOES_PLAYER}
+        timeline_times.append(time.perf_counter() - inicio)
+        mismatches += sum(result[regiao] != esperado[regiao] for regiao in REGIOES_PLAYER)
+
+    current_times, conflict_times, conflict_mismatches = [], [], 0
+    with Session(bind=engine) as db:
+        SchedulerService.rebuild_timeline(db)
+        historico = ScheduleTimeline.build(db)
+        for _ in range(calls):
+            hora_inicio = dtime(rng.randrange(23))
+            inicio = time.perf_counter()
+            SchedulerService.find_conflicts(
+                db, rng.choice(REGIOES_PLAYER), hoje, hoje + timedelta(days=rng.randint(0, 30)),
+                hora_inicio, dtime(hora_inicio.hour + 1)
+            )
+            current_times.append(time.perf_counter() - inicio)
+        for _ in range(calls):
+            regiao = rng.choice(REGIOES_PLAYER)
+            data_inicio = hoje - timedelta(days=rng.randint(1, 30))
+            data_fim = data_inicio + timedelta(days=rng.randint(0, 30))
+            hora_inicio = dtime(rng.randrange(23))
+            hora_fim = dtime(hora_inicio.hour + 1)
+            inicio = time.perf_counter()
+            conflitos = SchedulerService.find_conflicts(db, regiao, data_inicio, data_fim, hora_inicio, hora_fim)
+            conflict_times.append(time.perf_counter() - inicio)
+            esperado = historico.conflicts(regiao, data_inicio, data_fim, hora_inicio, hora_fim)
+            conflict_mismatches += [c["schedule_id"] for c in conflitos] != [e.schedule_id for e in esperado]
+
+    engine.dispose()
+    reference = summary_us(reference_times)
+    compiled = summary_us(timeline_times)
+    return {
+        "schedules": size,
+        # Fração das respostas (instante × região) com conteúdo, para conferir a carga
+        "com_conteudo": round(sum(r is not None for e in expected for r in e.values()) / (len(expected) * len(REGIOES_PLAYER)), 3),
+        "reference": reference,
+        "timeline_build_ms": round(build_seconds * 1000, 3),
+        "day_plan_ms": round(sum(day_plan_times) * 1000, 3),
+        "timeline": compiled,
+        "speedup_p50": round(reference["p50_us"] / compiled["p50_us"], 1) if compiled["p50_us"] else None,
+        "mismatches": mismatches,
+        "conflicts": summary_us(current_times),
+        "conflicts_backdated": summary_us(conflict_times),
+        "conflict_mismatches": conflict_mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000")
+    parser.add_argument("--calls", type=int, default=500, help="instantes medidos por tamanho")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_scheduler_")
+    try:
+        results = [bench_size(workdir, int(size), args.calls, rng) for size in args.sizes.split(",")]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({"calls": args.calls, "seed": args.seed, "sizes": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
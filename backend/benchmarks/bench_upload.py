@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark de upload: vazão do envio e latência do polling do player durante o envio
+
+Sobe a aplicação em processo (banco e UPLOAD_DIR temporários), envia um
+arquivo grande para /api/media/upload e, ao mesmo tempo, simula players
+consultando /api/player/active-content. O resultado sai em JSON.
+
+Uso:
+    cd backend
+    python benchmarks/bench_upload.py --size-mb 200 --pollers 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Banco e uploads temporários precisam estar definidos antes de importar o app
+WORKDIR = tempfile.mkdtemp(prefix="bench_upload_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(WORKDIR, "uploads"))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[index], 3)
+
+
+async def poll(client, stop: asyncio.Event, latencies: list, interval: float):
+    while not stop.is_set():
+        inicio = time.perf_counter()
+        response = await client.get("/api/player/active-content")
+        latencies.append((time.perf_counter() - inicio) * 1000)
+        assert response.status_code == 200
+        await asyncio.sleep(interval)
+
+
+async def run(size_mb: int, pollers: int, interval: float) -> dict:
+    payload = os.urandom(1024 * 1024) * size_mb
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Latência de referência, sem upload em andamento
+        idle = []
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(poll(client, stop, idle, interval)) for _ in range(pollers)]
+        await asyncio.sleep(1)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+        busy = []
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(poll(client, stop, busy, interval)) for _ in range(pollers)]
+        inicio = time.perf_counter()
+        response = await client.post(
+            "/api/media/upload",
+            files={"file": ("bench.mp4", payload, "video/mp4")},
+            data={"tipo": "video", "nome": "bench"}
+        )
+        duracao = time.perf_counter() - inicio
+        stop.set()
+        await asyncio.gather(*tasks)
+        response.raise_for_status()
+
+    return {
+        "upload_mb": size_mb,
+        "upload_seconds": round(duracao, 3),
+        "upload_mb_per_s": round(size_mb / duracao, 2),
+        "pollers": pollers,
+        "poll_idle_ms": {
+            "count": len(idle),
+            "p50": percentile(idle, 50),
+            "p99": percentile(idle, 99),
+        },
+        "poll_during_upload_ms": {
+            "count": len(busy),
+            "p50": percentile(busy, 50),
+            "p99": percentile(busy, 99),
+            "max": round(max(busy), 3) if busy else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--pollers", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=0.01, help="pausa entre consultas de cada player (s)")
+    args = parser.parse_args()
+
+    try:
+        result = asyncio.run(run(args.size_mb, args.pollers, args.interval))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,7 @@ SELECT
     s.data_fim,
     s.hora_inicio,
     s.hora_fim,
-    s.dias_semana,
+    s.dias_mask,
     s.ativo
 FROM schedule s
 JOIN media m ON s.media_id = m.id
@@ -0,0 +1,524 @@
+"""
+Testes das rotas do painel admin (número de consultas, paginação por cursor e operações em lote)
+"""
+import time as timer
+import pytest
+from datetime import date, datetime, time, timedelta
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base, get_db
+from app.models import Media, Schedule, StorageUsage
+from app.routers import media, schedule
+from app.services.timeline import timeline_store
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def client(engine):
+    """
+    App com os routers de mídia e agendamento em um banco em memória
+    """
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    app.include_router(media.router)
+    app.include_router(schedule.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def seed(engine, medias: int, schedules_per_media: int = 2):
+    """
+    Cadastra mídias (várias com o mesmo criado_em, para testar o desempate
+    pelo id) e agendamentos para cada uma
+    """
+    db = sessionmaker(bind=engine)()
+    base = datetime(2026, 1, 1)
+    items = [
+        Media(tipo="texto", nome=f"Aviso {i}", texto="abc", ativo=True, criado_em=base + timedelta(minutes=i // 3))
+        for i in range(medias)
+    ]
+    db.add_all(items)
+    db.flush()
+    db.add_all([
+        Schedule(
+            media_id=item.id,
+            regiao=4,
+            data_inicio=date(2026, 1, 1) + timedelta(days=i % 10),
+            data_fim=date(2026, 12, 31),
+            hora_inicio=time(8 + j, 0, 0),
+            hora_fim=time(18, 0, 0)
+        )
+        for i, item in enumerate(items) for j in range(schedules_per_media)
+    ])
+    db.commit()
+    db.close()
+
+
+def count_queries(engine, call):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = call()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return response, len(statements)
+
+
+def collect_pages(client, url: str, limit: int) -> list:
+    items, cursor = [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= limit
+        items += response.json()
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return items
+
+
+def test_list_media_query_count_is_constant(client, engine):
+    """
+    Testa se a listagem de mídias usa uma consulta, com qualquer número de linhas
+    """
+    seed(engine, 5)
+    small, small_queries = count_queries(engine, lambda: client.get("/api/media/"))
+    seed(engine, 200)
+    large, large_queries = count_queries(engine, lambda: client.get("/api/media/"))
+
+    assert len(small.json()) == 5 and len(large.json()) == 205
+    assert small_queries == large_queries == 1
+    assert {m["schedules_count"] for m in large.json()} == {2}
+
+
+def test_list_schedules_query_count_is_constant(client, engine):
+    """
+    Testa se a listagem de agendamentos carrega as mídias no mesmo SELECT
+    """
+    seed(engine, 100)
+    response, queries = count_queries(engine, lambda: client.get("/api/schedule/"))
+
+    assert len(response.json()) == 200
+    assert queries == 1
+    assert all(s["media_nome"].startswith("Aviso") for s in response.json())
+
+
+def test_media_pagination_matches_full_list(client, engine):
+    """
+    Testa se as páginas pelo cursor reproduzem a lista completa, sem repetir linhas
+    """
+    seed(engine, 101)
+    full = client.get("/api/media/").json()
+    paged = collect_pages(client, "/api/media/", 20)
+
+    assert [m["id"] for m in paged] == [m["id"] for m in full]
+    assert client.get("/api/media/", params={"limit": 101}).headers.get("x-next-cursor") is None
+
+
+def test_schedule_pagination_matches_full_list(client, engine):
+    """
+    Testa a paginação dos agendamentos (ordem por data_inicio, hora_inicio e id)
+    """
+    seed(engine, 40)
+    full = client.get("/api/schedule/", params={"regiao": 4}).json()
+    paged = collect_pages(client, "/api/schedule/?regiao=4", 7)
+
+    assert [s["id"] for s in paged] == [s["id"] for s in full]
+
+
+def test_invalid_cursor(client, engine):
+    """
+    Testa se um cursor inválido retorna 400
+    """
+    seed(engine, 3)
+    assert client.get("/api/media/", params={"limit": 2, "cursor": "xyz"}).status_code == 400
+    assert client.get("/api/schedule/", params={"limit": 2, "cursor": "W10"}).status_code == 400
+
+
+def test_stats_single_query(client, engine):
+    """
+    Testa se as estatísticas (mídias, agendamentos por região e disco) vêm de uma consulta
+    """
+    seed(engine, 6)
+    db = sessionmaker(bind=engine)()
+    db.add(Media(tipo="video", nome="Vídeo", caminho_arquivo="uploads/v.mp4", ativo=False))
+    db.add(StorageUsage(id=1, bytes_usados=123456, arquivos=7))
+    db.query(Schedule).filter(Schedule.id <= 3).update({Schedule.regiao: 1, Schedule.ativo: False})
+    db.commit()
+    db.close()
+    
+    response, queries = count_queries(engine, lambda: client.get("/api/media/stats/summary"))
+    stats = response.json()
+    
+    assert queries == 1
+    assert (stats["total"], stats["textos"], stats["videos"], stats["ativos"], stats["inativos"]) == (7, 6, 1, 6, 1)
+    assert stats["por_tipo"]["video"] == {"total": 1, "ativos": 0}
+    assert stats["agendamentos"] == {
+        "total": 12,
+        "ativos": 9,
+        "por_regiao": {"1": {"total": 3, "ativos": 0}, "4": {"total": 9, "ativos": 9}}
+    }
+    assert stats["disco"] == {"bytes": 123456, "arquivos": 7}
+
+
+def test_reorder_single_statement(client, engine):
+    """
+    Testa se reordenar 200 agendamentos executa um único UPDATE
+    """
+    seed(engine, 100)
+    ids = [s["id"] for s in client.get("/api/schedule/").json()]
+    updates = [{"id": schedule_id, "prioridade": posicao + 1} for posicao, schedule_id in enumerate(reversed(ids))]
+    
+    inicio = timer.perf_counter()
+    response, queries = count_queries(engine, lambda: client.put("/api/schedule/reorder", json=updates))
+    elapsed = timer.perf_counter() - inicio
+    
+    assert response.status_code == 200
+    assert response.json()["atualizados"] == 200
+    # UPDATE e a consulta que remonta a linha do tempo
+    assert queries == 2
+    assert elapsed < 0.5
+    prioridades = {s["id"]: s["prioridade"] for s in client.get("/api/schedule/").json()}
+    assert prioridades == {u["id"]: u["prioridade"] for u in updates}
+
+
+def test_timeline_rebuilt_only_when_schedules_can_change(client, engine):
+    """
+    Testa se criar mídias não remonta a linha do tempo e se as demais escritas
+    remontam antes da resposta (a leitura seguinte já vê a mudança)
+    """
+    geracao = lambda: timeline_store.get(sessionmaker(bind=engine)()).generation
+    inicial = geracao()
+    
+    texto = client.post("/api/media/text", data={"nome": "Aviso", "texto": "Olá"}).json()
+    client.post("/api/media/link", data={"nome": "Link", "url": "https://example.com"})
+    assert geracao() == inicial
+    
+    hoje = date.today().isoformat()
+    client.post("/api/schedule/", json={
+        "media_id": texto["id"], "regiao": 4, "data_inicio": hoje, "data_fim": hoje,
+        "hora_inicio": "00:00:00", "hora_fim": "23:59:59"
+    })
+    assert geracao() > inicial
+    
+    antes = geracao()
+    client.put(f"/api/media/{texto['id']}", data={"ativo": "false"})
+    assert geracao() > antes
+    assert timeline_store.get(sessionmaker(bind=engine)()).conflicts(4, date.today(), date.today(), time(0), time(23)) == []
+
+
+def test_bulk_create_is_all_or_nothing(client, engine):
+    """
+    Testa se a criação em lote valida o lote inteiro antes de gravar
+    """
+    seed(engine, 2, schedules_per_media=0)
+    db = sessionmaker(bind=engine)()
+    video = Media(tipo="video", nome="Vídeo", caminho_arquivo="uploads/v.mp4", ativo=True)
+    db.add(video)
+    db.commit()
+    video_id = video.id
+    db.close()
+    
+    item = {
+        "media_id": 1, "regiao": 4, "data_inicio": "2026-01-01", "data_fim": "2026-01-31",
+        "hora_inicio": "08:00:00", "hora_fim": "18:00:00"
+    }
+    invalidos = [
+        item,
+        dict(item, media_id=video_id),  # vídeo na região de texto
+        dict(item, media_id=999),
+        dict(item, hora_fim="07:00:00"),
+        dict(item, dias_semana="9"),
+    ]
+    response = client.post("/api/schedule/bulk", json=invalidos)
+    assert response.status_code == 400
+    assert [e["indice"] for e in response.json()["detail"]["erros"]] == [1, 2, 3, 4]
+    assert client.get("/api/schedule/").json() == []
+    
+    validos = [item, dict(item, media_id=2), dict(item, media_id=video_id, regiao=1)]
+    response, queries = count_queries(engine, lambda: client.post("/api/schedule/bulk", json=validos))
+    assert response.status_code == 200
+    assert len(response.json()["ids"]) == 3
+    assert len(client.get("/api/schedule/").json()) == 3
+    # Mídias, linha do tempo dos conflitos, INSERTs e a reconstrução; não cresce
+    # uma consulta por item de validação ou de conflito
+    assert queries <= 4 + len(validos)
+
+
+def test_bulk_update_and_delete(client, engine):
+    """
+    Testa a atualização e a remoção em lote
+    """
+    seed(engine, 5)
+    ids = [s["id"] for s in client.get("/api/schedule/").json()]
+    
+    response = client.put("/api/schedule/bulk", json=[
+        {"id": ids[0], "ativo": False},
+        {"id": ids[1], "hora_fim": "06:00:00"},
+    ])
+    assert response.status_code == 400
+    assert response.json()["detail"]["erros"] == [{"indice": 1, "erro": "Hora fim deve ser maior que hora início"}]
+    
+    response = client.put("/api/schedule/bulk", json=[
+        {"id": ids[0], "ativo": False},
+        {"id": ids[1], "dias_semana": "1,2,3", "duracao": 30},
+    ])
+    assert response.json()["atualizados"] == 2
+    atualizados = {s["id"]: s for s in client.get("/api/schedule/").json()}
+    assert atualizados[ids[0]]["ativo"] is False
+    assert (atualizados[ids[1]]["dias_semana"], atualizados[ids[1]]["duracao"]) == ("1,2,3", 30)
+    
+    response = client.request("DELETE", "/api/schedule/bulk", json={"ids": ids[:4] + [999]})
+    assert response.json()["removidos"] == 4
+    assert [s["id"] for s in client.get("/api/schedule/").json()] == ids[4:]
+
+
+def test_simulate_week_per_second(client, engine):
+    """
+    Testa a simulação de uma semana a cada segundo (rotação em todas as regiões)
+    """
+    db = sessionmaker(bind=engine)()
+    medias = [
+        Media(tipo=tipo, nome=f"{tipo} {i}", caminho_arquivo=None if tipo == "texto" else f"uploads/{i}.bin", texto="abc", ativo=True)
+        for i in range(4) for tipo in ("video", "imagem", "texto")
+    ]
+    db.add_all(medias)
+    db.flush()
+    regioes = {"video": 1, "imagem": 2, "texto": 4}
+    db.add_all([
+        Schedule(
+            media_id=media.id, regiao=regioes[media.tipo],
+            data_inicio=date(2026, 1, 1), data_fim=date(2026, 12, 31),
+            hora_inicio=time(6, 0, 0), hora_fim=time(21, 59, 59),
+            duracao=10 + 5 * i, prioridade=1 + i % 4, dias_semana="1,2,3,4,5,6"
+        )
+        for i, media in enumerate(medias)
+    ])
+    db.commit()
+    db.close()
+    
+    params = {"inicio": "2026-03-02T00:00:00", "fim": "2026-03-09T00:00:00", "resolucao": 1}
+    inicio = timer.perf_counter()
+    response = client.get("/api/schedule/simulate", params=params)
+    elapsed = timer.perf_counter() - inicio
+    
+    assert response.status_code == 200
+    simulacao = response.json()
+    assert simulacao["passos"] == 7 * 86400
+    assert elapsed < 1.0
+    for regiao, sequencias in simulacao["regioes"].items():
+        assert sum(quantidade for _, quantidade, _ in sequencias) == 7 * 86400
+        # Segunda-feira antes das 6h: nada; de sábado às 22h até o fim do domingo (8/3): nada
+        assert sequencias[0] == [0, 6 * 3600, None]
+        assert sequencias[-1] == [5 * 86400 + 22 * 3600, 26 * 3600, None]
+    
+    # Passo de 1 hora: um ponto por hora, mesmas faixas vazias
+    horaria = client.get("/api/schedule/simulate", params=dict(params, resolucao=3600, regioes="4")).json()
+    assert horaria["passos"] == 7 * 24 and list(horaria["regioes"]) == ["4"]
+    assert horaria["regioes"]["4"][0] == [0, 6, None]
+
+
+def test_simulate_validation(client, engine):
+    """
+    Testa os limites da simulação (período, resolução e regiões)
+    """
+    url = "/api/schedule/simulate"
+    base = {"inicio": "2026-03-02T00:00:00", "fim": "2026-03-03T00:00:00"}
+    assert client.get(url, params=base).status_code == 200
+    assert client.get(url, params=dict(base, fim="2026-03-01T00:00:00")).status_code == 400
+    assert client.get(url, params=dict(base, fim="2026-05-01T00:00:00")).status_code == 400
+    assert client.get(url, params=dict(base, resolucao=0)).status_code == 422
+    assert client.get(url, params=dict(base, regioes="3")).status_code == 400
+    assert client.get(url, params=dict(base, regioes="a")).status_code == 400
+
+
+def test_next_schedules_paginated(client, engine):
+    """
+    Testa as próximas ocorrências pela API: páginas pelo cursor e validação
+    """
+    db = sessionmaker(bind=engine)()
+    aviso = Media(tipo="texto", nome="Aviso", texto="abc", ativo=True)
+    db.add(aviso)
+    db.flush()
+    hoje = date.today()
+    db.add_all([
+        Schedule(
+            media_id=aviso.id, regiao=4,
+            data_inicio=hoje - timedelta(days=1), data_fim=hoje + timedelta(days=30),
+            hora_inicio=time(h, 0, 0), hora_fim=time(h, 59, 59)
+        )
+        for h in range(0, 24, 3)
+    ])
+    db.commit()
+    db.close()
+
+    url = "/api/schedule/next/4"
+    full = client.get(url, params={"hours": 72}).json()
+    pages, cursor = [], None
+    while True:
+        params = {"hours": 72, "limit": 5}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        pages += response.json()["schedules"]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+
+    # Uma ocorrência a cada 3 horas (a atual incluída, se ainda não terminou)
+    assert len(full["schedules"]) in (24, 25)
+    assert [s["inicio"] for s in full["schedules"]] == sorted(s["inicio"] for s in full["schedules"])
+    assert [(s["inicio"], s["schedule_id"]) for s in pages] == [(s["inicio"], s["schedule_id"]) for s in full["schedules"]]
+    assert client.get(url, params={"limit": 5, "cursor": "xyz"}).status_code == 400
+    assert client.get(url, params={"hours": 0}).status_code == 422
+    assert client.get("/api/schedule/next/3").status_code == 400
+
+
+def test_update_reports_conflicts(client, engine):
+    """
+    Testa se a atualização lista as sobreposições da nova janela, sem o próprio agendamento
+    """
+    seed(engine, 2, schedules_per_media=1)
+    # Aviso 0 às 8h e Aviso 1 às 8h, ambos até 18h
+    sozinho = client.put("/api/schedule/1", json={"hora_inicio": "19:00:00", "hora_fim": "20:00:00"})
+    assert sozinho.status_code == 200
+    assert sozinho.json()["conflitos"] == []
+    
+    sobreposto = client.put("/api/schedule/1", json={"hora_inicio": "17:00:00"})
+    assert [c["schedule_id"] for c in sobreposto.json()["conflitos"]] == [2]
+
+
+def test_bulk_create_reports_conflicts(client, engine):
+    """
+    Testa se a criação em lote lista, por item, as sobreposições com os
+    agendamentos existentes e com os outros itens do lote
+    """
+    seed(engine, 1, schedules_per_media=1)
+    # Aviso 0 das 8h às 18h, até o fim de 2026
+    item = {"media_id": 1, "regiao": 4, "data_inicio": "2026-11-01", "data_fim": "2026-11-30"}
+    response = client.post("/api/schedule/bulk", json=[
+        dict(item, hora_inicio="09:00:00", hora_fim="10:00:00"),
+        dict(item, hora_inicio="09:30:00", hora_fim="11:00:00"),
+        dict(item, hora_inicio="19:00:00", hora_fim="20:00:00"),
+    ])
+    assert response.status_code == 200
+    ids = response.json()["ids"]
+    conflitos = response.json()["conflitos"]
+    assert [(c["schedule_id"], c.get("indice")) for c in conflitos[0]] == [(1, None), (ids[1], 1)]
+    assert [(c["schedule_id"], c.get("indice")) for c in conflitos[1]] == [(1, None), (ids[0], 0)]
+    assert conflitos[2] == []
+
+
+def test_check_conflicts_validates_weekdays(client, engine):
+    """
+    Testa se dias da semana inválidos na checagem de conflitos retornam 400
+    """
+    seed(engine, 1)
+    url = "/api/schedule/conflicts/1"
+    params = {
+        "regiao": 4, "data_inicio": "2026-01-01", "data_fim": "2026-01-31",
+        "hora_inicio": "08:00:00", "hora_fim": "09:00:00"
+    }
+    assert client.get(url, params=params).status_code == 200
+    for dias in ("x", "9", ""):
+        assert client.get(url, params=dict(params, dias_semana=dias)).status_code == 400
+
+
+def test_null_weekdays_rejected(client, engine):
+    """
+    Testa se dias_semana nulo na atualização (simples ou em lote) retorna 400, não 500
+    """
+    seed(engine, 1, schedules_per_media=1)
+    
+    response = client.put("/api/schedule/1", json={"dias_semana": None})
+    assert response.status_code == 400
+    response = client.put("/api/schedule/bulk", json=[{"id": 1, "dias_semana": None}])
+    assert response.status_code == 400
+    assert response.json()["detail"]["erros"][0]["indice"] == 0
+    assert client.get("/api/schedule/1").json()["dias_semana"] == "0,1,2,3,4,5,6"
+
+
+def test_null_window_fields_rejected_per_item(client, engine):
+    """
+    Testa se datas ou horários nulos na atualização retornam 400 (por item
+    no lote, sem gravar nada), não 500
+    """
+    seed(engine, 1, schedules_per_media=2)
+    
+    for campo in ("data_inicio", "data_fim", "hora_inicio", "hora_fim"):
+        response = client.put("/api/schedule/bulk", json=[
+            {"id": 1, "prioridade": 5},
+            {"id": 2, campo: None},
+        ])
+        assert response.status_code == 400
+        assert response.json()["detail"]["erros"] == [{"indice": 1, "erro": f"{campo} não pode ser nulo"}]
+        assert client.put("/api/schedule/2", json={campo: None}).status_code == 400
+    assert client.get("/api/schedule/1").json()["prioridade"] == 1
+
+
+def test_upload_streams_into_blob_store(client, engine, tmp_path, monkeypatch):
+    """
+    Testa o upload pelo stream: arquivo guardado pelo conteúdo, nada
+    sobrando em objects/incoming e recusa (400) sem deixar temporários
+    """
+    from app.services import storage
+    monkeypatch.setattr(storage.blob_store, "root", str(tmp_path))
+    incoming = os.path.join(str(tmp_path), "objects", "incoming")
+    data = os.urandom(300 * 1024)
+
+    response = client.post(
+        "/api/media/upload",
+        files={"file": ("video.mp4", data, "video/mp4")},
+        data={"tipo": "video", "nome": "Promoção"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["nome"] == "Promoção"
+    assert body["tamanho"] == len(data)
+    assert open(body["caminho_arquivo"], "rb").read() == data
+    assert os.listdir(incoming) == []
+
+    response = client.post(
+        "/api/media/upload",
+        files={"file": ("foto.png", data, "image/png")},
+        data={"tipo": "video"}
+    )
+    assert response.status_code == 400
+    assert os.listdir(incoming) == []
+
+    response = client.post("/api/media/upload", data={"tipo": "video"})
+    assert response.status_code == 400
@@ -0,0 +1,98 @@
+"""
+Testes do modo assíncrono do banco (DbSession com aiosqlite)
+"""
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base, DbSession, get_session
+from app.models import Media
+from app.routers import media, player, schedule
+
+
+@pytest_asyncio.fixture
+async def client(tmp_path):
+    """
+    App com os routers usando sessões assíncronas (aiosqlite) em um banco em arquivo
+    """
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    Base.metadata.create_all(bind=create_engine(url))
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_session():
+        async with AsyncSessionLocal() as session:
+            yield DbSession(session)
+
+    app = FastAPI()
+    app.include_router(media.router)
+    app.include_router(schedule.router)
+    app.include_router(player.router)
+    app.dependency_overrides[get_session] = override_get_session
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    await async_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_routers_work_with_async_session(client):
+    """
+    Testa cadastro, agendamento e conteúdo ativo com o engine assíncrono
+    """
+    response = await client.post("/api/media/text", data={"nome": "Aviso", "texto": "Texto do aviso"})
+    assert response.status_code == 200
+    media_id = response.json()["id"]
+
+    response = await client.post("/api/schedule/", json={
+        "media_id": media_id,
+        "regiao": 4,
+        "data_inicio": "2020-01-01",
+        "data_fim": "2099-12-31",
+        "hora_inicio": "00:00:00",
+        "hora_fim": "23:59:59"
+    })
+    assert response.status_code == 200
+
+    response = await client.get("/api/player/active-content/region/4")
+    assert response.status_code == 200
+    assert response.json()["texto"] == "Texto do aviso"
+
+    response = await client.get("/api/schedule/")
+    assert [s["media_id"] for s in response.json()] == [media_id]
+
+    # Erros HTTP lançados dentro de DbSession.run chegam ao cliente
+    assert (await client.get("/api/media/999")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_db_session_runs_sync_functions_in_both_modes(tmp_path):
+    """
+    Testa se DbSession.run entrega a Session síncrona às funções nos dois modos
+    """
+    url = f"sqlite:///{tmp_path / 'modos.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+
+    def add_media(db, nome):
+        db.add(Media(tipo="texto", nome=nome, texto="abc", ativo=True))
+        db.commit()
+        return db.query(Media).count()
+
+    with sessionmaker(bind=engine)() as session:
+        assert await DbSession(session).run(add_media, "sync") == 1
+
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    async with AsyncSession(async_engine) as session:
+        assert await DbSession(session).run(add_media, "async") == 2
+    await async_engine.dispose()
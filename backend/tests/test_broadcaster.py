@@ -0,0 +1,154 @@
+"""
+Testes do envio de conteúdo por push (ContentBroadcaster)
+"""
+import asyncio
+import pytest
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base
+from app.models import Media, Schedule
+from app.services.broadcaster import ContentBroadcaster, Subscriber
+from app.services.scheduler import SchedulerService
+from app.services.timeline import timeline_store
+
+
+@pytest.fixture
+def test_db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def broadcaster():
+    broadcaster = ContentBroadcaster()
+    yield broadcaster
+    timeline_store.remove_listener(broadcaster.notify)
+
+
+def _add_text_schedule(db, texto, duracao=10, prioridade=1):
+    media = Media(tipo="texto", nome=texto, texto=texto, ativo=True)
+    db.add(media)
+    db.commit()
+    schedule = Schedule(
+        media_id=media.id,
+        data_inicio=date.today() - timedelta(days=1),
+        data_fim=date.today() + timedelta(days=1),
+        hora_inicio=time(0, 0, 0),
+        hora_fim=time(23, 59, 59),
+        duracao=duracao,
+        dias_semana="0,1,2,3,4,5,6",
+        prioridade=prioridade,
+        regiao=4,
+        ativo=True
+    )
+    db.add(schedule)
+    db.commit()
+    return schedule
+
+
+def test_tick_publishes_only_changes(test_db, broadcaster):
+    """
+    Testa se o tick publica cada região uma vez e depois só quando a rotação muda
+    """
+    _add_text_schedule(test_db, "Primeiro", duracao=10, prioridade=1)
+    _add_text_schedule(test_db, "Segundo", duracao=20, prioridade=2)
+    subscriber = Subscriber()
+    broadcaster._subscribers.add(subscriber)
+    broadcaster._bind = test_db.get_bind()
+    
+    base = datetime.combine(date.today(), time(10, 0, 0))  # 36000 % 30 == 0
+    proxima = broadcaster.tick(base)
+    pending = subscriber._pending
+    assert set(pending) == {1, 2, 4}
+    assert pending[4][1]["texto"] == "Primeiro"
+    assert pending[1][1] is None
+    assert proxima == base + timedelta(seconds=10)
+    
+    subscriber._pending = {}
+    broadcaster.tick(base + timedelta(seconds=5))
+    assert subscriber._pending == {}
+    
+    assert broadcaster.tick(proxima) == proxima + timedelta(seconds=20)
+    assert set(subscriber._pending) == {4}
+    assert subscriber._pending[4][1]["texto"] == "Segundo"
+
+
+@pytest.mark.asyncio
+async def test_write_wakes_subscribers(test_db, broadcaster):
+    """
+    Testa se uma reconstrução da linha do tempo é enviada imediatamente
+    """
+    subscriber = broadcaster.subscribe(test_db)
+    try:
+        initial = await subscriber.get(timeout=1)
+        assert initial[4][1] is None
+        
+        _add_text_schedule(test_db, "Aviso novo")
+        SchedulerService.rebuild_timeline(test_db)
+        
+        changes = await subscriber.get(timeout=1)
+        assert changes[4][1]["texto"] == "Aviso novo"
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        # Sem players conectados o laço de publicação termina sozinho
+        await asyncio.wait_for(broadcaster._task, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_loop_survives_failing_tick(test_db, broadcaster, monkeypatch):
+    """
+    Testa se um erro no tick não encerra o laço de publicação
+    """
+    subscriber = broadcaster.subscribe(test_db)
+    try:
+        await subscriber.get(timeout=1)
+        tick = broadcaster.tick
+        falhas = []
+        
+        def failing_tick(now):
+            if not falhas:
+                falhas.append(now)
+                raise TypeError("linha do tempo inválida")
+            return tick(now)
+        
+        monkeypatch.setattr(broadcaster, "tick", failing_tick)
+        monkeypatch.setattr("app.services.broadcaster.ERROR_SLEEP", 0.05)
+        broadcaster.notify()
+        await asyncio.sleep(0.1)
+        assert falhas and not broadcaster._task.done()
+        
+        _add_text_schedule(test_db, "Depois do erro")
+        SchedulerService.rebuild_timeline(test_db)
+        changes = await subscriber.get(timeout=1)
+        assert changes[4][1]["texto"] == "Depois do erro"
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        await asyncio.wait_for(broadcaster._task, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_keeps_only_latest_state():
+    """
+    Testa se um cliente lento recebe apenas o estado mais recente de cada região
+    """
+    subscriber = Subscriber()
+    for i in range(1000):
+        subscriber.push(4, f'"{i}"', {"id": i})
+    
+    changes = await subscriber.get(timeout=0)
+    assert changes == {4: ('"999"', {"id": 999})}
+    assert await subscriber.get(timeout=0.01) == {}
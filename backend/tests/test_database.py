@@ -0,0 +1,89 @@
+"""
+Testes do perfil de desempenho do SQLite (pragmas, WAL e checkpoint)
+"""
+import pytest
+from sqlalchemy import create_engine, event, text
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import (
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    _engine_options,
+    apply_sqlite_pragmas,
+    checkpoint_wal,
+)
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """
+    Engine em arquivo configurado como o da aplicação
+    """
+    url = f"sqlite:///{tmp_path / 'perfil.db'}"
+    engine = create_engine(url, **_engine_options(url))
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY, nome TEXT)"))
+        conn.execute(text("INSERT INTO item (nome) VALUES ('a'), ('b')"))
+    yield engine
+    engine.dispose()
+
+
+def test_pragmas_applied_on_connect(file_engine):
+    """
+    Testa se cada conexão recebe WAL, synchronous=NORMAL e os demais pragmas
+    """
+    with file_engine.connect() as conn:
+        pragma = lambda nome: conn.exec_driver_sql(f"PRAGMA {nome}").scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1  # NORMAL
+        assert pragma("temp_store") == 2  # MEMORY
+        assert pragma("busy_timeout") == SQLITE_BUSY_TIMEOUT
+        assert pragma("cache_size") == SQLITE_CACHE_SIZE
+    assert type(file_engine.pool).__name__ == "QueuePool"
+
+
+def test_reader_not_blocked_by_open_write(file_engine):
+    """
+    Testa se uma leitura não espera a transação de escrita em andamento
+    """
+    with file_engine.connect() as writer, file_engine.connect() as reader:
+        reader.exec_driver_sql("PRAGMA busy_timeout=0")
+        writer.exec_driver_sql("BEGIN IMMEDIATE")
+        writer.exec_driver_sql("INSERT INTO item (nome) VALUES ('c')")
+
+        # Sem WAL esta leitura poderia falhar com "database is locked"
+        assert reader.exec_driver_sql("SELECT COUNT(*) FROM item").scalar() == 2
+
+        writer.exec_driver_sql("COMMIT")
+        reader.rollback()
+        assert reader.exec_driver_sql("SELECT COUNT(*) FROM item").scalar() == 3
+
+
+def test_checkpoint_truncates_wal(file_engine, tmp_path):
+    """
+    Testa se o checkpoint copia o WAL para o banco e o TRUNCATE zera o arquivo -wal
+    """
+    with file_engine.begin() as conn:
+        for i in range(200):
+            conn.execute(text("INSERT INTO item (nome) VALUES (:nome)"), {"nome": f"item {i}"})
+    wal = tmp_path / "perfil.db-wal"
+    assert wal.stat().st_size > 0
+
+    busy, _, _ = checkpoint_wal(file_engine)
+    assert busy == 0
+
+    checkpoint_wal(file_engine, mode="TRUNCATE")
+    assert wal.stat().st_size == 0
+
+
+def test_memory_database_skips_pool_options():
+    """
+    Testa se bancos em memória mantêm o pool padrão (sem opções de QueuePool)
+    """
+    assert _engine_options("sqlite:///:memory:") == {"connect_args": {"check_same_thread": False}}
+    assert checkpoint_wal(create_engine("sqlite:///:memory:")) is None
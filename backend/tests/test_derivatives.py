@@ -0,0 +1,133 @@
+"""
+Testes das versões reduzidas das imagens (DerivativePipeline)
+"""
+import pytest
+from datetime import datetime, date, time, timedelta
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base
+from app.models import DERIVADOS_ERRO, DERIVADOS_PENDENTE, DERIVADOS_PRONTO, Media, Schedule
+from app.services.derivatives import DerivativePipeline, REGION_SIZES, render_derivatives
+from app.services.scheduler import SchedulerService
+
+
+@pytest.fixture
+def test_db():
+    # StaticPool: a conclusão do processamento grava o estado a partir de outra thread
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = DerivativePipeline(workers=1)
+    yield pipeline
+    pipeline.shutdown()
+
+
+def _foto(tmp_path, largura=3000, altura=2000, nome="foto.jpg"):
+    caminho = str(tmp_path / nome)
+    Image.new("RGB", (largura, altura), (200, 30, 30)).save(caminho, quality=90)
+    return caminho
+
+
+def test_render_derivatives_fits_each_region(tmp_path):
+    """
+    Testa se cada versão cabe na sua região mantendo a proporção
+    """
+    derivados = render_derivatives(_foto(tmp_path), REGION_SIZES)
+
+    assert set(derivados) == {1, 2}
+    for regiao, caminho in derivados.items():
+        largura, altura = REGION_SIZES[regiao]
+        with Image.open(caminho) as img:
+            assert img.format == "WEBP"
+            assert img.width <= largura and img.height <= altura
+            assert abs(img.width / img.height - 1.5) < 0.01
+    assert not any(nome.endswith(".part") for nome in os.listdir(tmp_path))
+
+
+def test_render_derivatives_skips_small_images(tmp_path):
+    """
+    Testa se uma imagem que já cabe nas regiões continua usando o original
+    """
+    assert render_derivatives(_foto(tmp_path, 400, 300), REGION_SIZES) == {}
+
+
+@pytest.mark.asyncio
+async def test_pipeline_points_active_content_at_derivative(tmp_path, test_db, pipeline):
+    """
+    Testa se, após o processamento, o conteúdo ativo aponta para a versão da região
+    """
+    media = Media(
+        tipo="imagem",
+        nome="Foto",
+        caminho_arquivo=_foto(tmp_path),
+        derivados_status=DERIVADOS_PENDENTE,
+        ativo=True
+    )
+    test_db.add(media)
+    test_db.commit()
+    test_db.add(Schedule(
+        media_id=media.id,
+        data_inicio=date.today() - timedelta(days=1),
+        data_fim=date.today() + timedelta(days=1),
+        hora_inicio=time(0, 0, 0),
+        hora_fim=time(23, 59, 59),
+        duracao=10,
+        dias_semana="0,1,2,3,4,5,6",
+        prioridade=1,
+        regiao=2,
+        ativo=True
+    ))
+    test_db.commit()
+    SchedulerService.rebuild_timeline(test_db)
+
+    now = datetime.combine(date.today(), time(12, 0))
+    assert SchedulerService.get_region_content(test_db, 2, now)["caminho_arquivo"] == media.caminho_arquivo
+
+    await pipeline.submit(test_db, media)
+    test_db.refresh(media)
+
+    assert media.derivados_status == DERIVADOS_PRONTO
+    assert set(media.derivados) == {"1", "2"}
+    content = SchedulerService.get_region_content(test_db, 2, now)
+    assert content["caminho_arquivo"] == media.derivados["2"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_error(tmp_path, test_db, pipeline):
+    """
+    Testa se um arquivo que não é imagem fica com estado de erro
+    """
+    caminho = tmp_path / "quebrada.jpg"
+    caminho.write_bytes(b"isto nao e uma imagem")
+    media = Media(tipo="imagem", nome="Quebrada", caminho_arquivo=str(caminho),
+                  derivados_status=DERIVADOS_PENDENTE, ativo=True)
+    test_db.add(media)
+    test_db.commit()
+
+    await pipeline.submit(test_db, media)
+    test_db.refresh(media)
+
+    assert media.derivados_status == DERIVADOS_ERRO
+    assert media.arquivo_para_regiao(2) == str(caminho)
@@ -0,0 +1,52 @@
+"""
+Testes unitários para a árvore de intervalos
+"""
+import random
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.interval_index import IntervalIndex
+
+
+def test_overlapping_matches_brute_force():
+    """
+    Testa se as consultas retornam exatamente os intervalos sobrepostos
+    """
+    rng = random.Random(42)
+    items = []
+    for i in range(2000):
+        inicio = rng.randint(0, 5000)
+        items.append((inicio, inicio + rng.randint(0, 300), i))
+    index = IntervalIndex(items)
+    
+    assert len(index) == len(items)
+    for _ in range(500):
+        inicio = rng.randint(-100, 5400)
+        fim = inicio + rng.randint(0, 200)
+        expected = sorted(v for lo, hi, v in items if lo <= fim and hi >= inicio)
+        assert sorted(index.overlapping(inicio, fim)) == expected
+
+
+def test_stab_includes_endpoints():
+    """
+    Testa se os intervalos são fechados nas duas pontas
+    """
+    index = IntervalIndex([(10, 20, "a"), (20, 30, "b"), (31, 40, "c")])
+    
+    assert sorted(index.stab(20)) == ["a", "b"]
+    assert index.stab(30) == ["b"]
+    assert index.stab(9) == []
+    assert index.stab(41) == []
+
+
+def test_empty_index():
+    """
+    Testa consultas em um índice vazio
+    """
+    index = IntervalIndex()
+    
+    assert len(index) == 0
+    assert index.overlapping(0, 100) == []
@@ -0,0 +1,107 @@
+"""
+Testes da entrega dos arquivos de mídia (/media)
+"""
+import hashlib
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import media_files
+from app.services.media_files import MEDIA_CACHE_CONTROL, MediaFiles, media_url
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    """
+    UPLOAD_DIR temporário com um vídeo endereçado por conteúdo
+    """
+    monkeypatch.setattr(media_files, "UPLOAD_DIR", str(tmp_path))
+    data = os.urandom(256 * 1024)
+    sha = hashlib.sha256(data).hexdigest()
+    os.makedirs(tmp_path / "objects" / sha[:2])
+    (tmp_path / "objects" / sha[:2] / f"{sha}.mp4").write_bytes(data)
+    return tmp_path, sha, data
+
+
+@pytest.fixture
+def client(uploads):
+    app = FastAPI()
+    app.mount("/media", MediaFiles(directory=str(uploads[0])), name="media")
+    return TestClient(app)
+
+
+def test_immutable_cache_headers(client, uploads):
+    """
+    Testa os cabeçalhos de cache e o ETag derivado do hash
+    """
+    _, sha, data = uploads
+    response = client.get(f"/media/objects/{sha[:2]}/{sha}.mp4")
+
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["cache-control"] == MEDIA_CACHE_CONTROL
+    assert response.headers["etag"] == f'"{sha}.mp4"'
+    assert "last-modified" in response.headers
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_range_request_for_seek(client, uploads):
+    """
+    Testa se um pedido de faixa retorna 206 apenas com os bytes pedidos
+    """
+    _, sha, data = uploads
+    response = client.get(
+        f"/media/objects/{sha[:2]}/{sha}.mp4",
+        headers={"Range": "bytes=1000-1999"}
+    )
+
+    assert response.status_code == 206
+    assert response.content == data[1000:2000]
+    assert response.headers["content-range"] == f"bytes 1000-1999/{len(data)}"
+
+
+def test_conditional_request_returns_304(client, uploads):
+    """
+    Testa se o navegador que já tem o arquivo recebe 304
+    """
+    _, sha, _ = uploads
+    response = client.get(
+        f"/media/objects/{sha[:2]}/{sha}.mp4",
+        headers={"If-None-Match": f'"{sha}.mp4"'}
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_incoming_uploads_are_not_served(client, uploads):
+    """
+    Testa se arquivos de uploads em andamento não são expostos
+    """
+    tmp_path = uploads[0]
+    os.makedirs(tmp_path / "objects" / "incoming")
+    (tmp_path / "objects" / "incoming" / "abc.part").write_bytes(b"parcial")
+
+    assert client.get("/media/objects/incoming/abc.part").status_code == 404
+
+
+def test_media_url_is_versioned(uploads):
+    """
+    Testa se a URL muda com o conteúdo: hash no nome ou ?v= nos arquivos antigos
+    """
+    tmp_path, sha, _ = uploads
+    caminho = str(tmp_path / "objects" / sha[:2] / f"{sha}.mp4")
+    assert media_url(caminho, sha) == f"/media/objects/{sha[:2]}/{sha}.mp4"
+
+    antigo = tmp_path / "20240101_120000_video.mp4"
+    antigo.write_bytes(b"video antigo")
+    assert media_url(str(antigo), "ab" * 32) == f"/media/20240101_120000_video.mp4?v={'ab' * 8}"
+    assert media_url(str(antigo)).startswith("/media/20240101_120000_video.mp4?v=")
+
+    # Fora do UPLOAD_DIR (ex.: links) não há URL
+    assert media_url("https://youtube.com/watch?v=1") is None
@@ -0,0 +1,238 @@
+"""
+Testes das métricas (formato de exposição, middleware por rota e consultas por requisição)
+"""
+import asyncio
+import re
+import time as timer
+import httpx
+import pytest
+from datetime import date, time
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base, DbSession, get_db, get_session
+from app.models import Media, Schedule
+from app.routers import media, player, schedule
+from app.services.metrics import (
+    CONTENT_TYPE,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsMiddleware,
+    Registry,
+    instrument_sqlalchemy,
+)
+
+
+def build_app(override) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(media.router)
+    app.include_router(schedule.router)
+    app.include_router(player.router)
+    app.dependency_overrides.update(override)
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    return app
+
+
+@pytest.fixture
+def client():
+    """
+    App com o middleware de métricas e os routers em um banco em memória
+    """
+    instrument_sqlalchemy()
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = TestingSessionLocal()
+    aviso = Media(tipo="texto", nome="Aviso", texto="Olá", ativo=True)
+    db.add(aviso)
+    db.flush()
+    db.add(Schedule(
+        media_id=aviso.id, regiao=4,
+        data_inicio=date(2020, 1, 1), data_fim=date(2099, 12, 31),
+        hora_inicio=time(0, 0, 0), hora_fim=time(23, 59, 59)
+    ))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    return TestClient(build_app({get_db: override_get_db}))
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """
+    Valor de uma série no texto de /metrics (0 se ainda não existe)
+    """
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = re.match(r'([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+        if found == {k: str(v) for k, v in labels.items()}:
+            return float(match.group(3))
+    return 0.0
+
+
+def test_exposition_format():
+    """
+    Testa o texto gerado: HELP/TYPE, rótulos escapados e buckets acumulados
+    """
+    registry = Registry()
+    requests = Counter("app_requests_total", "Requisições", ("rota",), registry=registry)
+    latency = Histogram("app_latency_seconds", "Latência", buckets=(0.1, 1.0), registry=registry)
+    ativos = Gauge("app_ativos", "Em andamento", registry=registry)
+
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    for valor in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(valor)
+    ativos.inc()
+    ativos.inc()
+    ativos.dec()
+
+    text = registry.render()
+    assert "# HELP app_requests_total Requisições\n# TYPE app_requests_total counter\n" in text
+    assert 'app_requests_total{rota="/a\\"b"} 3\n' in text
+    assert 'app_latency_seconds_bucket{le="0.1"} 2\n' in text
+    assert 'app_latency_seconds_bucket{le="1.0"} 3\n' in text
+    assert 'app_latency_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "app_latency_seconds_count 4\n" in text
+    assert sample(text, "app_latency_seconds_sum") == pytest.approx(3.65)
+    assert "# TYPE app_ativos gauge\napp_ativos 1\n" in text
+
+    with pytest.raises(ValueError):
+        requests.labels()
+    with pytest.raises(ValueError):
+        Counter("app_requests_total", "Duplicada", registry=registry)
+
+
+def test_requests_grouped_by_route_template(client):
+    """
+    Testa se a latência e a contagem usam o modelo da rota, não a URL
+    """
+    before = client.get("/metrics").text
+    for schedule_id in (1, 2, 3):
+        client.get(f"/api/schedule/{schedule_id}")
+    client.get("/rota/que/nao/existe")
+    after = client.get("/metrics")
+
+    assert after.headers["content-type"] == CONTENT_TYPE
+    route = "/api/schedule/{schedule_id}"
+    delta = lambda name, **labels: sample(after.text, name, **labels) - sample(before, name, **labels)
+    assert delta("http_requests_total", method="GET", route=route, status=200) == 1
+    assert delta("http_requests_total", method="GET", route=route, status=404) == 2
+    assert delta("http_request_duration_seconds_count", method="GET", route=route) == 3
+    assert delta("http_requests_total", method="GET", route="desconhecida", status=404) == 1
+    assert sample(after.text, "http_requests_in_progress") == 1  # a própria leitura de /metrics
+
+
+def test_db_queries_counted_per_request(client):
+    """
+    Testa se as consultas SQL de cada requisição são somadas à rota
+    """
+    before = client.get("/metrics").text
+    client.get("/api/schedule/")
+    client.get("/api/schedule/")
+    after = client.get("/metrics").text
+
+    route = "/api/schedule/"
+    delta = lambda name, **labels: sample(after, name, **labels) - sample(before, name, **labels)
+    assert delta("http_request_db_queries_count", route=route) == 2
+    # Uma consulta por listagem (ver test_admin_router.py)
+    assert delta("http_request_db_queries_sum", route=route) == 2
+    assert delta("http_request_db_seconds_sum", route=route) > 0
+    assert delta("db_query_duration_seconds_count") >= 2
+
+
+def test_scheduler_counters(client):
+    """
+    Testa os contadores do agendador e do cache da linha do tempo
+    """
+    before = client.get("/metrics").text
+    for _ in range(3):
+        assert client.get("/api/player/active-content/region/4").json()["texto"] == "Olá"
+    after = client.get("/metrics").text
+
+    delta = lambda name, **labels: sample(after, name, **labels) - sample(before, name, **labels)
+    assert delta("scheduler_lookups_total", consulta="regiao") == 3
+    assert delta("scheduler_timeline_cache_total", resultado="hit") + delta("scheduler_timeline_cache_total", resultado="miss") >= 3
+    assert sample(after, "scheduler_timeline_build_seconds_count") >= 1
+
+
+@pytest.mark.asyncio
+async def test_db_queries_counted_in_async_mode(tmp_path):
+    """
+    Testa a contagem por requisição com o engine assíncrono (consultas em greenlet)
+    """
+    instrument_sqlalchemy()
+    url = f"sqlite:///{tmp_path / 'metricas.db'}"
+    Base.metadata.create_all(bind=create_engine(url))
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_session():
+        async with AsyncSessionLocal() as session:
+            yield DbSession(session)
+
+    transport = httpx.ASGITransport(app=build_app({get_session: override_get_session}))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        before = (await client.get("/metrics")).text
+        assert (await client.get("/api/schedule/")).status_code == 200
+        after = (await client.get("/metrics")).text
+    await async_engine.dispose()
+
+    route = "/api/schedule/"
+    assert sample(after, "http_request_db_queries_sum", route=route) - sample(before, "http_request_db_queries_sum", route=route) == 1
+
+
+def test_middleware_overhead():
+    """
+    Testa se o middleware custa poucos microssegundos por requisição
+    """
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop(message):
+        pass
+
+    async def run(asgi, n):
+        scope = {"type": "http", "method": "GET", "path": "/"}
+        inicio = timer.perf_counter()
+        for _ in range(n):
+            await asgi(scope, None, noop)
+        return (timer.perf_counter() - inicio) / n
+
+    n = 5000
+    base = asyncio.run(run(app, n))
+    medido = asyncio.run(run(MetricsMiddleware(app), n))
+    assert medido - base < 100e-6
@@ -0,0 +1,109 @@
+"""
+Testes das migrações aplicadas na inicialização
+"""
+from sqlalchemy import create_engine, inspect, text
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.migrations import run_migrations
+from app.models import parse_dias_semana, format_dias_semana
+
+
+def _legacy_engine():
+    """
+    Cria um banco no formato antigo (dias_semana como texto)
+    """
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE schedule ("
+            "id INTEGER PRIMARY KEY, media_id INTEGER NOT NULL, regiao INTEGER NOT NULL, "
+            "data_inicio DATE NOT NULL, data_fim DATE NOT NULL, "
+            "hora_inicio TIME NOT NULL, hora_fim TIME NOT NULL, duracao INTEGER, "
+            "dias_semana VARCHAR(50), prioridade INTEGER, ativo BOOLEAN, criado_em DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO schedule (id, media_id, regiao, data_inicio, data_fim, hora_inicio, hora_fim, dias_semana) "
+            "VALUES (1, 1, 1, '2024-01-01', '2024-12-31', '08:00:00', '18:00:00', '1,2,3,4,5'), "
+            "(2, 1, 1, '2024-01-01', '2024-12-31', '08:00:00', '18:00:00', NULL), "
+            "(3, 1, 1, '2024-01-01', '2024-12-31', '08:00:00', '18:00:00', '0,6')"
+        ))
+    return engine
+
+
+def test_dias_mask_backfill():
+    """
+    Testa se a migração preenche dias_mask a partir da string antiga
+    """
+    engine = _legacy_engine()
+    run_migrations(engine)
+    
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT id, dias_mask FROM schedule")).all())
+    assert rows == {1: 0b0111110, 2: 0b1111111, 3: 0b1000001}
+
+
+def test_migrations_are_idempotent():
+    """
+    Testa se executar as migrações de novo não altera o banco
+    """
+    engine = _legacy_engine()
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE schedule SET dias_mask = 2 WHERE id = 1"))
+    run_migrations(engine)
+    
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT dias_mask FROM schedule WHERE id = 1")).scalar() == 2
+
+
+def test_dias_semana_round_trip():
+    """
+    Testa a conversão entre a string da API e a máscara de bits
+    """
+    assert parse_dias_semana("0,1,2,3,4,5,6") == 0x7F
+    assert format_dias_semana(parse_dias_semana("5,1,3")) == "1,3,5"
+
+
+def test_indexes_created_on_existing_database():
+    """
+    Testa se os índices dos modelos são criados em bancos que já existiam
+    """
+    engine = _legacy_engine()
+    run_migrations(engine)
+    run_migrations(engine)
+    
+    indexes = {index["name"] for index in inspect(engine).get_indexes("schedule")}
+    assert "ix_schedule_regiao_ativo_periodo" in indexes
+
+
+def test_weather_cache_compacted_to_latest_row():
+    """
+    Testa se o histórico do cache de clima é reduzido à linha mais recente de cada cidade
+    """
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE weather_cache (id INTEGER PRIMARY KEY, cidade VARCHAR(100) NOT NULL, "
+            "temperatura INTEGER, condicao VARCHAR(100), icone VARCHAR(10), "
+            "data_cache DATETIME, dados_completos JSON)"
+        ))
+        rows = [
+            {"cidade": cidade, "temperatura": i, "data_cache": f"2024-01-01 00:{i:02d}:00"}
+            for i in range(50) for cidade in ("Goiania", "Anapolis")
+        ]
+        conn.execute(text(
+            "INSERT INTO weather_cache (cidade, temperatura, data_cache) "
+            "VALUES (:cidade, :temperatura, :data_cache)"
+        ), rows)
+    run_migrations(engine)
+    run_migrations(engine)
+    
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT cidade, temperatura FROM weather_cache ORDER BY cidade")).all()
+    assert [tuple(row) for row in rows] == [("Anapolis", 49), ("Goiania", 49)]
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("weather_cache")}
+    assert indexes["ux_weather_cache_cidade"]["unique"]
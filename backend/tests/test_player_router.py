@@ -0,0 +1,122 @@
+"""
+Testes dos endpoints do player (cabeçalhos de cache condicional)
+"""
+import pytest
+from datetime import date, time, timedelta
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base, get_db
+from app.models import Media, Schedule
+from app.routers import player
+
+
+@pytest.fixture
+def client():
+    """
+    App com o router do player usando um banco em memória compartilhado entre threads
+    """
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+    
+    db = TestingSessionLocal()
+    media = Media(tipo="texto", nome="Aviso", texto="Texto do aviso", ativo=True)
+    db.add(media)
+    db.commit()
+    db.add(Schedule(
+        media_id=media.id,
+        data_inicio=date.today() - timedelta(days=1),
+        data_fim=date.today() + timedelta(days=1),
+        hora_inicio=time(0, 0, 0),
+        hora_fim=time(23, 59, 59),
+        duracao=10,
+        dias_semana="0,1,2,3,4,5,6",
+        prioridade=1,
+        regiao=4,
+        ativo=True
+    ))
+    db.commit()
+    db.close()
+    
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+    
+    app = FastAPI()
+    app.include_router(player.router)
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.mark.parametrize("path", ["/api/player/active-content", "/api/player/active-content/region/4"])
+def test_conditional_request_returns_304(client, path):
+    """
+    Testa se um If-None-Match com o ETag atual recebe 304 sem corpo
+    """
+    first = client.get(path)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    # Fraco: o corpo traz o timestamp da consulta, que não entra no ETag
+    assert etag.startswith('W/"')
+    
+    second = client.get(path, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+
+def test_stale_etag_returns_full_response(client):
+    """
+    Testa se um ETag antigo recebe o conteúdo completo
+    """
+    response = client.get(
+        "/api/player/active-content/region/4",
+        headers={"If-None-Match": '"0/4:-"'}
+    )
+    assert response.status_code == 200
+    assert response.json()["texto"] == "Texto do aviso"
+
+
+def test_etag_not_reused_after_restart(client, monkeypatch):
+    """
+    Testa se um ETag de antes de um reinício (geração recomeçando do 1) não
+    recebe 304 com o mesmo agendamento, mídia e posição
+    """
+    from app.services import timeline
+    
+    path = "/api/player/active-content/region/4"
+    antigo = client.get(path).headers["etag"]
+    # Outro processo: mesma geração e mesmo conteúdo resolvido
+    monkeypatch.setattr(timeline, "INSTANCIA", "reinicio")
+    response = client.get(path, headers={"If-None-Match": antigo})
+    assert response.status_code == 200
+    assert response.headers["etag"] != antigo
+    assert response.headers["etag"].split("/", 2)[2] == antigo.split("/", 2)[2]
+
+
+def test_weather_etag(client):
+    """
+    Testa o ETag do clima (dados de fallback sem chave de API)
+    """
+    first = client.get("/api/player/weather")
+    assert first.status_code == 200
+    
+    second = client.get("/api/player/weather", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
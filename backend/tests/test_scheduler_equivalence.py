@@ -0,0 +1,218 @@
+"""
+Equivalência aleatória entre os resolvedores do conteúdo ativo e a implementação
+de referência (SchedulerService._get_content_for_regions, direto no banco)
+
+Cada caso gera um conjunto aleatório de mídias e agendamentos (regiões, períodos,
+horários, dias da semana, prioridades, durações e itens inativos) e compara as
+respostas em instantes aleatórios e nas bordas dos agendamentos. Um resolvedor
+novo (índice, cache) entra em RESOLVERS e passa a ser comparado em todos os casos.
+"""
+import random
+import pytest
+from datetime import datetime, date, time, timedelta
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base
+from app.models import Media, Schedule
+from app.services.scheduler import REGIOES, SchedulerService
+from app.services.timeline import ScheduleTimeline, time_to_us, us_to_time
+
+REGIOES_PLAYER = [regiao for regiao, _ in REGIOES]
+TIPOS = {1: "video", 2: "imagem", 4: "texto"}
+BASE = date(2026, 3, 1)
+SEEDS = range(8)
+
+
+@pytest.fixture
+def test_db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def random_time(rng: random.Random) -> time:
+    # Metade em minutos cheios (colisões entre agendamentos), metade com segundos
+    if rng.random() < 0.5:
+        return time(rng.randrange(24), rng.choice((0, 15, 30, 45)))
+    return us_to_time(rng.randrange(86400) * 1_000_000)
+
+
+def seed_random_schedules(db, rng: random.Random, medias: int, schedules: int) -> List[Schedule]:
+    """
+    Mídias e agendamentos aleatórios, concentrados em poucos dias para haver sobreposição
+    """
+    items = []
+    for i in range(medias):
+        regiao = rng.choice(REGIOES_PLAYER)
+        tipo = TIPOS[regiao]
+        items.append(Media(
+            tipo=tipo,
+            nome=f"{tipo} {i}",
+            caminho_arquivo=None if tipo == "texto" else f"uploads/{tipo}_{i}.bin",
+            texto=f"texto {i}" if tipo == "texto" else None,
+            derivados={str(regiao): f"uploads/derivados/{i}.webp"} if tipo == "imagem" and rng.random() < 0.5 else None,
+            ativo=rng.random() > 0.1,
+        ))
+    db.add_all(items)
+    db.flush()
+
+    rows = []
+    for _ in range(schedules):
+        media = rng.choice(items)
+        inicio = BASE + timedelta(days=rng.randrange(10))
+        hora_inicio, hora_fim = sorted((random_time(rng), random_time(rng)))
+        if rng.random() < 0.2:
+            hora_inicio, hora_fim = time(0, 0, 0), time(23, 59, 59)
+        rows.append(Schedule(
+            media_id=media.id,
+            regiao=[r for r, t in TIPOS.items() if t == media.tipo][0],
+            data_inicio=inicio,
+            data_fim=inicio + timedelta(days=rng.randrange(10)),
+            hora_inicio=hora_inicio,
+            hora_fim=hora_fim,
+            duracao=rng.choice((1, 5, 7, 10, 30, 60)),
+            dias_mask=rng.choice((0b1111111, 0b0111110, 0b1000001, rng.randint(1, 0b1111111))),
+            prioridade=rng.randint(1, 4),
+            ativo=rng.random() > 0.1,
+        ))
+    db.add_all(rows)
+    db.commit()
+    # Prioridade nula só chega por atualização (na criação vale o default)
+    for row in rows:
+        if rng.random() < 0.15:
+            row.prioridade = None
+    db.commit()
+    return rows
+
+
+def random_instants(rng: random.Random, schedules: List[Schedule], count: int) -> List[datetime]:
+    """
+    Instantes aleatórios mais as bordas dos agendamentos (início, fim e vizinhos)
+    """
+    instants = [
+        datetime.combine(BASE + timedelta(days=rng.randrange(-1, 21)), us_to_time(rng.randrange(86400 * 1_000_000)))
+        for _ in range(count)
+    ]
+    for schedule in rng.sample(schedules, min(len(schedules), count // 20)):
+        for dia in (schedule.data_inicio, schedule.data_fim, schedule.data_fim + timedelta(days=1)):
+            for us in (time_to_us(schedule.hora_inicio), time_to_us(schedule.hora_fim)):
+                for delta in (-1_000_000, -1, 0, 1, 1_000_000):
+                    if 0 <= us + delta < 86400 * 1_000_000:
+                        instants.append(datetime.combine(dia, us_to_time(us + delta)))
+    return instants
+
+
+def reference(db, instant: datetime) -> Dict[int, Optional[Dict]]:
+    return SchedulerService._get_content_for_regions(
+        db, REGIOES_PLAYER, instant.date(), instant.time(), (instant.weekday() + 1) % 7
+    )
+
+
+def find_mismatches(db, resolver: Callable[[int, datetime], Optional[Dict]], instants: List[datetime], expected_by_instant=None) -> list:
+    """
+    (instante, região, esperado, obtido) de cada resposta diferente da referência
+    """
+    mismatches = []
+    for i, instant in enumerate(instants):
+        expected = expected_by_instant[i] if expected_by_instant else reference(db, instant)
+        for regiao in REGIOES_PLAYER:
+            got = resolver(regiao, instant)
+            if got != expected[regiao]:
+                mismatches.append((instant, regiao, expected[regiao], got))
+    return mismatches
+
+
+def timeline_resolver(db):
+    timeline = ScheduleTimeline.build(db)
+    return timeline.content_at
+
+
+def playout_resolver(db):
+    """
+    Conteúdo no instante pelo primeiro trecho da sequência de exibição (iter_playout)
+    """
+    timeline = ScheduleTimeline.build(db)
+
+    def resolve(regiao: int, instant: datetime) -> Optional[Dict]:
+        for inicio_us, fim_us, entry in timeline.iter_playout(regiao, instant, instant + timedelta(microseconds=1)):
+            return entry.to_content() if inicio_us == 0 else None
+        return None
+
+    return resolve
+
+
+# Resolvedores comparados com a referência: nome -> fábrica(db) -> resolver(regiao, instante)
+RESOLVERS = {
+    "timeline": timeline_resolver,
+    "playout": playout_resolver,
+}
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_resolvers_match_reference(test_db, seed):
+    """
+    Testa se cada resolvedor responde igual à referência em um conjunto aleatório
+    """
+    rng = random.Random(seed)
+    schedules = seed_random_schedules(test_db, rng, medias=rng.randint(1, 15), schedules=rng.randint(1, 60))
+    instants = random_instants(rng, schedules, 120)
+    expected = [reference(test_db, instant) for instant in instants]
+
+    for nome, factory in RESOLVERS.items():
+        mismatches = find_mismatches(test_db, factory(test_db), instants, expected)
+        assert not mismatches, f"{nome}, seed={seed}: {len(mismatches)} diferenças, a primeira: {mismatches[0]}"
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_simulation_matches_reference(test_db, seed):
+    """
+    Testa se as sequências da simulação reproduzem a referência em cada passo amostrado
+    """
+    rng = random.Random(seed)
+    seed_random_schedules(test_db, rng, medias=rng.randint(1, 15), schedules=rng.randint(1, 60))
+    inicio = datetime.combine(BASE + timedelta(days=rng.randrange(10)), us_to_time(rng.randrange(86400) * 1_000_000))
+    resolucao = rng.choice((1, 7, 60, 900))
+    fim = inicio + timedelta(seconds=resolucao * rng.randint(1, 2000))
+
+    simulacao = SchedulerService.simulate(test_db, inicio, fim, resolucao)
+    passos = simulacao["passos"]
+    for regiao in REGIOES_PLAYER:
+        sequencias = simulacao["regioes"][str(regiao)]
+        # Cobrem todos os passos, em ordem e sem repetir o item na emenda
+        assert sum(quantidade for _, quantidade, _ in sequencias) == passos
+        assert all(a[0] + a[1] == b[0] and a[2] != b[2] for a, b in zip(sequencias, sequencias[1:]))
+
+        for passo in rng.sample(range(passos), min(passos, 40)):
+            ref = next(ref for primeiro, quantidade, ref in sequencias if primeiro <= passo < primeiro + quantidade)
+            got = simulacao["itens"][ref] if ref is not None else None
+            instant = inicio + timedelta(seconds=passo * resolucao)
+            assert got == reference(test_db, instant)[regiao], f"seed={seed}, região {regiao}, passo {passo}"
+
+
+def test_checker_detects_differences(test_db):
+    """
+    Testa se o verificador aponta um resolvedor que erra a rotação
+    """
+    rng = random.Random(1)
+    schedules = seed_random_schedules(test_db, rng, medias=5, schedules=40)
+    instants = random_instants(rng, schedules, 60)
+    timeline = ScheduleTimeline.build(test_db)
+
+    def sem_rotacao(regiao: int, instant: datetime) -> Optional[Dict]:
+        # Sempre o primeiro da rotação (ignora as durações)
+        cycle = timeline.day_plan(regiao, instant.date()).cycle_at(time_to_us(instant.time()))
+        return cycle.entries[0].to_content() if cycle else None
+
+    assert find_mismatches(test_db, sem_rotacao, instants)
@@ -2,8 +2,9 @@
 Testes unitários para o serviço SchedulerService
 """
 import pytest
+from contextlib import contextmanager
 from datetime import datetime, date, time, timedelta
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 import sys
 import os
@@ -14,6 +15,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.database import Base
 from app.models import Media, Schedule
 from app.services.scheduler import SchedulerService
+from app.services.timeline import ScheduleTimeline
 
 
 # Configuração do banco de dados de teste
@@ -87,6 +89,24 @@ def sample_text_media(test_db):
     return media
 
 
+@contextmanager
+def count_queries(db):
+    """
+    Conta as instruções SQL executadas na engine da sessão
+    """
+    engine = db.get_bind()
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 class TestGetActiveContent:
     """
     Testes para o método get_active_content
@@ -362,5 +382,450 @@ class TestGetActiveContent:
         assert result["imagem"] is None
 
 
+class TestScheduleTimeline:
+    """
+    Testes para a linha do tempo compilada
+    """
+    
+    def _add_schedule(self, db, media, regiao, duracao, prioridade, **kwargs):
+        today = date.today()
+        schedule = Schedule(
+            media_id=media.id,
+            data_inicio=kwargs.get("data_inicio", today - timedelta(days=1)),
+            data_fim=kwargs.get("data_fim", today + timedelta(days=1)),
+            hora_inicio=kwargs.get("hora_inicio", time(0, 0, 0)),
+            hora_fim=kwargs.get("hora_fim", time(23, 59, 59)),
+            duracao=duracao,
+            dias_semana=kwargs.get("dias_semana", "0,1,2,3,4,5,6"),
+            prioridade=prioridade,
+            regiao=regiao,
+            ativo=True
+        )
+        db.add(schedule)
+        db.commit()
+        return schedule
+    
+    def test_timeline_matches_reference_rotation(self, test_db, sample_video_media, sample_image_media):
+        """
+        Testa se a linha do tempo reproduz a rotação calculada pelo banco
+        """
+        self._add_schedule(test_db, sample_video_media, 1, 30, 1)
+        self._add_schedule(test_db, sample_image_media, 1, 10, 2)
+        self._add_schedule(
+            test_db, sample_image_media, 1, 5, 1,
+            hora_inicio=time(8, 0, 0), hora_fim=time(12, 0, 0)
+        )
+        
+        timeline = ScheduleTimeline.build(test_db)
+        base = datetime.combine(date.today(), time(0, 0, 0))
+        for offset in range(0, 86400, 97):
+            instant = base + timedelta(seconds=offset)
+            expected = SchedulerService._get_content_for_region(
+                test_db, 1, instant.date(), instant.time(), (instant.weekday() + 1) % 7
+            )
+            assert timeline.content_at(1, instant) == expected
+    
+    def test_timeline_answers_without_database(self, test_db, sample_text_media):
+        """
+        Testa se a linha do tempo responde mesmo com a sessão fechada
+        """
+        self._add_schedule(test_db, sample_text_media, 4, 10, 1)
+        media_id = sample_text_media.id
+        timeline = ScheduleTimeline.build(test_db)
+        test_db.close()
+        
+        content = timeline.content_at(4, datetime.now())
+        assert content["id"] == media_id
+        assert content["texto"] == "Este é um texto de teste"
+    
+    def test_rebuild_timeline_after_write(self, test_db, sample_video_media):
+        """
+        Testa se a reconstrução substitui a linha do tempo em uso
+        """
+        assert SchedulerService.get_active_content(test_db)["video"] is None
+        
+        schedule = self._add_schedule(test_db, sample_video_media, 1, 30, 1)
+        old_timeline = SchedulerService.get_timeline(test_db)
+        new_timeline = SchedulerService.rebuild_timeline(test_db)
+        
+        assert new_timeline is not old_timeline
+        assert new_timeline.generation > old_timeline.generation
+        assert SchedulerService.get_active_content(test_db)["video"]["schedule_id"] == schedule.id
+
+    def test_manifest_matches_timeline(self, test_db, sample_video_media, sample_image_media):
+        """
+        Testa se o manifesto expandido reproduz o conteúdo resolvido segundo a segundo
+        """
+        self._add_schedule(test_db, sample_video_media, 2, 7, 1)
+        self._add_schedule(test_db, sample_image_media, 2, 5, 2)
+        self._add_schedule(
+            test_db, sample_image_media, 2, 3, 1,
+            hora_inicio=time(10, 0, 30), hora_fim=time(10, 20, 0)
+        )
+        
+        now = datetime.combine(date.today(), time(9, 58, 17, 250000))
+        manifest = SchedulerService.get_manifest(test_db, hours=1, now=now)
+        timeline = SchedulerService.get_timeline(test_db)
+        
+        assert manifest["regioes"]["1"] == []
+        assert len(manifest["itens"]) == 3
+        sequencia = manifest["regioes"]["2"]
+        for offset_ms in range(0, 3600 * 1000, 1000):
+            esperado = timeline.content_at(2, now + timedelta(milliseconds=offset_ms))
+            atual = [
+                manifest["itens"][ref] for inicio, duracao, ref in sequencia
+                if inicio <= offset_ms < inicio + duracao
+            ]
+            assert atual == [esperado]
+
+    def test_conflicts_respect_dates_times_and_weekdays(self, test_db, sample_video_media, sample_image_media):
+        """
+        Testa se a checagem de sobreposição considera datas, horários e dias da semana
+        """
+        monday = date.today() - timedelta(days=date.today().weekday())
+        manha = self._add_schedule(
+            test_db, sample_video_media, 1, 10, 1,
+            data_inicio=monday, data_fim=monday + timedelta(days=13),
+            hora_inicio=time(8, 0, 0), hora_fim=time(12, 0, 0),
+            dias_semana="1,2,3,4,5"
+        )
+        self._add_schedule(
+            test_db, sample_image_media, 2, 10, 1,
+            data_inicio=monday, data_fim=monday + timedelta(days=13)
+        )
+        
+        def conflicts(**kwargs):
+            params = dict(
+                regiao=1, data_inicio=monday, data_fim=monday + timedelta(days=13),
+                hora_inicio=time(11, 0, 0), hora_fim=time(14, 0, 0)
+            )
+            params.update(kwargs)
+            return [c["schedule_id"] for c in SchedulerService.find_conflicts(test_db, **params)]
+        
+        assert conflicts() == [manha.id]
+        assert conflicts(hora_inicio=time(12, 0, 1)) == []
+        assert conflicts(dias_semana="0,6") == []
+        # Apenas o sábado da primeira semana: a janela não inclui dias úteis
+        saturday = monday + timedelta(days=5)
+        assert conflicts(data_inicio=saturday, data_fim=saturday) == []
+        assert conflicts(data_inicio=monday + timedelta(days=14), data_fim=monday + timedelta(days=20)) == []
+        assert conflicts(exclude_schedule_id=manha.id) == []
+    
+    def test_timeline_skips_expired_history(self, test_db, sample_text_media):
+        """
+        Testa se a linha do tempo guardada deixa de fora os agendamentos encerrados
+        e se consultas a dias passados ainda veem o histórico
+        """
+        today = date.today()
+        antigo = self._add_schedule(
+            test_db, sample_text_media, 4, 10, 1,
+            data_inicio=today - timedelta(days=30), data_fim=today - timedelta(days=10)
+        )
+        atual = self._add_schedule(test_db, sample_text_media, 4, 10, 1)
+        
+        timeline = SchedulerService.rebuild_timeline(test_db)
+        assert timeline.desde == today
+        assert [e.schedule_id for e in timeline._regions[4].stab(today.toordinal())] == [atual.id]
+        assert timeline.conflicts(4, today - timedelta(days=20), today - timedelta(days=20), time(0), time(23)) == []
+        
+        passado = datetime.combine(today - timedelta(days=20), time(12, 0))
+        assert SchedulerService.get_region_content(test_db, 4, passado)["schedule_id"] == antigo.id
+        assert SchedulerService.get_timeline(test_db) is timeline
+    
+    def test_backdated_conflicts_read_only_the_window(self, test_db, sample_text_media, monkeypatch):
+        """
+        Testa se conflitos de uma janela no passado veem os agendamentos
+        encerrados sem remontar o histórico inteiro (só os da janela)
+        """
+        today = date.today()
+        antigo = self._add_schedule(
+            test_db, sample_text_media, 4, 10, 1,
+            data_inicio=today - timedelta(days=30), data_fim=today - timedelta(days=20)
+        )
+        self._add_schedule(
+            test_db, sample_text_media, 4, 10, 1,
+            data_inicio=today - timedelta(days=90), data_fim=today - timedelta(days=60)
+        )
+        atual = self._add_schedule(
+            test_db, sample_text_media, 4, 10, 1,
+            data_inicio=today - timedelta(days=5), data_fim=today + timedelta(days=5)
+        )
+        SchedulerService.rebuild_timeline(test_db)
+        
+        def build(*args, **kwargs):
+            raise AssertionError("histórico remontado")
+        monkeypatch.setattr(ScheduleTimeline, "build", build)
+        
+        conflitos = SchedulerService.find_conflicts(
+            test_db, 4, today - timedelta(days=25), today, time(0), time(23, 59)
+        )
+        assert sorted(c["schedule_id"] for c in conflitos) == sorted([antigo.id, atual.id])
+    
+    def test_refresh_coalesces_concurrent_writes(self, tmp_path, monkeypatch):
+        """
+        Testa se pedidos de reconstrução feitos durante uma montagem são
+        atendidos juntos pela montagem seguinte
+        """
+        import threading
+        import time as timer
+        from app.services.timeline import TimelineStore
+        
+        engine = create_engine(f"sqlite:///{tmp_path / 'timeline.db'}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        store = TimelineStore()
+        montagens = []
+        build = ScheduleTimeline.build
+        
+        def slow_build(db, generation=0, desde=None):
+            montagens.append(generation)
+            timer.sleep(0.05)
+            return build(db, generation, desde)
+        
+        monkeypatch.setattr(ScheduleTimeline, "build", staticmethod(slow_build))
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(store.refresh(engine))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+            timer.sleep(0.005)
+        for thread in threads:
+            thread.join()
+        
+        # A primeira montagem mais uma para os pedidos que chegaram durante ela
+        assert 2 <= len(montagens) <= 3
+        assert resultados[-1].generation == max(montagens)
+        engine.dispose()
+
+
+class TestQueryCount:
+    """
+    Garante um número fixo de consultas por chamada, independente do número de regiões
+    """
+    
+    @pytest.fixture
+    def busy_schedule(self, test_db, sample_video_media, sample_image_media, sample_text_media):
+        today = date.today()
+        for media, regiao in [
+            (sample_video_media, 1), (sample_image_media, 1),
+            (sample_image_media, 2), (sample_video_media, 2),
+            (sample_text_media, 4), (sample_text_media, 4)
+        ]:
+            test_db.add(Schedule(
+                media_id=media.id,
+                data_inicio=today - timedelta(days=1),
+                data_fim=today + timedelta(days=1),
+                hora_inicio=time(0, 0, 0),
+                hora_fim=time(23, 59, 59),
+                duracao=10,
+                dias_semana="0,1,2,3,4,5,6",
+                prioridade=1,
+                regiao=regiao,
+                ativo=True
+            ))
+        test_db.commit()
+        test_db.expire_all()
+    
+    def test_active_content_query_count(self, test_db, busy_schedule):
+        """
+        Testa se o conteúdo ativo usa uma consulta para montar a linha do tempo e nenhuma depois
+        """
+        with count_queries(test_db) as statements:
+            result = SchedulerService.get_active_content(test_db)
+        assert len(statements) == 1
+        assert all(result[k] is not None for k in ("video", "imagem", "texto"))
+        
+        with count_queries(test_db) as statements:
+            SchedulerService.get_active_content(test_db)
+            SchedulerService.get_region_content(test_db, 2)
+        assert statements == []
+    
+    def test_reference_resolver_single_query(self, test_db, busy_schedule):
+        """
+        Testa se a resolução direta no banco busca todas as regiões (e mídias) de uma vez
+        """
+        now = datetime.now()
+        with count_queries(test_db) as statements:
+            result = SchedulerService._get_content_for_regions(
+                test_db, [1, 2, 3, 4], now.date(), now.time(), (now.weekday() + 1) % 7
+            )
+        assert len(statements) == 1
+        assert result[3] is None
+        assert all(result[regiao] is not None for regiao in (1, 2, 4))
+
+
+class TestQueryPlan:
+    """
+    Garante que as consultas por região usam o índice composto em vez de
+    percorrer toda a tabela de agendamentos
+    """
+    
+    @pytest.fixture
+    def history(self, test_db, sample_video_media, sample_text_media):
+        today = date.today()
+        # Histórico de agendamentos encerrados, que cresce com o uso
+        for i in range(300):
+            test_db.add(Schedule(
+                media_id=sample_video_media.id,
+                data_inicio=today - timedelta(days=400 + i),
+                data_fim=today - timedelta(days=300 + i),
+                hora_inicio=time(0, 0, 0),
+                hora_fim=time(23, 59, 59),
+                prioridade=1 + i % 5,
+                regiao=1 + i % 4,
+                ativo=i % 7 != 0
+            ))
+        test_db.add(Schedule(
+            media_id=sample_text_media.id,
+            data_inicio=today,
+            data_fim=today,
+            hora_inicio=time(0, 0, 0),
+            hora_fim=time(23, 59, 59),
+            regiao=4,
+            ativo=True
+        ))
+        test_db.commit()
+        test_db.execute(text("ANALYZE"))
+        test_db.expire_all()
+    
+    @staticmethod
+    def query_plan(db, call) -> str:
+        """
+        Executa `call` e retorna o EXPLAIN QUERY PLAN da consulta à tabela schedule
+        """
+        engine = db.get_bind()
+        captured = []
+        
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if "FROM schedule" in statement:
+                captured.append((statement, parameters))
+        
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            call()
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        
+        statement, parameters = captured[0]
+        rows = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        return "\n".join(row[-1] for row in rows)
+    
+    def test_active_content_uses_composite_index(self, test_db, history):
+        """
+        Testa se o conteúdo ativo busca pelo índice (região, ativo, data_fim...)
+        """
+        now = datetime.now()
+        plan = self.query_plan(test_db, lambda: SchedulerService._get_content_for_regions(
+            test_db, [1, 2, 4], now.date(), now.time(), (now.weekday() + 1) % 7
+        ))
+        assert "SCAN schedule" not in plan
+        assert "ix_schedule_regiao_ativo_periodo" in plan
+    
+    def test_next_content_uses_composite_index(self, test_db, history):
+        """
+        Testa se a lista dos próximos conteúdos também usa o índice
+        """
+        plan = self.query_plan(test_db, lambda: SchedulerService.get_next_content(test_db, 4))
+        assert "SCAN schedule" not in plan
+        assert "ix_schedule_regiao_ativo_periodo" in plan
+
+
+class TestNextContent:
+    """
+    Testes das próximas ocorrências (get_next_content)
+    """
+    
+    def add_schedule(self, db, media, regiao, inicio, fim, hora_inicio, hora_fim, dias_semana="0,1,2,3,4,5,6", prioridade=1):
+        schedule = Schedule(
+            media_id=media.id, regiao=regiao,
+            data_inicio=inicio, data_fim=fim,
+            hora_inicio=hora_inicio, hora_fim=hora_fim,
+            dias_semana=dias_semana, prioridade=prioridade, ativo=True
+        )
+        db.add(schedule)
+        db.commit()
+        return schedule
+    
+    def test_occurrences_in_time_order(self, test_db, sample_video_media):
+        """
+        Testa se cada dia/horário vira uma ocorrência, intercalada por início
+        """
+        # 2026-03-02 é uma segunda-feira
+        manha = self.add_schedule(test_db, sample_video_media, 1, date(2026, 3, 1), date(2026, 3, 31), time(8, 0), time(12, 0), "1,3")
+        tarde = self.add_schedule(test_db, sample_video_media, 1, date(2026, 3, 1), date(2026, 3, 31), time(10, 0), time(18, 0), "1,2,3")
+        empate = self.add_schedule(test_db, sample_video_media, 1, date(2026, 3, 1), date(2026, 3, 31), time(10, 0), time(11, 0), "2", prioridade=2)
+        now = datetime(2026, 3, 2, 11, 0)
+        
+        schedules, next_cursor = SchedulerService.get_next_content(test_db, 1, 48, now=now)
+        
+        assert next_cursor is None
+        assert [(s["inicio"], s["schedule_id"]) for s in schedules] == [
+            ("2026-03-02T08:00:00", manha.id),
+            ("2026-03-02T10:00:00", tarde.id),
+            ("2026-03-03T10:00:00", tarde.id),
+            ("2026-03-03T10:00:00", empate.id),
+            ("2026-03-04T08:00:00", manha.id),
+            ("2026-03-04T10:00:00", tarde.id),
+        ]
+        assert schedules[0]["fim"] == "2026-03-02T12:00:00"
+        assert [s["em_exibicao"] for s in schedules[:3]] == [True, True, False]
+    
+    def test_pages_match_full_list(self, test_db, sample_video_media, sample_image_media):
+        """
+        Testa se as páginas, seguidas pelo cursor, reproduzem a lista completa
+        """
+        for i in range(6):
+            self.add_schedule(
+                test_db, sample_video_media, 1, date(2026, 3, 1), date(2026, 3, 10 + i),
+                time(i * 3, 0), time(i * 3 + 2, 0), prioridade=i % 2
+            )
+        # Mesmo horário e prioridade: o desempate é pelo id
+        for _ in range(3):
+            self.add_schedule(test_db, sample_video_media, 1, date(2026, 3, 1), date(2026, 3, 31), time(9, 0), time(9, 30))
+        outra_regiao = self.add_schedule(test_db, sample_image_media, 2, date(2026, 3, 1), date(2026, 3, 31), time(9, 0), time(9, 30))
+        now = datetime(2026, 3, 2, 9, 15)
+        
+        completa, _ = SchedulerService.get_next_content(test_db, 1, 24 * 14, now=now)
+        paginas, cursor = [], None
+        while True:
+            pagina, cursor = SchedulerService.get_next_content(test_db, 1, 24 * 14, now=now, limit=7, cursor=cursor)
+            assert len(pagina) <= 7
+            paginas.extend(pagina)
+            if cursor is None:
+                break
+        
+        assert len(completa) > 7
+        assert paginas == completa
+        assert all(s["schedule_id"] != outra_regiao.id for s in completa)
+        with pytest.raises(ValueError):
+            SchedulerService.get_next_content(test_db, 1, now=now, limit=7, cursor="invalido")
+    
+    def test_first_page_stops_early(self, test_db, sample_text_media, monkeypatch):
+        """
+        Testa se a primeira página de um horizonte longo não expande todas as ocorrências
+        """
+        import app.services.scheduler as scheduler
+        
+        test_db.add_all([
+            Schedule(
+                media_id=sample_text_media.id, regiao=4,
+                data_inicio=date(2026, 1, 1), data_fim=date(2026, 12, 31),
+                hora_inicio=time(i % 24, 0), hora_fim=time(i % 24, 30), ativo=True
+            )
+            for i in range(500)
+        ])
+        test_db.commit()
+        
+        dias_expandidos = []
+        original = scheduler.weekday_of
+        monkeypatch.setattr(scheduler, "weekday_of", lambda d: dias_expandidos.append(d) or original(d))
+        
+        schedules, next_cursor = SchedulerService.get_next_content(
+            test_db, 4, 24 * 366, now=datetime(2026, 1, 1, 0, 0), limit=10
+        )
+        
+        assert len(schedules) == 10 and next_cursor
+        # No máximo alguns dias por agendamento, em vez de 500 × 365
+        assert len(dias_expandidos) <= 500 * 3
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
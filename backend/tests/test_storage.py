@@ -0,0 +1,311 @@
+"""
+Testes da gravação de uploads em blocos e do armazenamento por conteúdo
+"""
+import hashlib
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from starlette.requests import Request
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import MediaBlob
+from app.services.storage import (
+    BlobStore, DiskUsage, InvalidUpload, StoredFile, UploadTooLarge, disk_usage, receive_form
+)
+
+
+def multipart_request(data, campos=None, chunk=64 * 1024, content_length=True, lidos=None):
+    """
+    Requisição multipart (arquivo primeiro, como o frontend envia) entregue
+    em vários blocos pelo receive do ASGI
+    """
+    boundary = "limite123"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"video.mp4\"\r\n"
+        f"Content-Type: video/mp4\r\n\r\n"
+    ).encode() + data + b"\r\n"
+    for nome, valor in (campos or {}).items():
+        body += f"--{boundary}\r\nContent-Disposition: form-data; name=\"{nome}\"\r\n\r\n{valor}\r\n".encode()
+    body += f"--{boundary}--\r\n".encode()
+    blocos = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+    
+    async def receive():
+        if lidos is not None:
+            lidos.append(1)
+        bloco = blocos.pop(0)
+        return {"type": "http.request", "body": bloco, "more_body": bool(blocos)}
+    
+    headers = [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+@pytest.mark.asyncio
+async def test_receive_form_streams_file_into_incoming(tmp_path):
+    """
+    Testa se o arquivo do formulário é gravado direto no diretório de
+    entrada (um único temporário), com SHA-256, tamanho e campos corretos
+    """
+    data = os.urandom(3 * 1024 * 1024 + 123)
+    request = multipart_request(data, {"tipo": "video", "nome": "Promoção"})
+    
+    recebido = await receive_form(request, str(tmp_path), chunk_size=256 * 1024)
+    
+    assert recebido.campos == {"tipo": "video", "nome": "Promoção"}
+    assert recebido.nome_arquivo == "video.mp4"
+    assert recebido.arquivo.sha256 == hashlib.sha256(data).hexdigest()
+    assert recebido.arquivo.tamanho == len(data)
+    assert open(recebido.arquivo.caminho, "rb").read() == data
+    assert os.listdir(tmp_path) == [os.path.basename(recebido.arquivo.caminho)]
+
+
+@pytest.mark.asyncio
+async def test_receive_form_rejects_content_length_before_reading(tmp_path):
+    """
+    Testa se um Content-Length acima do limite é recusado sem ler o corpo
+    """
+    lidos = []
+    request = multipart_request(b"x" * (2 * 1024 * 1024), {"tipo": "video"}, lidos=lidos)
+    
+    with pytest.raises(UploadTooLarge):
+        await receive_form(request, str(tmp_path), max_size=1024)
+    
+    assert lidos == []
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_receive_form_enforces_max_size_while_streaming(tmp_path):
+    """
+    Testa se, sem Content-Length, o envio é interrompido ao passar do
+    limite, sem ler o resto do corpo e sem deixar arquivos
+    """
+    lidos = []
+    request = multipart_request(b"x" * 50000, {"tipo": "video"}, chunk=1024, content_length=False, lidos=lidos)
+    
+    with pytest.raises(UploadTooLarge):
+        await receive_form(request, str(tmp_path), max_size=4096, chunk_size=1024)
+    
+    assert len(lidos) < 10
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_receive_form_rejects_invalid_body(tmp_path):
+    """
+    Testa se corpo que não é multipart ou sem arquivo gera InvalidUpload
+    """
+    async def receive():
+        return {"type": "http.request", "body": b"tipo=video", "more_body": False}
+    
+    request = Request({"type": "http", "method": "POST", "headers": [
+        (b"content-type", b"application/x-www-form-urlencoded")
+    ]}, receive)
+    with pytest.raises(InvalidUpload):
+        await receive_form(request, str(tmp_path))
+    
+    boundary = "limite123"
+    body = f"--{boundary}\r\nContent-Disposition: form-data; name=\"tipo\"\r\n\r\nvideo\r\n--{boundary}--\r\n".encode()
+    
+    async def receive_sem_arquivo():
+        return {"type": "http.request", "body": body, "more_body": False}
+    
+    request = Request({"type": "http", "method": "POST", "headers": [
+        (b"content-type", f"multipart/form-data; boundary={boundary}".encode())
+    ]}, receive_sem_arquivo)
+    with pytest.raises(InvalidUpload):
+        await receive_form(request, str(tmp_path))
+    
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.fixture
+def db_session():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.database import Base
+    
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.mark.asyncio
+async def test_blob_store_dedups_identical_uploads(tmp_path, db_session):
+    """
+    Testa se o mesmo conteúdo enviado duas vezes ocupa um único arquivo
+    """
+    store = BlobStore(str(tmp_path))
+    data = os.urandom(200 * 1024)
+    
+    primeiro = store.register(db_session, (await store.receive(multipart_request(data))).arquivo, ".jpg")
+    db_session.commit()
+    segundo = store.register(db_session, (await store.receive(multipart_request(data))).arquivo, ".jpg")
+    db_session.commit()
+    
+    sha = hashlib.sha256(data).hexdigest()
+    assert primeiro is segundo
+    assert segundo.ref_count == 2
+    assert segundo.caminho == store.blob_path(sha, ".jpg")
+    assert open(segundo.caminho, "rb").read() == data
+    assert os.listdir(store.incoming_dir) == []
+    assert db_session.query(MediaBlob).count() == 1
+
+
+@pytest.mark.asyncio
+async def test_blob_store_release_deletes_only_last_reference(tmp_path, db_session):
+    """
+    Testa se o arquivo só é liberado para remoção na última referência
+    """
+    store = BlobStore(str(tmp_path))
+    data = b"conteudo" * 1000
+    for _ in range(2):
+        recebido = await store.receive(multipart_request(data))
+        blob = store.register(db_session, recebido.arquivo, ".png")
+        db_session.commit()
+    sha, caminho = blob.sha256, blob.caminho
+    
+    assert store.release(db_session, sha, caminho) is None
+    db_session.commit()
+    assert db_session.get(MediaBlob, sha).ref_count == 1
+    
+    assert store.release(db_session, sha, caminho) == caminho
+    db_session.commit()
+    assert db_session.get(MediaBlob, sha) is None
+    
+    # Mídia antiga (sem hash) continua apagando o próprio arquivo
+    assert store.release(db_session, None, "uploads/antigo.mp4") == "uploads/antigo.mp4"
+
+
+@pytest.mark.asyncio
+async def test_disk_usage_counter_follows_uploads(tmp_path, db_session):
+    """
+    Testa se o contador de espaço é criado percorrendo o diretório uma vez e
+    depois acompanha os uploads sem percorrê-lo de novo
+    """
+    (tmp_path / "antigo.mp4").write_bytes(b"x" * 1000)
+    os.makedirs(tmp_path / "objects" / "incoming")
+    (tmp_path / "objects" / "incoming" / "envio.part").write_bytes(b"y" * 500)
+    usage = DiskUsage(str(tmp_path))
+    assert usage.get(db_session) == {"bytes": 1000, "arquivos": 1}
+    
+    store = BlobStore(str(tmp_path))
+    data = os.urandom(4096)
+    for _ in range(2):  # o segundo é o mesmo conteúdo: não ocupa espaço
+        recebido = await store.receive(multipart_request(data))
+        store.register(db_session, recebido.arquivo, ".jpg")
+        db_session.commit()
+    assert usage.get(db_session) == {"bytes": 1000 + 4096, "arquivos": 2}
+    
+    disk_usage.add(db_session, -4096, -1)
+    db_session.commit()
+    assert usage.get(db_session) == {"bytes": 1000, "arquivos": 1}
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """
+    Banco em arquivo com o perfil do app (WAL e busy_timeout), para sessões concorrentes
+    """
+    from sqlalchemy import create_engine, event
+    from app.database import Base, apply_sqlite_pragmas
+    
+    engine = create_engine(f"sqlite:///{tmp_path / 'mediaplayer.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def stored_file(store: BlobStore, data: bytes) -> StoredFile:
+    """
+    Upload já recebido em objects/incoming
+    """
+    os.makedirs(store.incoming_dir, exist_ok=True)
+    caminho = os.path.join(store.incoming_dir, f"{time.perf_counter_ns()}.part")
+    with open(caminho, "wb") as out:
+        out.write(data)
+    return StoredFile(caminho=caminho, sha256=hashlib.sha256(data).hexdigest(), tamanho=len(data))
+
+
+def test_concurrent_identical_uploads_share_blob(tmp_path, file_engine):
+    """
+    Testa se dois registros simultâneos do mesmo conteúdo somam no mesmo
+    blob (sem IntegrityError), com um único arquivo contado uma vez
+    """
+    from sqlalchemy.orm import sessionmaker
+    
+    root = str(tmp_path / "uploads")
+    store = BlobStore(root)
+    Sessao = sessionmaker(bind=file_engine)
+    primeira, segunda = Sessao(), Sessao()
+    usage = DiskUsage(root)
+    usage.get(primeira)
+    data = os.urandom(8192)
+    recebidos = [stored_file(store, data), stored_file(store, data)]
+    
+    store.register(primeira, recebidos[0], ".mp4")
+    
+    def registrar():
+        store.register(segunda, recebidos[1], ".mp4")
+        segunda.commit()
+    
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        futuro = pool.submit(registrar)
+        time.sleep(0.2)
+        assert not futuro.done()  # espera o commit do primeiro registro
+        primeira.commit()
+        futuro.result(timeout=5)
+    
+    blob = primeira.get(MediaBlob, hashlib.sha256(data).hexdigest(), populate_existing=True)
+    assert blob.ref_count == 2
+    assert open(blob.caminho, "rb").read() == data
+    assert os.listdir(store.incoming_dir) == []
+    assert usage.get(primeira) == {"bytes": 8192, "arquivos": 1}
+    primeira.close()
+    segunda.close()
+
+
+def test_released_file_kept_when_registered_again(tmp_path, file_engine):
+    """
+    Testa se o arquivo solto por release não é apagado quando o mesmo
+    conteúdo é registrado de novo antes da remoção
+    """
+    from sqlalchemy.orm import sessionmaker
+    
+    root = str(tmp_path / "uploads")
+    store = BlobStore(root)
+    Sessao = sessionmaker(bind=file_engine)
+    db = Sessao()
+    usage = DiskUsage(root)
+    usage.get(db)
+    data = os.urandom(4096)
+    blob = store.register(db, stored_file(store, data), ".png")
+    db.commit()
+    sha, caminho = blob.sha256, blob.caminho
+    
+    assert store.release(db, sha, caminho) == caminho
+    db.commit()
+    # O mesmo conteúdo chega antes de o arquivo ser apagado
+    store.register(db, stored_file(store, data), ".png")
+    db.commit()
+    with Sessao() as remocao:
+        store.remove_released(remocao, caminho, [])
+    assert open(caminho, "rb").read() == data
+    assert usage.get(db) == {"bytes": 4096, "arquivos": 1}
+    
+    # Sem novo registro, o arquivo é apagado e descontado
+    assert store.release(db, sha, caminho) == caminho
+    db.commit()
+    with Sessao() as remocao:
+        store.remove_released(remocao, caminho, [])
+    assert not os.path.exists(caminho)
+    assert usage.get(db) == {"bytes": 0, "arquivos": 0}
+    db.close()
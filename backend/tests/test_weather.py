@@ -0,0 +1,280 @@
+"""
+Testes do serviço de clima (cache em memória e no banco)
+"""
+import asyncio
+import json
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import Base, DbSession
+from app.models import WeatherCache
+from app.services.refresher import BackgroundRefresher, create_http_client
+from app.services.weather import WeatherService
+
+
+@pytest.fixture
+def test_db():
+    """
+    Cria um banco de dados em memória para cada teste
+    """
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _weather(temperatura: int) -> dict:
+    return {
+        "temperatura": temperatura,
+        "condicao": "Céu limpo",
+        "icone": "01d",
+        "cidade": "Aparecida de Goiânia",
+        "dados_completos": {"name": "Aparecida de Goiânia", "main": {"temp": temperatura}}
+    }
+
+
+def test_save_to_cache_keeps_one_row_per_city(test_db):
+    """
+    Testa se cada atualização sobrescreve a linha da cidade em vez de inserir outra
+    """
+    service = WeatherService()
+    for temperatura in (20, 21, 22):
+        service._save_to_cache(test_db, _weather(temperatura))
+    
+    assert test_db.query(WeatherCache).count() == 1
+    cached = service._get_from_cache(test_db)
+    assert cached["temperatura"] == 22
+    assert cached["cidade"] == "Aparecida de Goiânia"
+    assert cached["cached"] is True
+
+
+def test_expired_cache_is_ignored(test_db):
+    """
+    Testa se a linha mais antiga que o intervalo de atualização não é usada
+    """
+    service = WeatherService()
+    service._save_to_cache(test_db, _weather(20))
+    test_db.query(WeatherCache).update({
+        WeatherCache.data_cache: datetime.utcnow() - timedelta(seconds=service.update_interval + 1)
+    })
+    test_db.commit()
+    
+    assert service._get_from_cache(test_db) is None
+
+
+class FakeWeatherServer:
+    """
+    Servidor HTTP local no lugar do OpenWeatherMap, contando as chamadas
+    """
+    
+    def __init__(self, delay: float = 0.2):
+        self.calls = 0
+        self.status = 200
+        self.temperatura = 25
+        self.delay = delay
+        self.connections = set()
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            
+            def do_GET(self):
+                fake.calls += 1
+                fake.connections.add(self.client_address)
+                time.sleep(fake.delay)
+                body = json.dumps({
+                    "name": "Aparecida de Goiânia",
+                    "main": {"temp": fake.temperatura},
+                    "weather": [{"description": "céu limpo", "icon": "01d"}]
+                }).encode("utf-8")
+                self.send_response(fake.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/weather"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_server(request):
+    server = FakeWeatherServer(**getattr(request, "param", {}))
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def file_session(tmp_path):
+    """
+    Sessão em banco de arquivo (a gravação em segundo plano usa outra conexão)
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'clima.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def _service(fake_server) -> WeatherService:
+    service = WeatherService()
+    service.api_key = "teste"
+    service.base_url = fake_server.url
+    return service
+
+
+def test_concurrent_misses_fetch_once(fake_server, file_session):
+    """
+    Testa se uma rajada de requisições sem cache gera uma única chamada à API
+    """
+    service = _service(fake_server)
+    
+    async def burst():
+        return await asyncio.gather(*[service.get_weather(DbSession(file_session)) for _ in range(50)])
+    
+    results = asyncio.run(burst())
+    assert fake_server.calls == 1
+    assert {r["temperatura"] for r in results} == {25}
+    
+    # A busca também foi gravada no banco (fallback após reiniciar)
+    assert file_session.query(WeatherCache).one().temperatura == 25
+
+
+def test_stale_served_while_revalidating(fake_server, file_session):
+    """
+    Testa se, com o cache vencido, os dados antigos são servidos na hora e uma
+    única atualização roda em segundo plano
+    """
+    service = _service(fake_server)
+    
+    async def scenario():
+        db = DbSession(file_session)
+        await service.get_weather(db)
+        fake_server.temperatura = 30
+        service._memory_at -= service.update_interval  # vence o cache
+        
+        inicio = time.perf_counter()
+        stale = await asyncio.gather(*[service.get_weather(db) for _ in range(50)])
+        elapsed = time.perf_counter() - inicio
+        await service._refresh_task
+        return stale, elapsed, await service.get_weather(db)
+    
+    stale, elapsed, fresh = asyncio.run(scenario())
+    assert {r["temperatura"] for r in stale} == {25}
+    assert elapsed < fake_server.delay  # ninguém esperou a API
+    assert fake_server.calls == 2
+    assert fresh["temperatura"] == 30
+
+
+def test_database_used_after_restart(fake_server, file_session):
+    """
+    Testa se um processo novo usa a linha do banco em vez de chamar a API
+    """
+    _service(fake_server)._save_to_cache(file_session, _weather(22))
+    service = _service(fake_server)
+    
+    async def scenario():
+        db = DbSession(file_session)
+        return [await service.get_weather(db) for _ in range(3)]
+    
+    results = asyncio.run(scenario())
+    assert [r["temperatura"] for r in results] == [22, 22, 22]
+    assert fake_server.calls == 0
+
+
+@pytest.mark.parametrize("fake_server", [{"delay": 0}], indirect=True)
+def test_shared_client_reuses_connection(fake_server, file_session):
+    """
+    Testa se as buscas pelo cliente compartilhado reaproveitam a mesma conexão
+    """
+    service = _service(fake_server)
+    bind = file_session.get_bind()
+    
+    async def scenario():
+        service.client = create_http_client()
+        try:
+            return [await service.refresh(bind) for _ in range(3)]
+        finally:
+            await service.client.aclose()
+    
+    assert asyncio.run(scenario()) == [True, True, True]
+    assert fake_server.calls == 3
+    assert len(fake_server.connections) == 1
+
+
+@pytest.mark.parametrize("fake_server", [{"delay": 0}], indirect=True)
+def test_refresher_keeps_weather_warm(fake_server, file_session):
+    """
+    Testa se a atualização em segundo plano renova o clima antes de vencer,
+    sem nenhuma requisição esperar pela API
+    """
+    service = _service(fake_server)
+    service.update_interval = 1
+    refresher = BackgroundRefresher(ahead=0.5, jitter=0)
+    refresher.add("clima", lambda: service.refresh(file_session.get_bind()), service.update_interval)
+    
+    async def scenario():
+        refresher.start()
+        while service._memory is None:
+            await asyncio.sleep(0.01)
+        results = []
+        for _ in range(10):
+            results.append(await service.get_weather(DbSession(file_session)))
+            await asyncio.sleep(0.2)
+        await refresher.stop()
+        return results
+    
+    results = asyncio.run(scenario())
+    assert all(r["cached"] and r["cache_age"] < service.update_interval for r in results)
+    assert 4 <= fake_server.calls <= 6  # a cada ~0,5 s, só pelo refresher
+
+
+def test_refresher_backs_off_after_failures():
+    """
+    Testa se, com a fonte falhando, as novas tentativas ficam cada vez mais espaçadas
+    """
+    attempts = []
+    
+    async def failing_refresh():
+        attempts.append(time.monotonic())
+        raise RuntimeError("API fora do ar")
+    
+    refresher = BackgroundRefresher(jitter=0, backoff=0.05, backoff_max=10)
+    refresher.add("clima", failing_refresh, 60)
+    
+    async def scenario():
+        refresher.start()
+        await asyncio.sleep(0.5)
+        await refresher.stop()
+    
+    asyncio.run(scenario())
+    gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+    # Esperas de 0,05; 0,1; 0,2 s (a próxima, 0,4 s, passa do fim do teste)
+    assert len(attempts) == 4
+    assert all(gap >= expected for gap, expected in zip(gaps, (0.05, 0.1, 0.2)))
+    assert refresher.next_delay(60, 20) == 10  # limitado por backoff_max
+    assert refresher.next_delay(1, 20) == 1  # e nunca maior que o intervalo
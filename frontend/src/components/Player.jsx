@@ -73,6 +73,25 @@ export default function Player() {
     fetchText();
   }, [refreshTextKey]);
 
+  // Push do servidor: troca o conteúdo assim que a rotação muda ou o admin edita
+  useEffect(() => {
+    const setters = { 1: setVerticalContent, 2: setHorizontalContent, 4: setTextContent };
+    const source = api.openContentStream();
+
+    source.addEventListener('content', (event) => {
+      const { regiao, content } = JSON.parse(event.data);
+      console.log(`📡 Player: Push recebido para região ${regiao}:`, content);
+      // Mantém o objeto anterior se nada mudou, para não reiniciar a mídia em exibição
+      setters[regiao]?.(prev => (JSON.stringify(prev) === JSON.stringify(content) ? prev : content));
+    });
+    source.onerror = () => {
+      // O EventSource reconecta sozinho; o polling abaixo cobre o intervalo
+      console.warn('⚠️ Player: Stream de conteúdo interrompido, reconectando...');
+    };
+
+    return () => source.close();
+  }, []);
+
   // Efeito de polling para regiões vazias ou verificação periódica
   useEffect(() => {
     const checkStatus = () => {
@@ -127,7 +127,7 @@ export default function UniversalRegion({ content, onComplete, regionName = "Mí
                 isVideo ? (
                     <video
                         key={`bg-vid-${content.id}`}
-                        src={`/${content.caminho_arquivo}`}
+                        src={content.url || `/${content.caminho_arquivo}`}
                         className={`universal-background ${isLoaded ? 'loaded' : ''}`}
                         muted
                         loop
@@ -136,7 +136,7 @@ export default function UniversalRegion({ content, onComplete, regionName = "Mí
                 ) : (
                     <img
                         key={`bg-img-${content.id}`}
-                        src={`/${content.caminho_arquivo}`}
+                        src={content.url || `/${content.caminho_arquivo}`}
                         alt=""
                         className={`universal-background ${isLoaded ? 'loaded' : ''}`}
                     />
@@ -148,7 +148,7 @@ export default function UniversalRegion({ content, onComplete, regionName = "Mí
                 {isVideo ? (
                     <video
                         key={`fg-vid-${content.id}`}
-                        src={`/${content.caminho_arquivo}`}
+                        src={content.url || `/${content.caminho_arquivo}`}
                         className={`universal-media ${isLoaded ? 'loaded' : ''}`}
                         autoPlay
                         muted
@@ -171,7 +171,7 @@ export default function UniversalRegion({ content, onComplete, regionName = "Mí
                 ) : (
                     <img
                         key={`fg-img-${content.id}`}
-                        src={`/${content.caminho_arquivo}`}
+                        src={content.url || `/${content.caminho_arquivo}`}
                         alt={content.nome}
                         className={`universal-media ${isLoaded ? 'loaded' : ''}`}
                         onLoad={() => setIsLoaded(true)}
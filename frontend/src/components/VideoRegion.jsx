@@ -91,7 +91,7 @@ export default function VideoRegion({ content, onVideoEnd }) {
         isVideo ? (
           <video
             key={`bg-vid-${content.id}`}
-            src={`/${content.caminho_arquivo}`}
+            src={content.url || `/${content.caminho_arquivo}`}
             className={`photo-background ${imageLoaded ? 'loaded' : ''}`}
             muted
             loop
@@ -100,7 +100,7 @@ export default function VideoRegion({ content, onVideoEnd }) {
         ) : (
           <img
             key={`bg-img-${content.id}`}
-            src={`/${content.caminho_arquivo}`}
+            src={content.url || `/${content.caminho_arquivo}`}
             alt=""
             className={`photo-background ${imageLoaded ? 'loaded' : ''}`}
           />
@@ -112,7 +112,7 @@ export default function VideoRegion({ content, onVideoEnd }) {
         {isVideo ? (
           <video
             key={`fg-vid-${content.id}`}
-            src={`/${content.caminho_arquivo}`}
+            src={content.url || `/${content.caminho_arquivo}`}
             className={`photo-image ${imageLoaded ? 'loaded' : ''}`}
             autoPlay
             muted
@@ -134,7 +134,7 @@ export default function VideoRegion({ content, onVideoEnd }) {
         ) : (
           <img
             key={`fg-img-${content.id}`}
-            src={`/${content.caminho_arquivo}`}
+            src={content.url || `/${content.caminho_arquivo}`}
             alt={content.nome}
             className={`photo-image ${imageLoaded ? 'loaded' : ''}`}
             onLoad={() => setImageLoaded(true)}
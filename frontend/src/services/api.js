@@ -2,18 +2,24 @@ const API_BASE = '/api';
 
 export const api = {
   // Player endpoints
+  // cache: 'no-cache' revalida com If-None-Match; respostas 304 reaproveitam o corpo em cache
   async getActiveContent() {
-    const response = await fetch(`${API_BASE}/player/active-content`);
+    const response = await fetch(`${API_BASE}/player/active-content`, { cache: 'no-cache' });
     return response.json();
   },
 
   async getActiveContentByRegion(regiao) {
-    const response = await fetch(`${API_BASE}/player/active-content/region/${regiao}`);
+    const response = await fetch(`${API_BASE}/player/active-content/region/${regiao}`, { cache: 'no-cache' });
     return response.json();
   },
 
+  // Stream SSE com o conteúdo de cada região (push do servidor)
+  openContentStream() {
+    return new EventSource(`${API_BASE}/player/stream`);
+  },
+
   async getWeather() {
-    const response = await fetch(`${API_BASE}/player/weather`);
+    const response = await fetch(`${API_BASE}/player/weather`, { cache: 'no-cache' });
     return response.json();
   },
 
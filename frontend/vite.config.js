@@ -14,6 +14,10 @@ export default defineConfig({
       '/uploads': {
         target: 'http://127.0.0.1:8000',
         changeOrigin: true
+      },
+      '/media': {
+        target: 'http://127.0.0.1:8000',
+        changeOrigin: true
       }
     }
   },